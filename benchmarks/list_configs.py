@@ -0,0 +1,85 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""
+Cold cache configuration reads on a simulated 2000 jail tree, serially and
+with the IOCList readers, plus how soon list_iter_configs() yields its
+first row. Each config.json read costs READ_COST, like one from its own
+dataset.
+
+    python benchmarks/list_configs.py
+"""
+import time
+
+import mock
+
+import iocage.lib.ioc_json as ioc_json
+import iocage.lib.ioc_list as ioc_list
+
+# A cold read of a config.json on its own dataset.
+READ_COST = 0.0005
+JAILS = 2000
+WORKERS = 16
+
+
+def fake_load(self):
+    time.sleep(READ_COST)
+
+    return {"host_hostuuid": self.location.rsplit("/", 1)[-1]}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def main():
+    paths = [f"/iocage/jails/jail{i:04d}" for i in range(JAILS)]
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', fake_load), \
+        mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                          lambda: ("tank", "/iocage")), \
+        mock.patch.object(ioc_list.iocage.lib.ioc_zfs, 'get_zfs',
+                          mock.Mock()):
+        serial, serial_time = timed(
+            ioc_list.IOCList(workers=1).list_load_configs, paths)
+        parallel, parallel_time = timed(
+            ioc_list.IOCList(workers=WORKERS).list_load_configs, paths)
+
+        configs = ioc_list.IOCList(workers=WORKERS).list_iter_configs(paths)
+        _, first_time = timed(next, configs)
+        _, rest_time = timed(list, configs)
+
+    assert list(parallel.items()) == list(serial.items())
+
+    print(f"{JAILS} configs: {serial_time:.3f}s serially,"
+          f" {parallel_time:.3f}s with {WORKERS} workers"
+          f" ({serial_time / parallel_time:.1f}x)")
+    print(f"first streamed row after {first_time:.4f}s,"
+          f" the rest after another {rest_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""
+Opening a libzfs handle per object, as iocage used to, against the shared
+handle get_zfs() hands out, with a fake libzfs whose handles cost
+HANDLE_COST to open.
+
+    python benchmarks/zfs_handles.py
+"""
+import time
+
+import mock
+
+import iocage.lib.ioc_zfs as ioc_zfs
+
+# Roughly what opening a libzfs handle costs on a host with a few pools.
+HANDLE_COST = 0.002
+JAILS = 200
+
+
+class FakeZFS(object):
+    def __init__(self, history=True, history_prefix=None):
+        self.history = history
+        time.sleep(HANDLE_COST)
+
+
+def main():
+    ioc_zfs.reset()
+
+    with mock.patch.object(ioc_zfs.libzfs, 'ZFS', FakeZFS):
+        start = time.perf_counter()
+
+        for _ in range(JAILS):
+            FakeZFS(history=True, history_prefix="<iocage>")
+
+        per_object = time.perf_counter() - start
+
+        start = time.perf_counter()
+        handles = {id(ioc_zfs.get_zfs()) for _ in range(JAILS)}
+        shared = time.perf_counter() - start
+
+    assert len(handles) == 1
+
+    print(f"{JAILS} lookups: {per_object:.3f}s with a handle per object,"
+          f" {shared:.3f}s with the shared handle"
+          f" ({per_object / shared:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
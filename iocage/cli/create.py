@@ -66,9 +66,15 @@ def validate_count(ctx, param, value):
 @click.option("--short", "-s", is_flag=True, default=False,
               help="Use a short UUID of 8 characters instead of the default "
                    "36")
+@click.option("--ip4-pool", default=None,
+              help="Give each jail the next free address of this"
+                   " INTERFACE|NETWORK, e.g. vnet0|10.0.0.0/24")
+@click.option("--ip6-pool", default=None,
+              help="Give each jail the next free address of this"
+                   " INTERFACE|NETWORK, e.g. vnet0|fd00::/64")
 @click.argument("props", nargs=-1)
 def cli(release, template, count, props, pkglist, basejail, empty, short,
-        name, _uuid):
+        name, _uuid, ip4_pool, ip6_pool):
     if name:
         _props = []
         if f"tag={name}" not in props:
@@ -146,7 +152,8 @@ def cli(release, template, count, props, pkglist, basejail, empty, short,
         err, msg = iocage.create(release, props, pkglist=pkglist,
                                  template=template, short=short,
                                  uuid=_uuid, basejail=basejail,
-                                 empty=empty)
+                                 empty=empty, ip4_pool=ip4_pool,
+                                 ip6_pool=ip6_pool)
         if err:
             ioc_common.logit({
                 "level"  : "ERROR",
@@ -165,6 +172,13 @@ def cli(release, template, count, props, pkglist, basejail, empty, short,
                         "message": f"  {temp[3]}"
                     })
     else:
-        iocage.create(release, props, count, pkglist=pkglist,
-                      template=template, short=short, uuid=_uuid,
-                      basejail=basejail, empty=empty)
+        err, msg = iocage.create(release, props, count, pkglist=pkglist,
+                                 template=template, short=short, uuid=_uuid,
+                                 basejail=basejail, empty=empty,
+                                 ip4_pool=ip4_pool, ip6_pool=ip6_pool)
+
+        if err:
+            ioc_common.logit({
+                "level"  : "ERROR",
+                "message": msg
+            })
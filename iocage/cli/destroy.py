@@ -25,6 +25,7 @@
 import click
 
 import iocage.lib.ioc_common as ioc_common
+import iocage.lib.ioc_list as ioc_list
 import iocage.lib.iocage as ioc
 
 __rootcmd__ = True
@@ -85,9 +86,10 @@ def cli(force, release, download, jails):
                     "message": err
                 })
 
+        index = ioc_list.IOCJailIndex(jail_list)
+
         for jail in jails:
-            _jail = {tag: uuid for (tag, uuid) in jail_list.items() if
-                     uuid.startswith(jail) or tag == jail}
+            _jail = index.match(jail)
 
             if len(_jail) == 1:
                 tag, uuid = next(iter(_jail.items()))
@@ -27,6 +27,8 @@ import click
 import texttable
 
 import iocage.lib.ioc_common as ioc_common
+import iocage.lib.ioc_daemon as ioc_daemon
+import iocage.lib.ioc_list as ioc_list
 import iocage.lib.iocage as ioc
 
 
@@ -37,10 +39,18 @@ import iocage.lib.iocage as ioc
               help="Show the full uuid.")
 @click.option("--sort", "-s", "_sort", default="tag", nargs=1,
               help="Sorts the list by the given type")
-def cli(header, _long, _sort):
+@click.option("--filter", "-f", "filters", multiple=True,
+              help="Only show jails matching KEY=VALUE, e.g. state=up or"
+                   " tag='web*'. Can be given more than once.")
+def cli(header, _long, _sort, filters):
     """Allows a user to show resource usage of all jails."""
     table = texttable.Texttable(max_width=0)
-    jail_list = ioc.IOCage().df(long=_long)
+    filters = ioc_list.parse_filters(filters)
+    served, jail_list = ioc_daemon.daemon_call("df", long=_long,
+                                               filters=filters)
+
+    if not served:
+        jail_list = ioc.IOCage().df(long=_long, filters=filters)
 
     sort = ioc_common.ioc_sort("df", _sort)
     jail_list.sort(key=sort)
@@ -26,9 +26,19 @@ import click
 import texttable
 
 import iocage.lib.ioc_common as ioc_common
+import iocage.lib.ioc_daemon as ioc_daemon
+import iocage.lib.ioc_list as ioc_list
 import iocage.lib.iocage as ioc
 
 
+def get(prop, jail=None, **kwargs):
+    """Asks iocaged for the property, or gets it ourselves."""
+    served, value = ioc_daemon.daemon_call("get", prop=prop, jail=jail,
+                                           **kwargs)
+
+    return value if served else ioc.IOCage(jail).get(prop, **kwargs)
+
+
 @click.command(context_settings=dict(
     max_content_width=400, ), name="get", help="Gets the specified property.")
 @click.argument("prop", required=True, default="")
@@ -46,7 +56,11 @@ import iocage.lib.iocage as ioc
                                           "specified jail.", is_flag=True)
 @click.option("--pool", "-p", "_pool", help="Get the currently activated "
                                             "zpool.", is_flag=True)
-def cli(prop, _all, _pool, jail, recursive, header, plugin):
+@click.option("--filter", "-f", "filters", multiple=True,
+              help="With --recursive, only get the property of jails matching"
+                   " KEY=VALUE, e.g. state=up or tag='web*'. Can be given"
+                   " more than once.")
+def cli(prop, _all, _pool, jail, recursive, header, plugin, filters):
     """Get a list of jails and print the property."""
     table = texttable.Texttable(max_width=0)
 
@@ -57,21 +71,21 @@ def cli(prop, _all, _pool, jail, recursive, header, plugin):
 
     if not recursive:
         if prop == "state":
-            state = ioc.IOCage(jail).get(prop)
+            state = get(prop, jail)
 
             ioc_common.logit({
                 "level"  : "INFO",
                 "message": state
             })
         elif plugin:
-            _plugin = ioc.IOCage(jail).get(prop, plugin=True)
+            _plugin = get(prop, jail, plugin=True)
 
             ioc_common.logit({
                 "level"  : "INFO",
                 "message": _plugin
             })
         elif prop == "all":
-            props = ioc.IOCage(jail).get(prop)
+            props = get(prop, jail)
 
             for p, v in props.items():
                 ioc_common.logit({
@@ -79,7 +93,7 @@ def cli(prop, _all, _pool, jail, recursive, header, plugin):
                     "message": f"{p}:{v}"
                 })
         elif prop == "fstab":
-            fstab_list = ioc.IOCage(jail).get(prop)
+            fstab_list = get(prop, jail)
 
             if header:
                 fstab_list.insert(0, ["INDEX", "FSTAB ENTRY"])
@@ -97,14 +111,15 @@ def cli(prop, _all, _pool, jail, recursive, header, plugin):
                         "message": f"{fstab[0]}\t{fstab[1]}"
                     })
         else:
-            p = ioc.IOCage(jail).get(prop)
+            p = get(prop, jail)
 
             ioc_common.logit({
                 "level"  : "INFO",
                 "message": p
             })
     else:
-        jail_list = ioc.IOCage().get(prop, recursive=True)
+        jail_list = get(prop, recursive=True,
+                        filters=ioc_list.parse_filters(filters))
 
         # Prints the table
         if header:
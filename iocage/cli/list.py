@@ -22,10 +22,15 @@
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """list module for the cli."""
+import json
+
 import click
 
 import iocage.lib.ioc_common as ioc_common
+import iocage.lib.ioc_daemon as ioc_daemon
 import iocage.lib.ioc_fetch as ioc_fetch
+import iocage.lib.ioc_host as ioc_host
+import iocage.lib.ioc_list as ioc_list
 import iocage.lib.iocage as ioc
 
 
@@ -44,16 +49,34 @@ import iocage.lib.iocage as ioc
 @click.option("--plugins", "-P", is_flag=True, help="Show available plugins.")
 @click.option("--http", default=False,
               help="Have --remote use HTTP instead.", is_flag=True)
-@click.option("--sort", "-s", "_sort", default="tag", nargs=1,
-              help="Sorts the list by the given type")
-def cli(dataset_type, header, _long, remote, http, plugins, _sort):
+@click.option("--sort", "-s", "_sort", default=None, nargs=1,
+              help="Sorts the list by the given type, tag by default unless"
+                   " streaming.")
+@click.option("--stream", is_flag=True, default=False,
+              help="Print each jail as soon as it is inspected, tab"
+                   " separated.")
+@click.option("--jsonl", is_flag=True, default=False,
+              help="Print each jail as a JSON object on its own line.")
+@click.option("--filter", "-f", "filters", multiple=True,
+              help="Only list jails matching KEY=VALUE, e.g. state=up or"
+                   " tag='web*'. Can be given more than once.")
+def cli(dataset_type, header, _long, remote, http, plugins, _sort, stream,
+        jsonl, filters):
     """This passes the arg and calls the jail_datasets function."""
-    freebsd_version = ioc_common.checkoutput(["freebsd-version"])
-    iocage = ioc.IOCage(skip_jails=True)
+    freebsd_version = ioc_host.get_host_fact("freebsd_version")
 
     if dataset_type is None:
         dataset_type = "all"
 
+    if _sort is None and not stream:
+        _sort = "tag"
+
+    filters = ioc_list.parse_filters(filters)
+
+    if remote or stream:
+        # iocaged can't answer these.
+        ioc_daemon.local_check()
+
     if remote and not plugins:
         if "HBSD" in freebsd_version:
             hardened = True
@@ -67,8 +90,45 @@ def cli(dataset_type, header, _long, remote, http, plugins, _sort):
         _list = ioc_fetch.IOCFetch("").fetch_plugin_index("", _list=True,
                                                           list_header=header,
                                                           list_long=_long)
+    elif stream or jsonl:
+        keys = ioc_list.LIST_FULL_HEADER if _long or plugins else \
+            ioc_list.LIST_SHORT_HEADER
+
+        if header and not jsonl:
+            ioc_common.logit({
+                "level"  : "INFO",
+                "message": "\t".join(keys)
+            })
+
+        keys = [k.lower() for k in keys]
+        served = False
+
+        if not stream:
+            served, rows = ioc_daemon.daemon_call(
+                "list", lst_type=dataset_type, header=False, long=_long,
+                sort=_sort, plugin=plugins, filters=filters)
+
+        if not served:
+            rows = ioc.IOCage.list(dataset_type, header, _long, _sort,
+                                   plugin=plugins, stream=True,
+                                   filters=filters)
+
+        for row in rows:
+            ioc_common.logit({
+                "level"  : "INFO",
+                "message": json.dumps(dict(zip(keys, row))) if jsonl else
+                "\t".join(row)
+            })
+
+        return
     else:
-        _list = iocage.list(dataset_type, header, _long, _sort, plugin=plugins)
+        served, _list = ioc_daemon.daemon_call(
+            "list", lst_type=dataset_type, header=header, long=_long,
+            sort=_sort, plugin=plugins, filters=filters)
+
+        if not served:
+            _list = ioc.IOCage.list(dataset_type, header, _long, _sort,
+                                    plugin=plugins, filters=filters)
 
     if not header:
         if dataset_type == "base":
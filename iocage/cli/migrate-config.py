@@ -0,0 +1,47 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""migrate-config module for the cli."""
+import click
+
+import iocage.lib.ioc_common as ioc_common
+import iocage.lib.ioc_json as ioc_json
+
+__rootcmd__ = True
+
+
+@click.command(name="migrate-config",
+               help="Migrate every jail's configuration to the current"
+                    " version.")
+@click.option("--jobs", "-j", type=int, default=None,
+              help="How many configurations to migrate at once, defaults"
+                   " to a few per CPU.")
+def cli(jobs):
+    """Migrates all configurations up front instead of on first use."""
+    count = ioc_json.IOCJson().json_migrate_all(jobs=jobs)
+    version = ioc_json.IOCJson.json_get_version()
+
+    ioc_common.logit({
+        "level"  : "INFO",
+        "message": f"{count} configurations are at version {version}."
+    })
@@ -59,9 +59,9 @@ def cli(force, delete):
         if not click.confirm("\nAre you sure?"):
             exit()
 
+    pool, iocroot = ioc_json._get_pool_and_iocroot()
+
     for tag, uuid in jails.items():
-        pool = ioc_json.IOCJson().json_get_value("pool")
-        iocroot = ioc_json.IOCJson(pool).json_get_value("iocroot")
         jail = f"{pool}/iocage/jails/{uuid}"
         jail_old = f"{pool}/iocage/jails_old/{uuid}"
         path = paths[tag]
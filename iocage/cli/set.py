@@ -32,17 +32,18 @@ __rootcmd__ = True
 
 
 @click.command(context_settings=dict(
-    max_content_width=400, ), name="set", help="Sets the specified property.")
-@click.argument("prop", nargs=-1)
+    max_content_width=400, ), name="set",
+    help="Sets the specified properties.")
+@click.argument("props", nargs=-1)
 @click.argument("jail")
 @click.option("--plugin", "-P",
               help="Set the specified key for a plugin jail, if accessing a"
                    " nested key use . as a separator."
                    "\n\b Example: iocage set -P foo.bar.baz=VALUE PLUGIN",
               is_flag=True)
-def cli(prop, jail, plugin):
-    """Get a list of jails and print the property."""
-    prop = " ".join(prop)  # We don't want a tuple.
+def cli(props, jail, plugin):
+    """Get a list of jails and set the properties."""
+    prop = " ".join(props)  # We don't want a tuple.
 
     if "template=no" in prop:
         jail = f"{jail} (template)"
@@ -54,8 +55,7 @@ def cli(prop, jail, plugin):
 
     if not default:
         jails, paths = ioc_list.IOCList("uuid").list_datasets(set=True)
-        _jail = {tag: uuid for (tag, uuid) in jails.items() if
-                 uuid.startswith(jail) or tag == jail}
+        _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
         if len(_jail) == 1:
             tag, uuid = next(iter(_jail.items()))
@@ -79,7 +79,21 @@ def cli(prop, jail, plugin):
             })
             exit(1)
 
-        if "template" in prop.split("=")[0]:
+        if plugin:
+            _prop = prop.split(".")
+            err = ioc_json.IOCJson(path, cli=True).json_plugin_set_value(_prop)
+            if err:
+                exit(1)
+
+            return
+
+        conf = iocjson.json_load()
+        props = split_props(props, conf)
+
+        for prop in props:
+            if "template" not in prop.split("=")[0]:
+                continue
+
             if "template" in path and prop != "template=no":
                 ioc_common.logit({
                     "level"  : "ERROR",
@@ -93,26 +107,38 @@ def cli(prop, jail, plugin):
                 })
                 exit(1)
 
-        if plugin:
-            _prop = prop.split(".")
-            err = ioc_json.IOCJson(path, cli=True).json_plugin_set_value(_prop)
-            if err:
-                exit(1)
-        else:
-            try:
-                # We use this to test if it's a valid property at all.
-                _prop = prop.partition("=")[0]
-                iocjson.json_get_value(_prop)
-
-                # The actual setting of the property.
-                iocjson.json_set_value(prop)
-            except KeyError:
-                _prop = prop.partition("=")[0]
+        for prop in props:
+            _prop = prop.partition("=")[0]
+
+            if _prop not in conf:
                 ioc_common.logit({
                     "level"  : "ERROR",
                     "message": f"{_prop} is not a valid property!"
                 })
                 exit(1)
+
+        # The actual setting of the properties.
+        iocjson.json_set_values(props)
     else:
         _, iocroot = ioc_json._get_pool_and_iocroot()
-        ioc_json.IOCJson(iocroot).json_set_value(prop, default=True)
+        ioc_json.IOCJson(iocroot).json_set_values(
+            split_props(props, ioc_json._PROPS), default=True)
+
+
+def split_props(args, known):
+    """
+    Groups the arguments into key=value properties. An argument that isn't
+    a known key=value continues the previous value, like the values with
+    spaces the shell split for us.
+    """
+    props = []
+
+    for arg in args:
+        key, sep, _ = arg.partition("=")
+
+        if props and not (sep and key in known):
+            props[-1] = f"{props[-1]} {arg}"
+        else:
+            props.append(arg)
+
+    return props
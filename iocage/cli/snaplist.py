@@ -22,7 +22,6 @@
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """snaplist module for the cli."""
-import subprocess as su
 
 import click
 import texttable
@@ -30,6 +29,7 @@ import texttable
 import iocage.lib.ioc_common as ioc_common
 import iocage.lib.ioc_json as ioc_json
 import iocage.lib.ioc_list as ioc_list
+import iocage.lib.ioc_zfs as ioc_zfs
 
 
 @click.command(name="snaplist", help="Show snapshots of a specified jail.")
@@ -39,12 +39,11 @@ import iocage.lib.ioc_list as ioc_list
 def cli(header, jail):
     """Allows a user to show resource usage of all jails."""
     jails, paths = ioc_list.IOCList("uuid").list_datasets()
-    pool = ioc_json.IOCJson().json_get_value("pool")
+    pool, _ = ioc_json._get_pool_and_iocroot()
     snap_list = []
     table = texttable.Texttable(max_width=0)
 
-    _jail = {tag: uuid for (tag, uuid) in jails.items() if
-             uuid.startswith(jail) or tag == jail}
+    _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
     if len(_jail) == 1:
         tag, uuid = next(iter(_jail.items()))
@@ -74,34 +73,23 @@ def cli(header, jail):
     else:
         full_path = f"{pool}/iocage/jails/{uuid}"
 
-    zconf = ["zfs", "get", "-H", "-o", "value"]
-    snapshots = su.Popen(["zfs", "list", "-r", "-H", "-t", "snapshot",
-                          full_path], stdout=su.PIPE,
-                         stderr=su.PIPE).communicate()[0].decode(
-        "utf-8").split("\n")
+    try:
+        snapshots = ioc_zfs.zfs_list_snapshots(full_path)
+    except RuntimeError:
+        snapshots = []
 
-    for snap in snapshots:
-        # We get an empty list at the end.
-        if snap:
-            snap = snap.split()
-            snapname = snap[0].rsplit("@")[1]
-            root_snapname = snap[0].rsplit("@")[0].split("/")[-1]
+    for snap, props in snapshots:
+        snapname = snap.rsplit("@")[1]
+        root_snapname = snap.rsplit("@")[0].split("/")[-1]
 
-            if root_snapname == "root":
-                snapname += "/root"
-            elif root_snapname != uuid and root_snapname != tag:
-                # basejail datasets.
-                continue
+        if root_snapname == "root":
+            snapname += "/root"
+        elif root_snapname != uuid and root_snapname != tag:
+            # basejail datasets.
+            continue
 
-            creation = su.Popen(zconf + ["creation", snap[0]],
-                                stdout=su.PIPE).communicate()[0].decode(
-                "utf-8").strip()
-            used = snap[1]
-            referenced = su.Popen(zconf + ["referenced", snap[0]],
-                                  stdout=su.PIPE).communicate()[0].decode(
-                "utf-8").strip()
-
-            snap_list.append([snapname, creation, referenced, used])
+        snap_list.append([snapname, props["creation"], props["referenced"],
+                          props["used"]])
 
     if header:
         snap_list.insert(0, ["NAME", "CREATED", "RSIZE", "USED"])
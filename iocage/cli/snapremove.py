@@ -38,9 +38,8 @@ import iocage.lib.ioc_list as ioc_list
 def cli(jail, name):
     """Removes a snapshot from a user supplied jail."""
     jails, paths = ioc_list.IOCList("uuid").list_datasets()
-    pool = ioc_json.IOCJson().json_get_value("pool")
-    _jail = {tag: uuid for (tag, uuid) in jails.items() if
-             uuid.startswith(jail) or tag == jail}
+    pool, _ = ioc_json._get_pool_and_iocroot()
+    _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
     if len(_jail) == 1:
         tag, uuid = next(iter(_jail.items()))
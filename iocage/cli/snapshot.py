@@ -23,13 +23,13 @@
 # POSSIBILITY OF SUCH DAMAGE.
 """snapshot module for the cli."""
 import datetime
-import subprocess as su
 
 import click
 
 import iocage.lib.ioc_common as ioc_common
 import iocage.lib.ioc_json as ioc_json
 import iocage.lib.ioc_list as ioc_list
+import iocage.lib.ioc_zfs as ioc_zfs
 
 __rootcmd__ = True
 
@@ -41,11 +41,10 @@ __rootcmd__ = True
 def cli(jail, name):
     """Get a list of jails and print the property."""
     jails, paths = ioc_list.IOCList("uuid").list_datasets()
-    pool = ioc_json.IOCJson().json_get_value("pool")
+    pool, _ = ioc_json._get_pool_and_iocroot()
     date = datetime.datetime.utcnow().strftime("%F_%T")
 
-    _jail = {tag: uuid for (tag, uuid) in jails.items() if
-             uuid.startswith(jail) or tag == jail}
+    _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
     if len(_jail) == 1:
         tag, uuid = next(iter(_jail.items()))
@@ -81,12 +80,12 @@ def cli(jail, name):
         target = f"{pool}/iocage/jails/{uuid}@{name}"
 
     try:
-        su.check_call(["zfs", "snapshot", "-r", target], stderr=su.PIPE)
+        ioc_zfs.zfs_snapshot(target, recursive=True)
         ioc_common.logit({
             "level"  : "INFO",
             "message": f"Snapshot: {target} created."
         })
-    except su.CalledProcessError:
+    except RuntimeError:
         ioc_common.logit({
             "level"  : "ERROR",
             "message": "Snapshot already exists!"
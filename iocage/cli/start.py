@@ -34,8 +34,12 @@ __rootcmd__ = True
 @click.option("--rc", default=False, is_flag=True,
               help="Will start all jails with boot=on, in the specified"
                    " order with smaller value for priority starting first.")
+@click.option("--jobs", "-j", type=int, default=None,
+              help="With --rc, start up to this many jails at once, by"
+                   " default as many as there are CPUs. A jail still waits"
+                   " for the jails it depends on and for smaller priorities.")
 @click.argument("jails", nargs=-1)
-def cli(rc, jails):
+def cli(rc, jobs, jails):
     """
     Looks for the jail supplied and passes the uuid, path and configuration
     location to start_jail.
@@ -49,7 +53,7 @@ def cli(rc, jails):
         exit(1)
 
     if rc:
-        ioc.IOCage(rc=rc, silent=True).start()
+        ioc.IOCage(rc=rc, silent=True, jobs=jobs).start()
     else:
         for jail in jails:
             ioc.IOCage(jail, rc=rc).start()
@@ -34,8 +34,13 @@ __rootcmd__ = True
 @click.option("--rc", default=False, is_flag=True,
               help="Will stop all jails with boot=on, in the specified"
                    " order with higher value for priority stopping first.")
+@click.option("--jobs", "-j", type=int, default=None,
+              help="With --rc or ALL, stop up to this many jails at once, by"
+                   " default as many as there are CPUs. A jail still waits"
+                   " for the jails depending on it and for larger"
+                   " priorities.")
 @click.argument("jails", nargs=-1)
-def cli(rc, jails):
+def cli(rc, jobs, jails):
     """
     Looks for the jail supplied and passes the uuid, path and configuration
     location to stop_jail.
@@ -49,7 +54,7 @@ def cli(rc, jails):
         exit(1)
 
     if rc:
-        ioc.IOCage(rc=rc, silent=True).start()
+        ioc.IOCage(rc=rc, silent=True, jobs=jobs).stop()
     else:
         for jail in jails:
-            ioc.IOCage(jail, rc=rc).stop()
+            ioc.IOCage(jail, rc=rc, jobs=jobs).stop()
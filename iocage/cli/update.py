@@ -28,6 +28,7 @@ import click
 
 import iocage.lib.ioc_common as ioc_common
 import iocage.lib.ioc_fetch as ioc_fetch
+import iocage.lib.ioc_host as ioc_host
 import iocage.lib.ioc_json as ioc_json
 import iocage.lib.ioc_list as ioc_list
 import iocage.lib.ioc_start as ioc_start
@@ -42,8 +43,7 @@ __rootcmd__ = True
 def cli(jail):
     """Runs update with the command given inside the specified jail."""
     jails, paths = ioc_list.IOCList("uuid").list_datasets()
-    _jail = {tag: uuid for (tag, uuid) in jails.items() if
-             uuid.startswith(jail) or tag == jail}
+    _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
     if len(_jail) == 1:
         tag, uuid = next(iter(_jail.items()))
@@ -66,7 +66,7 @@ def cli(jail):
         })
         exit(1)
 
-    freebsd_version = ioc_common.checkoutput(["freebsd-version"])
+    freebsd_version = ioc_host.get_host_fact("freebsd_version")
     status, jid = ioc_list.IOCList.list_get_jid(uuid)
     conf = ioc_json.IOCJson(path).json_load()
     started = False
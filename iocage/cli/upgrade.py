@@ -41,8 +41,7 @@ __rootcmd__ = True
 def cli(jail, release):
     """Runs upgrade with the command given inside the specified jail."""
     jails, paths = ioc_list.IOCList("uuid").list_datasets()
-    _jail = {tag: uuid for (tag, uuid) in jails.items() if
-             uuid.startswith(jail) or tag == jail}
+    _jail = ioc_list.IOCJailIndex(jails).match(jail)
 
     if len(_jail) == 1:
         tag, uuid = next(iter(_jail.items()))
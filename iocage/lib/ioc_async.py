@@ -0,0 +1,180 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""asyncio interface to iocage for orchestration tools"""
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import threading
+
+import iocage.lib.ioc_common
+import iocage.lib.ioc_json
+import iocage.lib.ioc_list
+import iocage.lib.iocage
+
+# Starting or stopping a jail is a long chain of blocking steps, those and
+# the config reads share one bounded pool instead of a thread per call.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=iocage.lib.ioc_list.LOAD_WORKERS)
+
+        return _executor
+
+
+class AsyncIOCage(object):
+    """
+    Awaitable versions of the IOCage calls orchestration issues the most, so
+    many jails can be driven from one event loop. exec, snapshot and the
+    state of a jail run as asyncio subprocesses, start, stop, list and get
+    run the library on a bounded pool of threads.
+
+        await asyncio.gather(*(AsyncIOCage(j).start() for j in jails))
+    """
+
+    def __init__(self, jail=None, callback=None, silent=False):
+        self.jail = jail
+        self.callback = callback
+        self.silent = silent
+
+    @staticmethod
+    async def __blocking__(func, *args, **kwargs):
+        # Every call sees the jails as they are now, not as an earlier one
+        # did.
+        iocage.lib.ioc_list.invalidate_jail_state()
+
+        return await asyncio.get_event_loop().run_in_executor(
+            _get_executor(), functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    async def __run__(*command, stdin=None):
+        """Returns the exit status and the combined output of command."""
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE if stdin is not None else
+            asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+        out, _ = await proc.communicate(stdin)
+
+        return proc.returncode, out.decode("utf-8", "replace")
+
+    def __iocage__(self):
+        return iocage.lib.iocage.IOCage(self.jail, callback=self.callback,
+                                        silent=self.silent)
+
+    async def __resolve__(self):
+        """Returns the tag, uuid, path and configuration of self.jail."""
+        def _resolve():
+            tag, uuid, path = self.__iocage__().__check_jail_existence__()
+            conf = iocage.lib.ioc_json.IOCJson(
+                path, silent=self.silent, callback=self.callback).json_load()
+
+            return tag, uuid, path, conf
+
+        return await self.__blocking__(_resolve)
+
+    async def __running__(self, uuid):
+        status, _ = await self.__run__("jls", "-j", f"ioc-{uuid}", "jid")
+
+        return status == 0
+
+    async def start(self):
+        """Starts the jail and the jails it depends on."""
+        return await self.__blocking__(self.__iocage__().start)
+
+    async def stop(self):
+        """Stops the jail."""
+        return await self.__blocking__(self.__iocage__().stop)
+
+    async def list(self, lst_type="all", long=False, sort="tag",
+                   filters=None):
+        """Returns the JailRecords, see IOCage.list()."""
+        return await self.__blocking__(
+            iocage.lib.iocage.IOCage.list, lst_type, False, long, sort,
+            filters=filters)
+
+    async def get(self, prop):
+        """Returns a property of the jail, "state" asks jls(8) directly."""
+        if prop == "state":
+            _, uuid, _, _ = await self.__resolve__()
+
+            return "up" if await self.__running__(uuid) else "down"
+
+        return await self.__blocking__(self.__iocage__().get, prop)
+
+    async def exec(self, command, host_user="root", jail_user=None):
+        """
+        Runs command in the jail, starting it first if needed. Returns the
+        output and True if the command failed, like IOCExec.exec_jail().
+        """
+        tag, uuid, _, conf = await self.__resolve__()
+
+        if not await self.__running__(uuid):
+            iocage.lib.ioc_common.logit({
+                "level"  : "INFO",
+                "message": f"{uuid} ({tag}) is not running, starting jail"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+            await self.start()
+
+        flag, user = ("-U", jail_user) if jail_user else ("-u", host_user)
+        status, out = await self.__run__(
+            "setfib", conf["exec_fib"], "jexec", flag, user, f"ioc-{uuid}",
+            *command, stdin=b"\r")
+
+        return out, status != 0
+
+    async def snapshot(self, name=None):
+        """Snapshots the jail recursively, returns the snapshot's name."""
+        tag, uuid, _, conf = await self.__resolve__()
+        pool, _ = iocage.lib.ioc_json._get_pool_and_iocroot()
+
+        if not name:
+            name = datetime.datetime.utcnow().strftime("%F_%T")
+
+        if conf["template"] == "yes":
+            target = f"{pool}/iocage/templates/{tag}@{name}"
+        else:
+            target = f"{pool}/iocage/jails/{uuid}@{name}"
+
+        status, out = await self.__run__("zfs", "snapshot", "-r", target)
+
+        if status != 0:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": f"Snapshot {target} failed: {out.strip()}"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        return target
@@ -25,10 +25,9 @@
 import collections
 import os
 
-import libzfs
-
 import iocage.lib.ioc_common
 import iocage.lib.ioc_json
+import iocage.lib.ioc_zfs
 
 
 class IOCCheck(object):
@@ -52,7 +51,7 @@ class IOCCheck(object):
                     "iocage/jails", "iocage/log", "iocage/releases",
                     "iocage/templates")
 
-        zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        zfs = iocage.lib.ioc_zfs.get_zfs()
         pool = zfs.get(self.pool)
         has_duplicates = len(list(filter(lambda x: x.mountpoint == "/iocage",
                                          list(pool.root.datasets)))) > 0
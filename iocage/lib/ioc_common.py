@@ -25,20 +25,41 @@
 import collections
 import contextlib
 import ipaddress
+import json
 import os
 import shutil
 import stat
 import subprocess as su
 import sys
 import tempfile as tmp
+import threading
 
 import pygit2
 
 import iocage.lib.ioc_logger
 
+# Facts that only change across reboots or "iocage activate" are persisted
+# here so later invocations can skip recomputing them.
+RUNTIME_DIR = os.environ.get("IOCAGE_RUNDIR", "/var/run/iocage")
+
+
+# Per thread, where collect_logs() sends what our callback would log.
+_collector = threading.local()
+
 
 def callback(log):
     """Helper to call the appropriate logging level"""
+    collect = getattr(_collector, "collect", None)
+
+    if collect is not None:
+        # See collect_logs(), there is no terminal to exit(1) from.
+        if log['level'] == 'EXCEPTION':
+            raise RuntimeError(log['message'])
+
+        collect({"level": log['level'], "message": log['message']})
+
+        return
+
     lgr = iocage.lib.ioc_logger.IOCLogger().cli_log()
 
     if log['level'] == 'CRITICAL':
@@ -64,6 +85,22 @@ def callback(log):
             exit(1)
 
 
+@contextlib.contextmanager
+def collect_logs(collect):
+    """
+    Inside the block, what our callback would log in this thread is passed
+    to collect instead, whether it came through logit() or a caller such as
+    IOCage using it directly. An EXCEPTION still raises, as a RuntimeError
+    with its message.
+    """
+    _collector.collect = collect
+
+    try:
+        yield
+    finally:
+        _collector.collect = None
+
+
 def logit(content, _callback=None, silent=False, term="\n"):
     """Helper to check callable status of callback or call ours."""
     level = content["level"]
@@ -222,8 +259,8 @@ def sort_boot(boot):
 
 def sort_jid(jid):
     """Sort the list by JID."""
-    # Lame hack to have jails not runnig below running jails.
-    return jid[0] if jid[0] != "-" else "a"
+    # Jails not running go below running jails, the rest by number.
+    return (0, int(jid[0])) if jid[0] != "-" else (1, 0)
 
 
 def sort_uuid(uuid):
@@ -431,6 +468,38 @@ def open_atomic(filepath, *args, **kwargs):
         os.chmod(filepath, 0o644)
 
 
+def runtime_load(name):
+    """Returns the contents of a runtime file, or None if it's unusable."""
+    try:
+        with open(f"{RUNTIME_DIR}/{name}", "r") as runtime:
+            return json.load(runtime)
+    except (OSError, ValueError):
+        return None
+
+
+def runtime_write(name, data):
+    """Persists data to a runtime file, only root may do so."""
+    if os.geteuid() != 0:
+        return
+
+    try:
+        os.makedirs(RUNTIME_DIR, exist_ok=True)
+
+        with open_atomic(f"{RUNTIME_DIR}/{name}", "w") as runtime:
+            json.dump(data, runtime)
+    except OSError:
+        # It's only a cache, the next invocation will compute it again.
+        pass
+
+
+def runtime_remove(name):
+    """Removes a runtime file so the next invocation recomputes it."""
+    try:
+        os.remove(f"{RUNTIME_DIR}/{name}")
+    except OSError:
+        pass
+
+
 def get_nested_key(_dict, keys=None):
     """Gets a nested key from a dictionary."""
     if not keys:
@@ -22,6 +22,7 @@
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """iocage create module."""
+import collections
 import datetime
 import json
 import os
@@ -38,6 +39,7 @@ import iocage.lib.ioc_json
 import iocage.lib.ioc_list
 import iocage.lib.ioc_start
 import iocage.lib.ioc_stop
+import iocage.lib.ioc_zfs
 
 
 class IOCCreate(object):
@@ -47,9 +49,8 @@ class IOCCreate(object):
                  migrate=False, config=None, silent=False, template=False,
                  short=False, basejail=False, empty=False, uuid=None,
                  clone=False, callback=None):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.release = release
         self.props = props
         self.num = num
@@ -153,16 +154,15 @@ class IOCCreate(object):
         jail = f"{self.pool}/iocage/jails/{jail_uuid}/root"
 
         if self.template:
+            snapshot = f"{self.pool}/iocage/templates/{self.release}/" \
+                f"root@{jail_uuid}"
+
             try:
-                su.check_call(["zfs", "snapshot",
-                               f"{self.pool}/iocage/templates/{self.release}/"
-                               f"root@{jail_uuid}"], stderr=su.PIPE)
-            except su.CalledProcessError:
+                iocage.lib.ioc_zfs.zfs_snapshot(snapshot)
+            except RuntimeError:
                 raise RuntimeError(f"Template: {self.release} not found!")
 
-            su.Popen(["zfs", "clone", "-p",
-                      f"{self.pool}/iocage/templates/{self.release}/root@"
-                      f"{jail_uuid}", jail], stdout=su.PIPE).communicate()
+            iocage.lib.ioc_zfs.zfs_clone(snapshot, jail, parents=True)
 
             # self.release is actually the templates name
             config["release"] = iocage.lib.ioc_json.IOCJson(
@@ -172,20 +172,17 @@ class IOCCreate(object):
                 f"{self.iocroot}/templates/{self.release}").json_get_value(
                 "cloned_release")
         elif self.clone:
+            source = f"{self.pool}/iocage/jails/{self.release}"
+
             try:
-                su.check_call(["zfs", "snapshot", "-r",
-                               f"{self.pool}/iocage/jails/{self.release}"
-                               f"@{jail_uuid}"], stderr=su.PIPE)
-            except su.CalledProcessError:
+                iocage.lib.ioc_zfs.zfs_snapshot(f"{source}@{jail_uuid}",
+                                                recursive=True)
+            except RuntimeError:
                 raise RuntimeError(f"Jail: {self.jail} not found!")
 
-            su.Popen(["zfs", "clone",
-                      f"{self.pool}/iocage/jails/{self.release}@"
-                      f"{jail_uuid}", jail.replace("/root", "")],
-                     stdout=su.PIPE).communicate()
-            su.Popen(["zfs", "clone",
-                      f"{self.pool}/iocage/jails/{self.release}/root@"
-                      f"{jail_uuid}", jail], stdout=su.PIPE).communicate()
+            iocage.lib.ioc_zfs.zfs_clone(f"{source}@{jail_uuid}",
+                                         jail.replace("/root", ""))
+            iocage.lib.ioc_zfs.zfs_clone(f"{source}/root@{jail_uuid}", jail)
 
             with open(clone_config, "r") as _clone_config:
                 config = json.load(_clone_config)
@@ -204,30 +201,25 @@ class IOCCreate(object):
                 config[k] = v
         else:
             if not self.empty:
+                snapshot = f"{self.pool}/iocage/releases/{self.release}/" \
+                    f"root@{jail_uuid}"
+
                 try:
-                    su.check_call(["zfs", "snapshot",
-                                   f"{self.pool}/iocage/releases/"
-                                   f"{self.release}/"
-                                   f"root@{jail_uuid}"], stderr=su.PIPE)
-                except su.CalledProcessError:
+                    iocage.lib.ioc_zfs.zfs_snapshot(snapshot)
+                except RuntimeError:
                     raise RuntimeError(
                         f"RELEASE: {self.release} not found!")
 
-                su.Popen(["zfs", "clone", "-p",
-                          f"{self.pool}/iocage/releases/{self.release}/root@"
-                          f"{jail_uuid}", jail], stdout=su.PIPE).communicate()
+                iocage.lib.ioc_zfs.zfs_clone(snapshot, jail, parents=True)
             else:
-                try:
-                    iocage.lib.ioc_common.checkoutput(
-                        ["zfs", "create", "-p", jail],
-                        stderr=su.PIPE)
-                except su.CalledProcessError as err:
-                    raise RuntimeError(err.output.decode("utf-8").rstrip())
+                iocage.lib.ioc_zfs.zfs_create(jail, parents=True)
 
         iocjson = iocage.lib.ioc_json.IOCJson(location, silent=True)
 
         # This test is to avoid the same warnings during install_packages.
         if not self.plugin:
+            values = collections.OrderedDict()
+
             for prop in self.props:
                 key, _, value = prop.partition("=")
 
@@ -253,19 +245,35 @@ class IOCCreate(object):
                     is_template = True
                     continue
 
-                try:
-                    iocjson.json_check_prop(key, value, config)
+                values[key] = value
+
+            # Every property is checked in one pass, so a typo in one of
+            # them reports the others as well.
+            errors = iocjson.json_check_props(values, config)
+
+            try:
+                if errors:
+                    iocage.lib.ioc_common.logit({
+                        "level"  : "EXCEPTION",
+                        "message": "\n".join(errors)
+                    },
+                        _callback=self.callback,
+                        silent=self.silent)
+
+                for key, value in values.items():
+                    if key in iocage.lib.ioc_json._ZFS_PROPS:
+                        iocjson.json_set_zfs_prop(key, value, config)
 
                     config[key] = value
-                except RuntimeError as err:
-                    iocjson.json_write(config)  # Destroy counts on this.
-                    iocage.lib.ioc_destroy.IOCDestroy().destroy_jail(location)
-
-                    raise RuntimeError(f"***\n{err}\n***\n")
-                except SystemExit:
-                    iocjson.json_write(config)  # Destroy counts on this.
-                    iocage.lib.ioc_destroy.IOCDestroy().destroy_jail(location)
-                    exit(1)
+            except RuntimeError as err:
+                iocjson.json_write(config)  # Destroy counts on this.
+                iocage.lib.ioc_destroy.IOCDestroy().destroy_jail(location)
+
+                raise RuntimeError(f"***\n{err}\n***\n")
+            except SystemExit:
+                iocjson.json_write(config)  # Destroy counts on this.
+                iocage.lib.ioc_destroy.IOCDestroy().destroy_jail(location)
+                exit(1)
 
             iocjson.json_write(config)
 
@@ -0,0 +1,269 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""iocaged, answers read-only requests of the CLI from memory"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+import click
+
+import iocage.lib.ioc_check
+import iocage.lib.ioc_common
+import iocage.lib.ioc_inventory
+import iocage.lib.ioc_json
+import iocage.lib.ioc_list
+import iocage.lib.iocage
+
+SOCKET = os.environ.get("IOCAGE_SOCKET",
+                        f"{iocage.lib.ioc_common.RUNTIME_DIR}/iocaged.sock")
+
+# Seconds the CLI waits for an answer before doing the work itself.
+TIMEOUT = 120
+
+# The CLI commands iocaged answers, the CLI skips IOCCheck for them when the
+# socket exists.
+CLI_COMMANDS = ("df", "get", "list")
+
+
+def _list(lst_type="all", header=False, long=False, sort="tag",
+          plugin=False, filters=None):
+    return iocage.lib.iocage.IOCage.list(lst_type, header, long, sort,
+                                         plugin=plugin, filters=filters)
+
+
+def _get(prop, jail=None, recursive=False, plugin=False, filters=None):
+    return iocage.lib.iocage.IOCage(jail).get(prop, recursive=recursive,
+                                              plugin=plugin, filters=filters)
+
+
+def _df(long=False, filters=None):
+    return iocage.lib.iocage.IOCage().df(long=long, filters=filters)
+
+
+# Read-only on purpose, anything changing a jail still runs in the CLI.
+METHODS = {
+    "df"  : _df,
+    "get" : _get,
+    "list": _list,
+    "ping": lambda: "pong"
+}
+
+
+class IOCDaemonHandler(socketserver.StreamRequestHandler):
+    """
+    Serves newline separated JSON-RPC 2.0 requests on one connection, e.g.
+    {"jsonrpc": "2.0", "id": 1, "method": "list", "params": {"long": true}}
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+                _id = request.get("id")
+                method = request["method"]
+                params = request.get("params", {})
+            except (ValueError, AttributeError, KeyError):
+                reply = self.__error__(None, -32600, "Invalid request")
+            else:
+                if isinstance(method, str) and method in METHODS:
+                    reply = self.server.daemon_dispatch(
+                        _id, METHODS[method], params)
+                else:
+                    reply = self.__error__(_id, -32601,
+                                           f"Unknown method: {method}")
+
+            self.wfile.write(json.dumps(reply, default=list).encode("utf-8"))
+            self.wfile.write(b"\n")
+            self.wfile.flush()
+
+    @staticmethod
+    def __error__(_id, code, message, logs=None):
+        error = {"code": code, "message": message}
+
+        if logs:
+            error["data"] = {"logs": logs}
+
+        return {"jsonrpc": "2.0", "id": _id, "error": error}
+
+
+class IOCDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Keeps the pool, inventory, configurations and host facts of iocage in
+    memory between requests. Those caches check their files on every use,
+    the running jails, the active pool and the index are looked up again
+    per request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET):
+        self.path = path
+        # The library keeps module wide state, one request runs at a time.
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            if available(path):
+                raise RuntimeError(f"iocaged is already listening on {path}")
+
+            os.unlink(path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_umask = os.umask(0o077)
+
+        try:
+            super().__init__(path, IOCDaemonHandler)
+        finally:
+            os.umask(old_umask)
+
+    def daemon_dispatch(self, _id, method, params):
+        """
+        Runs one request, returns its JSON-RPC reply. What the request
+        logged comes along as "logs", in the error's data when it failed,
+        for the CLI to show as if it had done the work itself.
+        """
+        logs = []
+
+        with self.lock, iocage.lib.ioc_common.collect_logs(logs.append):
+            iocage.lib.ioc_json._pool_and_iocroot_forget()
+            iocage.lib.ioc_list.invalidate_jail_state()
+            # Other processes update the index without touching its stamp.
+            iocage.lib.ioc_inventory._memo.clear()
+
+            try:
+                result = method(**params)
+            except TypeError as err:
+                return IOCDaemonHandler.__error__(_id, -32602, str(err),
+                                                  logs)
+            except (RuntimeError, SystemExit) as err:
+                # What logit() raised for an EXCEPTION. Without a message
+                # what was logged before says it all.
+                message = str(err) if str(err) not in ("", "1") else ""
+
+                return IOCDaemonHandler.__error__(_id, -32000, message,
+                                                  logs)
+
+        return {"jsonrpc": "2.0", "id": _id, "result": result, "logs": logs}
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def available(path=SOCKET):
+    """Returns True if iocaged accepts connections on path."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+    except OSError:
+        return False
+
+    return True
+
+
+def local_check():
+    """
+    Runs the IOCCheck the CLI skipped for one of CLI_COMMANDS when the
+    request turns out to be one iocaged doesn't answer.
+    """
+    if os.path.exists(SOCKET):
+        iocage.lib.ioc_check.IOCCheck()
+
+
+def daemon_call(method, **params):
+    """
+    Asks iocaged to run method, returns (True, result). If it can't be
+    reached (False, None) is returned and the caller does the work itself,
+    after the IOCCheck the CLI skipped expecting iocaged to answer.
+    """
+    if not os.path.exists(SOCKET):
+        return False, None
+
+    request = {"jsonrpc": "2.0", "id": 1, "method": method,
+               "params": params}
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(SOCKET)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+            with sock.makefile("rb") as reply:
+                reply = json.loads(reply.readline().decode("utf-8"))
+    except (OSError, ValueError):
+        iocage.lib.ioc_check.IOCCheck()
+
+        return False, None
+
+    error = reply.get("error")
+    logs = reply.get("logs") or (error or {}).get("data", {}).get("logs", [])
+
+    for log in logs:
+        iocage.lib.ioc_common.logit(log)
+
+    if error is not None:
+        if not error["message"]:
+            sys.exit(1)
+
+        iocage.lib.ioc_common.logit({
+            "level"  : "EXCEPTION",
+            "message": error["message"]
+        })
+
+    return True, reply.get("result")
+
+
+@click.command(name="iocaged", help="Answer read-only iocage requests from"
+                                    " memory over a Unix socket.")
+@click.option("--socket", "-s", "path", default=SOCKET,
+              help="Path of the socket to listen on.")
+def main(path):
+    """Runs iocaged in the foreground until SIGTERM or SIGINT."""
+    if os.geteuid() != 0:
+        sys.exit("You need to have root privileges to run iocaged")
+
+    def _terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _terminate)
+
+    try:
+        iocage.lib.ioc_check.IOCCheck(silent=True)
+        server = IOCDaemon(path)
+    except RuntimeError as err:
+        sys.exit(err)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -29,8 +29,10 @@ import subprocess as su
 
 import libzfs
 
+import iocage.lib.ioc_inventory
 import iocage.lib.ioc_json
 import iocage.lib.ioc_stop
+import iocage.lib.ioc_zfs
 
 
 class IOCDestroy(object):
@@ -40,10 +42,9 @@ class IOCDestroy(object):
     """
 
     def __init__(self):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
+        self.zfs = iocage.lib.ioc_zfs.get_zfs()
         self.ds = self.zfs.get_dataset
 
     @staticmethod
@@ -221,3 +222,6 @@ class IOCDestroy(object):
             except libzfs.ZFSException:
                 # The dataset doesn't exist, we don't care :)
                 pass
+
+            iocage.lib.ioc_inventory.IOCInventory(
+                self.iocroot).inventory_remove(path)
@@ -53,6 +53,7 @@ import iocage.lib.ioc_destroy
 import iocage.lib.ioc_exec
 import iocage.lib.ioc_json
 import iocage.lib.ioc_start
+import iocage.lib.ioc_zfs
 
 
 class IOCFetch(object):
@@ -64,9 +65,8 @@ class IOCFetch(object):
                  eol=True, files=("MANIFEST", "base.txz", "lib32.txz",
                                   "doc.txz"), silent=False, callback=None,
                  plugin=None):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.server = server
         self.user = user
         self.password = password
@@ -89,7 +89,7 @@ class IOCFetch(object):
         self.silent = silent
         self.callback = callback
 
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        self.zfs = iocage.lib.ioc_zfs.get_zfs()
         self.zpool = self.zfs.get(self.pool)
         self.plugin = plugin
 
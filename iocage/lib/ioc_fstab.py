@@ -39,9 +39,8 @@ class IOCFstab(object):
     def __init__(self, uuid, tag, action, source, destination, fstype,
                  fsoptions, fsdump, fspass, index=None, silent=False,
                  callback=None):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.uuid = uuid
         self.tag = tag
         self.action = action
@@ -0,0 +1,119 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Facts about the host that only change across reboots"""
+import os
+import subprocess as su
+import time
+
+import iocage.lib.ioc_common
+
+# A clock step (ntpd, a suspended VM) moves the computed boot time a bit,
+# anything within this many seconds is the same boot.
+BOOTTIME_TOLERANCE = 5
+
+_host = {}
+
+
+def _boottime():
+    """kern.boottime without forking sysctl, wall clock minus uptime."""
+    try:
+        uptime = time.clock_gettime(time.CLOCK_UPTIME)
+    except AttributeError:
+        # Not FreeBSD, CLOCK_UPTIME is FreeBSD specific.
+        uptime = time.clock_gettime(time.CLOCK_BOOTTIME)
+
+    return int(time.time() - uptime)
+
+
+def _userland_stamp():
+    """freebsd-update can replace the userland without a reboot."""
+    try:
+        return os.stat("/bin/freebsd-version").st_mtime_ns
+    except OSError:
+        return None
+
+
+def _identity():
+    return {
+        "boottime": _boottime(),
+        "uname"   : list(os.uname()),
+        "userland": _userland_stamp()
+    }
+
+
+def _same_host(cached, current):
+    try:
+        return cached["uname"] == current["uname"] and \
+            cached["userland"] == current["userland"] and \
+            abs(cached["boottime"] - current["boottime"]) <= \
+            BOOTTIME_TOLERANCE
+    except (KeyError, TypeError):
+        return False
+
+
+def _freebsd_version():
+    return iocage.lib.ioc_common.checkoutput(["freebsd-version"])
+
+
+def _jail_params():
+    sysctls_list = su.Popen(["sysctl", "-d", "security.jail.param"],
+                            stdout=su.PIPE).communicate()[0].decode(
+        "utf-8").split()
+
+    return [p.replace("security.jail.param.", "").replace(":", "")
+            for p in sysctls_list if p.startswith("security.jail.param.")]
+
+
+# Only what takes a fork to find out, os.uname() is cheaper than the cache.
+_FACTS = {
+    "freebsd_version": _freebsd_version,
+    "jail_params"    : _jail_params
+}
+
+
+def get_host_fact(name):
+    """
+    Returns a fact about the host, see _FACTS.
+
+    Facts are computed on first use and kept in the host.json runtime file
+    for as long as the boot time, kernel and userland stay the same.
+    """
+    if not _host:
+        identity = _identity()
+        cached = iocage.lib.ioc_common.runtime_load("host.json")
+
+        if isinstance(cached, dict) and \
+                _same_host(cached.get("identity"), identity) and \
+                isinstance(cached.get("facts"), dict):
+            _host.update(cached)
+        else:
+            _host.update({"identity": identity, "facts": {}})
+
+    facts = _host["facts"]
+
+    if name not in facts:
+        facts[name] = _FACTS[name]()
+        iocage.lib.ioc_common.runtime_write("host.json", _host)
+
+    return facts[name]
@@ -30,15 +30,15 @@ import zipfile
 
 import iocage.lib.ioc_common
 import iocage.lib.ioc_json
+import iocage.lib.ioc_zfs
 
 
 class IOCImage(object):
     """export() and import()"""
 
     def __init__(self, callback=None, silent=False):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.date = datetime.datetime.utcnow().strftime("%F")
         self.callback = callback
         self.silent = silent
@@ -55,18 +55,8 @@ class IOCImage(object):
         # Looks like foo/iocage/jails/df0ef69a-57b6-4480-b1f8-88f7b6febbdf@BAR
         target = f"{image_path}@ioc-export-{self.date}"
 
-        try:
-            iocage.lib.ioc_common.checkoutput(
-                ["zfs", "snapshot", "-r", target],
-                stderr=su.STDOUT)
-        except su.CalledProcessError as err:
-            raise RuntimeError(f"{err.output.decode('utf-8').rstrip()}")
-
-        datasets = su.Popen(["zfs", "list", "-H", "-r",
-                             "-o", "name", image_path],
-                            stdout=su.PIPE, stderr=su.PIPE).communicate()[
-            0].decode(
-            "utf-8").split()
+        iocage.lib.ioc_zfs.zfs_snapshot(target, recursive=True)
+        datasets = sorted(iocage.lib.ioc_zfs.zfs_children(image_path))
 
         for dataset in datasets:
             if dataset.split("/")[-1] == jail_name:
@@ -206,6 +196,10 @@ class IOCImage(object):
         except su.CalledProcessError as err:
             raise RuntimeError(f"{err.output.decode('utf-8').rstrip()}")
 
+        # The pool may be marked as migrated, this configuration is not.
+        iocage.lib.ioc_json.IOCJson(f"{self.iocroot}/jails/{uuid}",
+                                    silent=True).json_migrate()
+
         # Templates become jails again once imported, let's make that reality.
         iocage.lib.ioc_json.IOCJson(f"{self.iocroot}/jails/{uuid}",
                                     silent=True).json_set_value("type=jail")
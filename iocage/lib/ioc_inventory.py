@@ -0,0 +1,375 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Persistent index of the jails and templates under iocroot"""
+import json
+import os
+import threading
+
+import iocage.lib.ioc_common
+import iocage.lib.ioc_json
+import iocage.lib.ioc_network
+import iocage.lib.ioc_zfs
+
+INVENTORY_VERSION = 4
+BOOTPLAN_VERSION = 1
+
+# iocroot: (stamp, entries), what this process last loaded or saved.
+_memo = {}
+# iocroot: (entries, IOCMacRegistry), the MACs used by those entries.
+_macs = {}
+_lock = threading.RLock()
+_local = threading.local()
+
+
+class IOCInventory(object):
+    """
+    Keeps {iocroot}/inventory.json in step with the jail and template
+    datasets.
+
+    Creating, renaming or destroying one of those datasets adds or removes
+    its mountpoint under iocroot/jails or iocroot/templates, which changes
+    the mtime of that directory. The index is stamped with both mtimes, an
+    up to date index costs two stat calls instead of reading every
+    mountpoint property and configuration. On a mismatch only the
+    directories that appeared are loaded and the ones that vanished are
+    dropped.
+
+    {iocroot}/bootplan.json is derived from it: the boot=on jails in start
+    order. It's rewritten whenever a tag, boot, priority or depends changes,
+    so start --rc reads one file instead of scanning the fleet.
+
+    Each entry also keeps the jail's addresses for ioc_ipam, and its MACs,
+    which inventory_macs() indexes.
+    """
+
+    locations = ("jails", "templates")
+
+    def __init__(self, iocroot=None, silent=False, callback=None):
+        if iocroot is None:
+            _, iocroot = iocage.lib.ioc_json._get_pool_and_iocroot()
+
+        self.iocroot = iocroot
+        self.path = f"{iocroot}/inventory.json"
+        self.silent = silent
+        self.callback = callback
+
+    def inventory_load(self):
+        """
+        Returns the entries of every jail and template keyed by their path.
+
+        The result is shared, callers must not modify it.
+        """
+        return self.__load__()[1]
+
+    def inventory_update(self, path, conf):
+        """Records the configuration just written for the jail at path."""
+        if getattr(_local, "reconciling", False):
+            # json_load() may write while we are loading it for the index,
+            # the reconciliation records it afterwards.
+            return
+
+        path = os.path.normpath(path)
+        location = os.path.basename(os.path.dirname(path))
+
+        with _lock:
+            stamp, entries = self.__load__()
+            old = entries.get(path, {})
+            entries = dict(entries)
+            entries[path] = self.__entry__(path, location, conf,
+                                           old.get("template"))
+
+            self.__macs_moved__(entries, old.get("macs", []),
+                                entries[path]["macs"])
+            self.__save__(stamp, entries)
+
+    def inventory_bootplan(self):
+        """
+        Returns the uuid, tag, path, priority and depends of every jail with
+        boot=on, by priority. Read straight from bootplan.json while its
+        stamp matches the jail directories.
+        """
+        known_stamp, plan = self.__read_plan__()
+
+        if known_stamp == self.__stamp__():
+            return plan
+
+        _, entries = self.__load__()
+
+        return self.__plan__(entries)
+
+    def inventory_remove(self, path):
+        """Drops the jail at path from the index."""
+        path = os.path.normpath(path)
+
+        with _lock:
+            stamp, entries = self.__load__()
+
+            if path in entries:
+                entries = dict(entries)
+                old = entries.pop(path)
+                self.__macs_moved__(entries, old["macs"], [])
+                self.__save__(stamp, entries)
+
+    def inventory_macs(self):
+        """
+        Returns the IOCMacRegistry of every MAC in a jail's configuration,
+        built from the index once and kept in step with it afterwards.
+        """
+        with _lock:
+            _, entries = self.__load__()
+
+            known, old = _macs.get(self.iocroot, (None, None))
+
+            if known is entries:
+                return old
+
+            registry = iocage.lib.ioc_network.IOCMacRegistry(
+                mac for e in entries.values() for mac in e["macs"])
+
+            if old is not None:
+                # Pairs handed to starts still running aren't in the index.
+                registry.mac_keep_reserved(old)
+
+            _macs[self.iocroot] = (entries, registry)
+
+            return registry
+
+    def __macs_moved__(self, entries, released, added):
+        """Moves the MAC registry of the entries replaced to entries."""
+        try:
+            known, registry = _macs[self.iocroot]
+        except KeyError:
+            return
+
+        # Otherwise it's out of date already, inventory_macs() rebuilds it.
+        if known is _memo.get(self.iocroot, (None, None))[1]:
+            for mac in released:
+                registry.mac_release(mac)
+
+            for mac in added:
+                registry.mac_add(mac)
+
+            _macs[self.iocroot] = (entries, registry)
+
+    def __stamp__(self):
+        stamp = {}
+
+        for location in self.locations:
+            try:
+                stamp[location] = os.stat(
+                    f"{self.iocroot}/{location}").st_mtime_ns
+            except OSError:
+                stamp[location] = None
+
+        return stamp
+
+    def __read__(self):
+        try:
+            with open(self.path, "r") as inventory:
+                inventory = json.load(inventory)
+
+            if inventory["version"] == INVENTORY_VERSION:
+                return inventory["stamp"], inventory["entries"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return None, {}
+
+    def __read_plan__(self):
+        try:
+            with open(f"{self.iocroot}/bootplan.json", "r") as plan:
+                plan = json.load(plan)
+
+            if plan["version"] == BOOTPLAN_VERSION:
+                return plan["stamp"], plan["jails"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return None, []
+
+    @staticmethod
+    def __plan__(entries):
+        plan = [{
+            "uuid"    : e["uuid"],
+            "tag"     : e["tag"],
+            "path"    : e["path"],
+            "priority": e["priority"],
+            "depends" : e["depends"]
+        } for e in entries.values()
+            if e["location"] == "jails" and e["boot"] == "on"]
+
+        plan.sort(key=lambda j: (int(j["priority"]), j["tag"]))
+
+        return plan
+
+    def __save_plan__(self, stamp, entries):
+        try:
+            with iocage.lib.ioc_common.open_atomic(
+                    f"{self.iocroot}/bootplan.json", "w") as out:
+                json.dump({
+                    "version": BOOTPLAN_VERSION,
+                    "stamp"  : stamp,
+                    "jails"  : self.__plan__(entries)
+                }, out, indent=4, ensure_ascii=False)
+        except OSError:
+            # inventory_bootplan() falls back to the index.
+            pass
+
+    def __save__(self, stamp, entries):
+        _memo[self.iocroot] = (stamp, entries)
+
+        if os.geteuid() != 0:
+            return
+
+        self.__save_plan__(stamp, entries)
+
+        try:
+            with iocage.lib.ioc_common.open_atomic(self.path, "w") as out:
+                json.dump({
+                    "version": INVENTORY_VERSION,
+                    "stamp"  : stamp,
+                    "entries": entries
+                }, out, sort_keys=True, indent=4, ensure_ascii=False)
+        except OSError:
+            # The index is rebuilt from the datasets when it's unusable.
+            pass
+
+    def __load__(self):
+        with _lock:
+            # Taken before reconciling, anything created meanwhile will
+            # mismatch on the next load.
+            stamp = self.__stamp__()
+
+            try:
+                known_stamp, entries = _memo[self.iocroot]
+            except KeyError:
+                known_stamp, entries = self.__read__()
+
+            if known_stamp == stamp:
+                _memo[self.iocroot] = (stamp, entries)
+
+                return stamp, entries
+
+            entries = self.__reconcile__(entries)
+            self.__save__(stamp, entries)
+
+            return stamp, entries
+
+    def __reconcile__(self, entries):
+        """Adds the jails that appeared and drops the ones that vanished."""
+        found = {}
+
+        for location in self.locations:
+            try:
+                names = os.listdir(f"{self.iocroot}/{location}")
+            except OSError:
+                names = []
+
+            for name in names:
+                path = f"{self.iocroot}/{location}/{name}"
+
+                if os.path.isdir(path):
+                    found[path] = location
+
+        entries = {p: e for p, e in entries.items() if p in found}
+        missing = sorted(p for p in found if p not in entries)
+        datasets = None
+
+        if len(missing) > 1:
+            # One zfs list beats an origin lookup per jail.
+            pool, _ = iocage.lib.ioc_json._get_pool_and_iocroot()
+
+            try:
+                datasets = iocage.lib.ioc_zfs.prefetch_datasets(
+                    pool, ("origin",))
+            except RuntimeError:
+                pass
+
+        _local.reconciling = True
+
+        try:
+            for path in missing:
+                conf = iocage.lib.ioc_json.IOCJson(
+                    path, silent=self.silent,
+                    callback=self.callback).json_load()
+                entries[path] = self.__entry__(
+                    path, found[path], conf,
+                    self.__template__(path, found[path], conf, datasets))
+        finally:
+            _local.reconciling = False
+
+        return entries
+
+    def __entry__(self, path, location, conf, template=None):
+        if template is None:
+            template = self.__template__(path, location, conf)
+
+        return {
+            "uuid"    : conf["host_hostuuid"],
+            "tag"     : conf["tag"],
+            "path"    : path,
+            "location": location,
+            "type"    : conf.get("type", "jail"),
+            "release" : conf.get("release", "-"),
+            "boot"    : conf.get("boot", "off"),
+            "priority": conf.get("priority", "99"),
+            "depends" : [d for d in conf.get("depends", "none").split()
+                         if d != "none"],
+            "ip4_addr": conf.get("ip4_addr", "none"),
+            "ip6_addr": conf.get("ip6_addr", "none"),
+            "macs"    : sorted(mac for key, value in conf.items()
+                               if key.endswith("_mac")
+                               for mac in str(value).split(",")
+                               if mac != "none"),
+            "template": template
+        }
+
+    @staticmethod
+    def __template__(path, location, conf, datasets=None):
+        """
+        Returns the template a jail was cloned from, or '-'. datasets may
+        hold the origins prefetched by ioc_zfs.prefetch_datasets().
+        """
+        if conf.get("type") == "template":
+            return "-"
+
+        pool, _ = iocage.lib.ioc_json._get_pool_and_iocroot()
+        name = os.path.basename(path)
+        root = f"{pool}/iocage/{location}/{name}/root"
+
+        if datasets is not None:
+            origin = datasets.get(root, {}).get("origin", "-")
+        else:
+            origin = iocage.lib.ioc_json.IOCJson(
+                silent=True).zfs_get_property(root, "origin")
+
+        if not origin or origin == "-":
+            return "-"
+
+        template = origin.rsplit("/root@", 1)[0].rsplit("/", 1)[-1]
+
+        if "release" in template.lower() or "stable" in template.lower():
+            return "-"
+
+        return template
@@ -0,0 +1,136 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""IP address management for iocage"""
+import ipaddress
+
+import iocage.lib.ioc_inventory
+import iocage.lib.ioc_list
+
+
+def parse_addrs(value):
+    """
+    Returns [(interface, ipaddress.ip_interface)] for an ip4_addr or
+    ip6_addr value such as "vnet0|10.0.0.5/24,10.0.0.6", interface is None
+    when not given. Entries that aren't addresses are skipped.
+    """
+    addrs = []
+
+    for addr in str(value).split(","):
+        iface, _, ip = addr.strip().rpartition("|")
+
+        if ip in ("", "none", "-"):
+            continue
+
+        try:
+            addrs.append((iface or None, ipaddress.ip_interface(ip)))
+        except ValueError:
+            continue
+
+    return addrs
+
+
+def parse_pool(pool):
+    """
+    Returns (interface, ipaddress.ip_network) for an address pool such as
+    "vnet0|10.0.0.0/24". ip4_addr and ip6_addr need the interface, so the
+    pool does too.
+    """
+    iface, _, network = str(pool).rpartition("|")
+
+    try:
+        network = ipaddress.ip_network(network, strict=False)
+    except ValueError:
+        raise RuntimeError(f"Invalid address pool: {pool}")
+
+    if not iface:
+        raise RuntimeError(f"Address pool {pool} needs an interface, e.g."
+                           f" vnet0|{network}")
+
+    return iface, network
+
+
+class IOCIpam(object):
+    """
+    Indexes every address in use by the jails, so a conflict is a hash
+    lookup rather than a substring match against each jail's addresses.
+
+    configured covers the ip4_addr and ip6_addr of every jail the inventory
+    knows, running the addresses of every running jail as jls reports them.
+    """
+
+    def __init__(self, iocroot=None, configured=True, running=True):
+        self.used = {}
+        self.pools = {}
+
+        if configured:
+            entries = iocage.lib.ioc_inventory.IOCInventory(
+                iocroot).inventory_load()
+
+            for entry in entries.values():
+                for key in ("ip4_addr", "ip6_addr"):
+                    for _, ip in parse_addrs(entry[key]):
+                        self.used.setdefault(ip.ip, entry["uuid"])
+
+        if running:
+            for name, jail in iocage.lib.ioc_list.get_jail_state().items():
+                owner = name[4:] if name.startswith("ioc-") else name
+
+                for key in ("ip4.addr", "ip6.addr"):
+                    for _, ip in parse_addrs(jail.get(key, "-")):
+                        self.used.setdefault(ip.ip, owner)
+
+    def ipam_conflicts(self, uuid, *values):
+        """
+        Returns [(address, owner)] for each address in the ip4_addr or
+        ip6_addr values that a jail other than uuid already uses.
+        """
+        conflicts = []
+
+        for value in values:
+            for _, ip in parse_addrs(value):
+                owner = self.used.get(ip.ip)
+
+                if owner is not None and owner != uuid:
+                    conflicts.append((str(ip.ip), owner))
+
+        return conflicts
+
+    def ipam_allocate(self, pool, exclude=()):
+        """
+        Returns the next free address of pool, "interface|network" like
+        "vnet0|10.0.0.0/24", as an ip4_addr or ip6_addr value and marks it
+        used. Addresses in exclude, such as the default router, are skipped.
+        """
+        iface, network = parse_pool(pool)
+        exclude = {ip.ip for _, ip in parse_addrs(",".join(exclude))}
+        # Picks up where the last allocation from this pool stopped.
+        hosts = self.pools.setdefault(network, network.hosts())
+
+        for ip in hosts:
+            if ip not in self.used and ip not in exclude:
+                self.used[ip] = "-"
+
+                return f"{iface}|{ip}/{network.prefixlen}"
+
+        raise RuntimeError(f"No free address left in {pool}!")
@@ -22,10 +22,11 @@
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """Convert, load or write JSON."""
+import collections
+import concurrent.futures
 import json
 import logging
 import os
-import re
 import subprocess as su
 import sys
 
@@ -34,18 +35,304 @@ import libzfs
 import iocage.lib.ioc_common
 import iocage.lib.ioc_create
 import iocage.lib.ioc_exec
+import iocage.lib.ioc_host
+import iocage.lib.ioc_inventory
 import iocage.lib.ioc_list
 import iocage.lib.ioc_stop
+import iocage.lib.ioc_zfs
+
+# Parsed configurations shared by every IOCJson in this process. Entries are
+# keyed by the config.json path and hold the (st_mtime_ns, st_size, st_ino)
+# identity the file had when it was read, anything else is a cache miss.
+_config_cache = {}
+
+
+def _config_identity(path):
+    """Returns the identity of a configuration file, or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _check_enum(*allowed):
+    def check(key, value):
+        if value not in allowed:
+            return f"{value} is not a valid value for {key}.\n" \
+                f"Value must be {' or '.join(allowed)}"
+
+    return check
+
+
+def _check_string(key, value):
+    return None
+
+
+def _check_int_range(low, high):
+    def check(key, value):
+        if not value.isdigit() or not low <= int(value) <= high:
+            return f"{value} is not a valid value for {key}.\n" \
+                f"Value must be a number from {low} to {high}"
+
+    return check
+
+
+def _check_ip(example):
+    def check(key, value):
+        if value == "none":
+            return
+
+        # jail(8) lets further addresses reuse the first interface.
+        addresses = [a.strip().partition("|") for a in value.split(",")]
+        paired = [a for a in addresses if a[1]]
+
+        if not paired or any(not iface or (sep and not ip)
+                             for (iface, sep, ip) in addresses):
+            return f"{value} is not a valid value for {key}.\n" \
+                "IP address must contain both an interface and IP " \
+                f"address.\nEXAMPLE: {example}"
+
+    return check
+
+
+def _check_rctl(example):
+    def check(key, value):
+        amount, _, action = value.partition(":")
+
+        if value != "off" and (not amount or not action):
+            return f"{value} is not a valid value for {key}.\n" \
+                f"{key} requires at minimum a pair.\nEXAMPLE: {example}"
+
+    return check
+
+
+def _check_interfaces(key, value):
+    for pair in value.split(","):
+        vnet, _, bridge = pair.strip().partition(":")
+
+        if not vnet or not bridge:
+            return f"{value} is not a valid value for {key}.\n" \
+                "Interfaces must be specified as a pair.\n" \
+                "EXAMPLE: vnet0:bridge0, vnet1:bridge1"
+
+
+def _check_quota(key, value):
+    if value != "none" and not value.upper().endswith(("M", "G", "T")):
+        return f"{value} should have a suffix ending in M, G, or T."
+
+
+def _check_readonly(key, value):
+    return f"{key} is a read-only property."
+
+
+_bool = _check_enum("0", "1")
+_switch = _check_enum("off", "on")
+_yes_no = _check_enum("no", "yes")
+_sysv = _check_enum("new", "inherit", "disable")
+
+# Every property a user may set and how its value is checked, built once
+# instead of on each json_check_prop() call.
+_PROPS = {
+    # Network properties
+    "interfaces"           : _check_interfaces,
+    "host_domainname"      : _check_string,
+    "host_hostname"        : _check_string,
+    "exec_fib"             : _check_string,
+    "ip4_addr"             : _check_ip("em0|192.168.1.10"),
+    "ip4_saddrsel"         : _bool,
+    "ip4"                  : _check_enum("new", "inherit", "none"),
+    "ip6_addr"             : _check_ip("em0|fe80::5400:ff:fe54:1"),
+    "ip6_saddrsel"         : _bool,
+    "ip6"                  : _check_enum("new", "inherit", "none"),
+    "defaultrouter"        : _check_string,
+    "defaultrouter6"       : _check_string,
+    "resolver"             : _check_string,
+    "mac_prefix"           : _check_string,
+    "vnet0_mac"            : _check_string,
+    "vnet1_mac"            : _check_string,
+    "vnet2_mac"            : _check_string,
+    "vnet3_mac"            : _check_string,
+    # Jail Properties
+    "devfs_ruleset"        : _check_string,
+    "exec_start"           : _check_string,
+    "exec_stop"            : _check_string,
+    "exec_prestart"        : _check_string,
+    "exec_poststart"       : _check_string,
+    "exec_prestop"         : _check_string,
+    "exec_poststop"        : _check_string,
+    "exec_clean"           : _bool,
+    "exec_timeout"         : _check_string,
+    "stop_timeout"         : _check_string,
+    "exec_jail_user"       : _check_string,
+    "exec_system_jail_user": _check_string,
+    "exec_system_user"     : _check_string,
+    "mount_devfs"          : _bool,
+    "mount_fdescfs"        : _bool,
+    "enforce_statfs"       : _check_enum("0", "1", "2"),
+    "children_max"         : _check_string,
+    "login_flags"          : _check_string,
+    "securelevel"          : _check_string,
+    "sysvmsg"              : _sysv,
+    "sysvsem"              : _sysv,
+    "sysvshm"              : _sysv,
+    "allow_set_hostname"   : _bool,
+    "allow_sysvipc"        : _bool,
+    "allow_raw_sockets"    : _bool,
+    "allow_chflags"        : _bool,
+    "allow_mount"          : _bool,
+    "allow_mount_devfs"    : _bool,
+    "allow_mount_nullfs"   : _bool,
+    "allow_mount_procfs"   : _bool,
+    "allow_mount_tmpfs"    : _bool,
+    "allow_mount_zfs"      : _bool,
+    "allow_quotas"         : _bool,
+    "allow_socket_af"      : _bool,
+    # RCTL limits
+    "cpuset"               : _switch,
+    "rlimits"              : _switch,
+    "memoryuse"            : _check_rctl("8g:log"),
+    "memorylocked"         : _switch,
+    "vmemoryuse"           : _switch,
+    "maxproc"              : _switch,
+    "cputime"              : _switch,
+    "pcpu"                 : _check_rctl("20:log"),
+    "datasize"             : _switch,
+    "stacksize"            : _switch,
+    "coredumpsize"         : _switch,
+    "openfiles"            : _switch,
+    "pseudoterminals"      : _switch,
+    "swapuse"              : _switch,
+    "nthr"                 : _switch,
+    "msgqqueued"           : _switch,
+    "msgqsize"             : _switch,
+    "nmsgq"                : _switch,
+    "nsemop"               : _switch,
+    "nshm"                 : _switch,
+    "shmsize"              : _switch,
+    "wallclock"            : _switch,
+    # Custom properties
+    "tag"                  : _check_string,
+    "bpf"                  : _switch,
+    "dhcp"                 : _switch,
+    "boot"                 : _switch,
+    "notes"                : _check_string,
+    "owner"                : _check_string,
+    "priority"             : _check_int_range(1, 99),
+    "hostid"               : _check_string,
+    "jail_zfs"             : _switch,
+    "jail_zfs_dataset"     : _check_string,
+    "jail_zfs_mountpoint"  : _check_string,
+    "mount_procfs"         : _bool,
+    "mount_linprocfs"      : _bool,
+    "vnet"                 : _switch,
+    "template"             : _yes_no,
+    "comment"              : _check_string,
+    "host_time"            : _yes_no,
+    "depends"              : _check_string,
+}
+
+# These live on the jail's dataset rather than in config.json.
+_ZFS_PROPS = {
+    "compression"  : _check_string,
+    "origin"       : _check_readonly,
+    "quota"        : _check_quota,
+    "mountpoint"   : _check_readonly,
+    "compressratio": _check_readonly,
+    "available"    : _check_readonly,
+    "used"         : _check_readonly,
+    "dedup"        : _check_string,
+    "reservation"  : _check_string,
+}
+
+_PROPS.update(_ZFS_PROPS)
+
+
+# Set on pool/iocage once every configuration has been migrated.
+CONFIG_VERSION_PROP = "org.freebsd.ioc:config_version"
+
+# The active pool and its iocroot don't change during a command, they are
+# resolved once per process. Root also persists them to a runtime file which
+# "iocage activate" removes, it is only trusted while the pool is imported
+# and still marked active.
+_pool_and_iocroot = {}
+
+
+def _pool_active(pool):
+    """Whether pool is imported and marked active for iocage usage."""
+    try:
+        return iocage.lib.ioc_zfs.zfs_get(
+            pool, "org.freebsd.ioc:active") == "yes"
+    except RuntimeError:
+        return False
+
+
+def _pool_and_iocroot_load():
+    """Returns the pool and iocroot persisted by an earlier invocation."""
+    cached = iocage.lib.ioc_common.runtime_load("pool.json")
+
+    try:
+        if os.path.isdir(cached["iocroot"]) and _pool_active(cached["pool"]):
+            loaded = {"pool": cached["pool"], "iocroot": cached["iocroot"]}
+
+            if "config_version" in cached:
+                loaded["config_version"] = cached["config_version"]
+
+            return loaded
+    except (KeyError, TypeError):
+        pass
+
+    return {}
+
+
+def _pool_and_iocroot_invalidate():
+    """Forgets the resolved pool and iocroot, used when activating a pool."""
+    _pool_and_iocroot.clear()
+    iocage.lib.ioc_common.runtime_remove("pool.json")
+
+
+def _pool_and_iocroot_forget():
+    """
+    Forgets the resolved pool and iocroot in this process only. Long running
+    processes use it to pick up an activation done by another one.
+    """
+    _pool_and_iocroot.clear()
 
 
 def _get_pool_and_iocroot():
     """For internal setting of pool and iocroot."""
+    if "iocroot" in _pool_and_iocroot:
+        return _pool_and_iocroot["pool"], _pool_and_iocroot["iocroot"]
+
     pool = IOCJson().json_get_value("pool")
     iocroot = IOCJson(pool).json_get_value("iocroot")
 
     return pool, iocroot
 
 
+def _configs_current():
+    """
+    True when "iocage migrate-config" brought every configuration on the
+    pool to the current version, json_load() can then skip checking them.
+    """
+    if "config_version" not in _pool_and_iocroot:
+        try:
+            pool, _ = _get_pool_and_iocroot()
+        except RuntimeError:
+            return False
+
+        _pool_and_iocroot["config_version"] = IOCJson(
+            silent=True).zfs_get_property(f"{pool}/iocage",
+                                          CONFIG_VERSION_PROP)
+
+        if "iocroot" in _pool_and_iocroot:
+            iocage.lib.ioc_common.runtime_write("pool.json",
+                                                _pool_and_iocroot)
+
+    return _pool_and_iocroot["config_version"] == IOCJson.json_get_version()
+
+
 class IOCJson(object):
     """
     Migrates old iocage configurations(UCL and ZFS Props) to the new JSON
@@ -58,7 +345,12 @@ class IOCJson(object):
         self.cli = cli
         self.silent = silent
         self.callback = callback
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        self._written = False
+
+    @property
+    def zfs(self):
+        # Most instances only read config.json, don't touch libzfs for those.
+        return iocage.lib.ioc_zfs.get_zfs()
 
     def json_convert_from_ucl(self):
         """Convert to JSON. Accepts a location to the ucl configuration."""
@@ -165,13 +457,30 @@ class IOCJson(object):
 
     def json_load(self):
         """Load the JSON at the location given. Returns a JSON object."""
+        config = os.path.normpath(f"{self.location}/config.json")
+        identity = _config_identity(config)
+
+        try:
+            cached_identity, cached_conf = _config_cache[config]
+
+            if identity is not None and cached_identity == identity:
+                # Configurations are flat, a shallow copy keeps callers from
+                # mutating the cached entry.
+                return dict(cached_conf)
+        except KeyError:
+            pass
+
         version = self.json_get_version()
         skip = False
+        converted = False
+        self._written = False
 
         try:
             with open(self.location + "/config.json", "r") as conf:
                 conf = json.load(conf)
         except FileNotFoundError:
+            converted = True
+
             if os.path.isfile(self.location + "/config"):
                 self.json_convert_from_ucl()
 
@@ -270,13 +579,24 @@ class IOCJson(object):
                                        f" Please destroy {uuid} and recreate"
                                        " it.")
 
-        try:
-            conf_version = conf["CONFIG_VERSION"]
+        if converted or not _configs_current():
+            try:
+                conf_version = conf["CONFIG_VERSION"]
 
-            if version != conf_version:
+                if version != conf_version:
+                    conf = self.json_check_config(conf)
+            except KeyError:
                 conf = self.json_check_config(conf)
-        except KeyError:
-            conf = self.json_check_config(conf)
+
+        # A migration may have moved or rewritten the file, what is on disk
+        # now is what we return.
+        _config = os.path.normpath(f"{self.location}/config.json")
+
+        if self._written or _config != config:
+            identity = _config_identity(_config)
+
+        if identity is not None:
+            _config_cache[_config] = (identity, dict(conf))
 
         return conf
 
@@ -287,6 +607,27 @@ class IOCJson(object):
             json.dump(data, out, sort_keys=True, indent=4,
                       ensure_ascii=False)
 
+        _config_cache.pop(os.path.normpath(self.location + _file), None)
+        self._written = True
+
+        if _file == "/config.json":
+            self.__json_update_inventory__(data)
+
+    def __json_update_inventory__(self, conf):
+        """Keeps the inventory in step when a jail's configuration changes."""
+        location = os.path.normpath(self.location)
+        parent, _ = os.path.split(location)
+
+        if os.path.basename(parent) not in ("jails", "templates"):
+            return
+
+        _, iocroot = _get_pool_and_iocroot()
+
+        if os.path.dirname(parent) == iocroot:
+            iocage.lib.ioc_inventory.IOCInventory(
+                iocroot, silent=self.silent,
+                callback=self.callback).inventory_update(location, conf)
+
     def _upgrade_pool(self, pool):
         if os.geteuid() != 0:
             raise RuntimeError("Run as root to migrate old pool"
@@ -295,100 +636,124 @@ class IOCJson(object):
         self.zfs_set_property(pool, "org.freebsd.ioc:active", "yes")
         self.zfs_set_property(pool, "comment", "-")
 
-    def json_get_value(self, prop):
-        """Returns a string with the specified prop's value."""
+    def _json_find_pool(self):
+        """Scans every zpool for the one activated for iocage usage."""
         old = False
         zpools = list(map(lambda x: x.name, list(self.zfs.pools)))
+        match = 0
 
-        if prop == "pool":
-            match = 0
-
-            for pool in zpools:
+        for pool in zpools:
 
-                prop_ioc_active = self.zfs_get_property(
-                    pool, "org.freebsd.ioc:active")
-                prop_comment = self.zfs_get_property(pool, "comment")
+            prop_ioc_active = self.zfs_get_property(
+                pool, "org.freebsd.ioc:active")
+            prop_comment = self.zfs_get_property(pool, "comment")
 
-                if prop_ioc_active == "yes":
-                    _dataset = pool
-                    match += 1
-                elif prop_comment == "iocage":
-                    _dataset = pool
-                    match += 1
-                    old = True
+            if prop_ioc_active == "yes":
+                _dataset = pool
+                match += 1
+            elif prop_comment == "iocage":
+                _dataset = pool
+                match += 1
+                old = True
 
-            if match == 1:
-                if old:
-                    self._upgrade_pool(_dataset)
-                return _dataset
+        if match == 1:
+            if old:
+                self._upgrade_pool(_dataset)
+            return _dataset
 
-            elif match >= 2:
+        elif match >= 2:
+            iocage.lib.ioc_common.logit({
+                "level"  : "ERROR",
+                "message": "Pools:"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+            for zpool in zpools:
                 iocage.lib.ioc_common.logit({
                     "level"  : "ERROR",
-                    "message": "Pools:"
+                    "message": f"  {zpool}"
                 },
                     _callback=self.callback,
                     silent=self.silent)
-                for zpool in zpools:
+            raise RuntimeError(f"You have {match} pools marked active"
+                               " for iocage usage.\n Run \"iocage"
+                               f" activate ZPOOL\" on the preferred"
+                               " pool.\n")
+        else:
+            if len(sys.argv) >= 2 and "activate" in sys.argv[1:]:
+                pass
+            else:
+                # We use the first zpool the user has, they are free to
+                # change it.
+                try:
+                    zpool = zpools[0]
+                except IndexError:
                     iocage.lib.ioc_common.logit({
-                        "level"  : "ERROR",
-                        "message": f"  {zpool}"
+                        "level"  : "EXCEPTION",
+                        "message": "No zpools found! Please create one "
+                                   "before using iocage."
                     },
                         _callback=self.callback,
                         silent=self.silent)
-                raise RuntimeError(f"You have {match} pools marked active"
-                                   " for iocage usage.\n Run \"iocage"
-                                   f" activate ZPOOL\" on the preferred"
-                                   " pool.\n")
-            else:
-                if len(sys.argv) >= 2 and "activate" in sys.argv[1:]:
-                    pass
-                else:
-                    # We use the first zpool the user has, they are free to
-                    # change it.
+
+                if os.geteuid() != 0:
+                    raise RuntimeError("Run as root to automatically "
+                                       "activate the first zpool!")
+
+                if zpool == "freenas-boot":
                     try:
-                        zpool = zpools[0]
+                        zpool = zpools[1]
                     except IndexError:
-                        iocage.lib.ioc_common.logit({
-                            "level"  : "EXCEPTION",
-                            "message": "No zpools found! Please create one "
-                                       "before using iocage."
-                        },
-                            _callback=self.callback,
-                            silent=self.silent)
-
-                    if os.geteuid() != 0:
-                        raise RuntimeError("Run as root to automatically "
-                                           "activate the first zpool!")
-
-                    if zpool == "freenas-boot":
-                        try:
-                            zpool = zpools[1]
-                        except IndexError:
-                            raise RuntimeError("Please specify a pool to "
-                                               "activate with iocage activate "
-                                               "POOL")
+                        raise RuntimeError("Please specify a pool to "
+                                           "activate with iocage activate "
+                                           "POOL")
 
-                    iocage.lib.ioc_common.logit({
-                        "level"  : "INFO",
-                        "message": f"Setting up zpool [{zpool}] for"
-                                   " iocage usage\n If you wish to change"
-                                   " please use \"iocage activate\""
-                    },
-                        _callback=self.callback,
-                        silent=self.silent)
+                iocage.lib.ioc_common.logit({
+                    "level"  : "INFO",
+                    "message": f"Setting up zpool [{zpool}] for"
+                               " iocage usage\n If you wish to change"
+                               " please use \"iocage activate\""
+                },
+                    _callback=self.callback,
+                    silent=self.silent)
+
+                self.zfs_set_property(zpool, "org.freebsd.ioc:active",
+                                      "yes")
+                return zpool
+
+    def json_get_value(self, prop):
+        """Returns a string with the specified prop's value."""
+        if prop == "pool":
+            if not _pool_and_iocroot:
+                _pool_and_iocroot.update(_pool_and_iocroot_load())
+
+            if "pool" not in _pool_and_iocroot:
+                pool = self._json_find_pool()
 
-                    self.zfs_set_property(zpool, "org.freebsd.ioc:active",
-                                          "yes")
-                    return zpool
+                if pool is None:
+                    # Only "iocage activate" gets here, nothing to remember.
+                    return pool
 
+                _pool_and_iocroot["pool"] = pool
+
+            return _pool_and_iocroot["pool"]
         elif prop == "iocroot":
             # Location in this case is actually the zpool.
+            if self.location == _pool_and_iocroot.get("pool") and \
+                    "iocroot" in _pool_and_iocroot:
+                return _pool_and_iocroot["iocroot"]
+
             try:
                 loc = f"{self.location}/iocage"
                 mount = self.zfs_get_property(loc, "mountpoint")
 
                 if mount != "none":
+                    if self.location == _pool_and_iocroot.get("pool") and \
+                            os.path.isdir(mount):
+                        _pool_and_iocroot["iocroot"] = mount
+                        iocage.lib.ioc_common.runtime_write(
+                            "pool.json", _pool_and_iocroot)
+
                     return mount
                 else:
                     raise RuntimeError(f"Please set a mountpoint on {loc}")
@@ -409,119 +774,58 @@ class IOCJson(object):
     def json_set_value(self, prop, create_func=False, _import=False,
                        default=False):
         """Set a property for the specified jail."""
-        key, _, value = prop.partition("=")
+        return self.json_set_values([prop], create_func=create_func,
+                                    _import=_import, default=default)
 
-        if not default:
-            conf = self.json_load()
-            old_tag = conf["tag"]
-            uuid = conf["host_hostuuid"]
-            status, jid = iocage.lib.ioc_list.IOCList.list_get_jid(uuid)
-            conf[key] = value
-            sysctls_cmd = ["sysctl", "-d", "security.jail.param"]
-            jail_param_regex = re.compile("security.jail.param.")
-            sysctls_list = su.Popen(sysctls_cmd, stdout=su.PIPE).communicate()[
-                0].decode("utf-8").split()
-            jail_params = [p.replace("security.jail.param.", "").replace(":",
-                                                                         "")
-                           for p in sysctls_list if re.match(jail_param_regex,
-                                                             p)]
-            single_period = ["allow_raw_sockets", "allow_socket_af",
-                             "allow_set_hostname"]
-            if not create_func:
-                if key == "tag":
-                    conf["tag"] = iocage.lib.ioc_create.IOCCreate(
-                        "", prop, 0).create_link(conf["host_hostuuid"], value,
-                                                 old_tag=old_tag)
-                    tag = conf["tag"]
-
-            if key == "template":
-                pool, iocroot = _get_pool_and_iocroot()
-                old_location = f"{pool}/iocage/jails/{uuid}"
-                new_location = f"{pool}/iocage/templates/{old_tag}"
-
-                if status:
-                    iocage.lib.ioc_common.logit({
-                        "level"  : "EXCEPTION",
-                        "message": f"{uuid} ({old_tag}) is running.\nPlease"
-                                   " stop it first!"
-                    },
-                        _callback=self.callback,
-                        silent=self.silent)
+    def json_set_values(self, props, create_func=False, _import=False,
+                        default=False):
+        """
+        Set several key=value properties for the specified jail at once.
+
+        The configuration is loaded, checked and written once, and the
+        properties a running jail can take are applied with a single
+        jail -m.
+        """
+        values = collections.OrderedDict(
+            prop.partition("=")[::2] for prop in props)
+
+        if default:
+            self.__json_set_default_values__(values)
 
-                jails, paths = iocage.lib.ioc_list.IOCList(
-                    "uuid").list_datasets()
-                for j in jails:
-                    _uuid = jails[j]
-                    _path = f"{paths[j]}/root"
-                    t_old_path = f"{old_location}/root@{_uuid}"
-                    t_path = f"{new_location}/root@{_uuid}"
+            return
 
-                    if _uuid == uuid:
-                        continue
+        conf = self.json_load()
+        old_tag = conf["tag"]
+        uuid = conf["host_hostuuid"]
+        status, jid = iocage.lib.ioc_list.IOCList.list_get_jid(uuid)
+        conf.update(values)
+        errors = self.json_check_props(values, conf)
 
-                    origin = self.zfs_get_property(_path, 'origin')
+        if errors:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": "\n".join(errors)
+            },
+                _callback=self.callback,
+                silent=self.silent)
 
-                    if origin == t_old_path or origin == t_path:
-                        _status, _ = iocage.lib.ioc_list.IOCList.list_get_jid(
-                            _uuid)
+        if not create_func and "tag" in values:
+            conf["tag"] = iocage.lib.ioc_create.IOCCreate(
+                "", f"tag={values['tag']}", 0).create_link(
+                conf["host_hostuuid"], values["tag"], old_tag=old_tag)
+            tag = conf["tag"]
 
-                        if _status:
-                            iocage.lib.ioc_common.logit({
-                                "level"  : "EXCEPTION",
-                                "message": f"{uuid} ({old_tag}) is running.\n"
-                                           "Please stop it first!"
-                            },
-                                _callback=self.callback,
-                                silent=self.silent)
+        if "template" in values:
+            self.__json_set_template__(values["template"], conf, uuid,
+                                       old_tag, status, _import)
 
-                if value == "yes":
-                    try:
-                        self.zfs.get_dataset(old_location).rename(new_location)
-                        conf["type"] = "template"
-
-                        self.location = new_location.lstrip(pool).replace(
-                            "/iocage", iocroot)
-
-                        iocage.lib.ioc_common.logit({
-                            "level"  : "INFO",
-                            "message": f"{uuid} ({old_tag}) converted to a"
-                                       " template."
-                        },
-                            _callback=self.callback,
-                            silent=self.silent)
-                        self.lgr.disabled = True
-                    except libzfs.ZFSException:
-                        iocage.lib.ioc_common.logit({
-                            "level"  : "EXCEPTION",
-                            "message": "A template by that name already"
-                                       " exists!"
-                        },
-                            _callback=self.callback,
-                            silent=self.silent)
-
-                elif value == "no":
-                    if not _import:
-                        self.zfs.get_dataset(new_location).rename(old_location)
-                        conf["type"] = "jail"
-                        self.location = old_location.lstrip(pool).replace(
-                            "/iocage", iocroot)
-
-                        iocage.lib.ioc_common.logit({
-                            "level"  : "INFO",
-                            "message": f"{uuid} ({old_tag}) converted to a"
-                                       " jail."
-                        },
-                            _callback=self.callback,
-                            silent=self.silent)
-                        self.lgr.disabled = True
-        else:
-            _, iocroot = _get_pool_and_iocroot()
-            with open(f"{iocroot}/defaults.json", "r") as default_json:
-                conf = json.load(default_json)
+        for key, value in values.items():
+            if key in _ZFS_PROPS:
+                self.json_set_zfs_prop(key, value, conf)
 
-        if not default:
-            self.json_check_prop(key, value, conf)
-            self.json_write(conf)
+        self.json_write(conf)
+
+        for key, value in values.items():
             iocage.lib.ioc_common.logit({
                 "level"  : "INFO",
                 "message":
@@ -530,54 +834,249 @@ class IOCJson(object):
                 _callback=self.callback,
                 silent=self.silent)
 
-            # Used for import
-            if not create_func:
-                if key == "tag":
-                    return tag
+        # We can attempt to set the properties in realtime to the jail.
+        if status:
+            self.__json_apply_live__(values, conf, jid)
 
-            # We can attempt to set a property in realtime to jail.
-            if status:
-                if key in single_period:
-                    key = key.replace("_", ".", 1)
-                else:
-                    key = key.replace("_", ".")
+        # Used for import
+        if not create_func and "tag" in values:
+            return tag
 
-                if key in jail_params:
-                    if conf["vnet"] == "on" and key == "ip4.addr" or key == \
-                            "ip6.addr":
-                        return
-                    try:
-                        ip = True if key == "ip4.addr" or key == "ip6.addr" \
-                            else False
-                        if ip and value == "none":
-                            return
-
-                        iocage.lib.ioc_common.checkoutput(
-                            ["jail", "-m", f"jid={jid}",
-                             f"{key}={value}"],
-                            stderr=su.STDOUT)
-                    except su.CalledProcessError as err:
-                        raise RuntimeError(
-                            f"{err.output.decode('utf-8').rstrip()}")
-        else:
-            if key in conf:
-                conf[key] = value
-                self.json_write(conf, "/defaults.json")
+    def __json_apply_live__(self, values, conf, jid):
+        """Sets the jail parameters among values on the running jail."""
+        jail_params = iocage.lib.ioc_host.get_host_fact("jail_params")
+        single_period = ["allow_raw_sockets", "allow_socket_af",
+                         "allow_set_hostname"]
+        params = []
+
+        for key, value in values.items():
+            if key in single_period:
+                key = key.replace("_", ".", 1)
+            else:
+                key = key.replace("_", ".")
+
+            if key not in jail_params:
+                continue
+
+            # A VNET jail configures its addresses itself.
+            if conf["vnet"] == "on" and key in ("ip4.addr", "ip6.addr"):
+                continue
+
+            if key in ("ip4.addr", "ip6.addr") and value == "none":
+                continue
+
+            params.append(f"{key}={value}")
+
+        if not params:
+            return
+
+        try:
+            iocage.lib.ioc_common.checkoutput(
+                ["jail", "-m", f"jid={jid}"] + params, stderr=su.STDOUT)
+        except su.CalledProcessError as err:
+            raise RuntimeError(f"{err.output.decode('utf-8').rstrip()}")
+
+    def __json_set_template__(self, value, conf, uuid, old_tag, status,
+                              _import):
+        """Moves the jail between the jails and templates datasets."""
+        pool, iocroot = _get_pool_and_iocroot()
+        old_location = f"{pool}/iocage/jails/{uuid}"
+        new_location = f"{pool}/iocage/templates/{old_tag}"
+
+        if status:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": f"{uuid} ({old_tag}) is running.\nPlease"
+                           " stop it first!"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        jails, paths = iocage.lib.ioc_list.IOCList(
+            "uuid").list_datasets()
+        for j in jails:
+            _uuid = jails[j]
+            _path = f"{paths[j]}/root"
+            t_old_path = f"{old_location}/root@{_uuid}"
+            t_path = f"{new_location}/root@{_uuid}"
+
+            if _uuid == uuid:
+                continue
+
+            origin = self.zfs_get_property(_path, 'origin')
+
+            if origin == t_old_path or origin == t_path:
+                _status, _ = iocage.lib.ioc_list.IOCList.list_get_jid(
+                    _uuid)
+
+                if _status:
+                    iocage.lib.ioc_common.logit({
+                        "level"  : "EXCEPTION",
+                        "message": f"{uuid} ({old_tag}) is running.\n"
+                                   "Please stop it first!"
+                    },
+                        _callback=self.callback,
+                        silent=self.silent)
+
+        if value == "yes":
+            try:
+                self.zfs.get_dataset(old_location).rename(new_location)
+                conf["type"] = "template"
+
+                self.location = new_location.lstrip(pool).replace(
+                    "/iocage", iocroot)
 
                 iocage.lib.ioc_common.logit({
                     "level"  : "INFO",
-                    "message":
-                        f"Default Property: {key} has been updated to {value}"
+                    "message": f"{uuid} ({old_tag}) converted to a"
+                               " template."
                 },
                     _callback=self.callback,
                     silent=self.silent)
-            else:
+                self.lgr.disabled = True
+            except libzfs.ZFSException:
                 iocage.lib.ioc_common.logit({
                     "level"  : "EXCEPTION",
-                    "message": f"{key} is not a valid property for default!"
+                    "message": "A template by that name already"
+                               " exists!"
+                },
+                    _callback=self.callback,
+                    silent=self.silent)
+
+        elif value == "no":
+            if not _import:
+                self.zfs.get_dataset(new_location).rename(old_location)
+                conf["type"] = "jail"
+                self.location = old_location.lstrip(pool).replace(
+                    "/iocage", iocroot)
+
+                iocage.lib.ioc_common.logit({
+                    "level"  : "INFO",
+                    "message": f"{uuid} ({old_tag}) converted to a"
+                               " jail."
                 },
                     _callback=self.callback,
                     silent=self.silent)
+                self.lgr.disabled = True
+
+    def __json_set_default_values__(self, values):
+        """Sets properties in defaults.json."""
+        _, iocroot = _get_pool_and_iocroot()
+        with open(f"{iocroot}/defaults.json", "r") as default_json:
+            conf = json.load(default_json)
+
+        invalid = [key for key in values if key not in conf]
+
+        if invalid:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": "\n".join(f"{key} is not a valid property for"
+                                     " default!" for key in invalid)
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        conf.update(values)
+        self.json_write(conf, "/defaults.json")
+
+        for key, value in values.items():
+            iocage.lib.ioc_common.logit({
+                "level"  : "INFO",
+                "message":
+                    f"Default Property: {key} has been updated to {value}"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+    def json_migrate(self):
+        """
+        Brings the configuration to the current version, even when the pool
+        is marked as migrated. Used for configurations from elsewhere.
+        """
+        conf = self.json_load()
+
+        if conf.get("CONFIG_VERSION") != self.json_get_version():
+            conf = self.json_check_config(conf)
+
+        return conf
+
+    def json_migrate_all(self, jobs=None):
+        """
+        Migrates the configuration of every jail and template, then marks
+        the pool so json_load() no longer checks them one by one.
+
+        Configurations that first need converting from UCL or ZFS
+        properties are done one at a time, the JSON ones by a pool of
+        jobs workers.
+        """
+        pool, iocroot = _get_pool_and_iocroot()
+        version = self.json_get_version()
+        convert = []
+        migrate = []
+        failed = []
+
+        # The marker would let json_load() skip the very checks we want. With
+        # the pool and iocroot resolved above, the workers don't look up
+        # either through libzfs.
+        _pool_and_iocroot["config_version"] = None
+
+        for location in ("jails", "templates"):
+            try:
+                names = sorted(os.listdir(f"{iocroot}/{location}"))
+            except OSError:
+                continue
+
+            for name in names:
+                path = f"{iocroot}/{location}/{name}"
+
+                if os.path.isfile(f"{path}/config.json"):
+                    migrate.append(path)
+                elif os.path.isdir(path):
+                    convert.append(path)
+
+        def _migrate(path):
+            return IOCJson(path, silent=True,
+                           callback=self.callback).json_migrate()
+
+        for path in convert:
+            try:
+                _migrate(path)
+            except (RuntimeError, OSError, ValueError, KeyError) as err:
+                failed.append((path, err))
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=jobs) as executor:
+            futures = {executor.submit(_migrate, p): p for p in migrate}
+
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except (RuntimeError, OSError, ValueError, KeyError) as err:
+                    failed.append((futures[future], err))
+
+        for path, err in sorted(failed, key=lambda f: f[0]):
+            iocage.lib.ioc_common.logit({
+                "level"  : "ERROR",
+                "message": f"{path}: {err}"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        if failed:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": f"{len(failed)} configurations could not be"
+                           " migrated, the pool was not marked as"
+                           f" version {version}."
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        self.zfs_set_property(f"{pool}/iocage", CONFIG_VERSION_PROP, version)
+        _pool_and_iocroot["config_version"] = version
+        iocage.lib.ioc_common.runtime_write("pool.json", _pool_and_iocroot)
+
+        return len(convert) + len(migrate)
 
     @staticmethod
     def json_get_version():
@@ -678,207 +1177,63 @@ class IOCJson(object):
 
         return conf
 
-    def json_check_prop(self, key, value, conf):
+    def json_check_props(self, props, conf):
         """
-        Checks if the property matches known good values, if it's the
-        CLI, deny setting any properties not in this list.
+        Checks every property against the schema, returns a list with an
+        error message for each bad one. If it's the CLI, properties not in
+        the schema are refused.
         """
-        props = {
-            # Network properties
-            "interfaces"           : (":", ","),
-            "host_domainname"      : ("string",),
-            "host_hostname"        : ("string",),
-            "exec_fib"             : ("string",),
-            "ip4_addr"             : ("|",),
-            "ip4_saddrsel"         : ("0", "1",),
-            "ip4"                  : ("new", "inherit", "none"),
-            "ip6_addr"             : ("|",),
-            "ip6_saddrsel"         : ("0", "1"),
-            "ip6"                  : ("new", "inherit", "none"),
-            "defaultrouter"        : ("string",),
-            "defaultrouter6"       : ("string",),
-            "resolver"             : ("string",),
-            "mac_prefix"           : ("string",),
-            "vnet0_mac"            : ("string",),
-            "vnet1_mac"            : ("string",),
-            "vnet2_mac"            : ("string",),
-            "vnet3_mac"            : ("string",),
-            # Jail Properties
-            "devfs_ruleset"        : ("string",),
-            "exec_start"           : ("string",),
-            "exec_stop"            : ("string",),
-            "exec_prestart"        : ("string",),
-            "exec_poststart"       : ("string",),
-            "exec_prestop"         : ("string",),
-            "exec_poststop"        : ("string",),
-            "exec_clean"           : ("0", "1"),
-            "exec_timeout"         : ("string",),
-            "stop_timeout"         : ("string",),
-            "exec_jail_user"       : ("string",),
-            "exec_system_jail_user": ("string",),
-            "exec_system_user"     : ("string",),
-            "mount_devfs"          : ("0", "1"),
-            "mount_fdescfs"        : ("0", "1"),
-            "enforce_statfs"       : ("0", "1", "2"),
-            "children_max"         : ("string",),
-            "login_flags"          : ("string",),
-            "securelevel"          : ("string",),
-            "sysvmsg"              : ("new", "inherit", "disable"),
-            "sysvsem"              : ("new", "inherit", "disable"),
-            "sysvshm"              : ("new", "inherit", "disable"),
-            "allow_set_hostname"   : ("0", "1"),
-            "allow_sysvipc"        : ("0", "1"),
-            "allow_raw_sockets"    : ("0", "1"),
-            "allow_chflags"        : ("0", "1"),
-            "allow_mount"          : ("0", "1"),
-            "allow_mount_devfs"    : ("0", "1"),
-            "allow_mount_nullfs"   : ("0", "1"),
-            "allow_mount_procfs"   : ("0", "1"),
-            "allow_mount_tmpfs"    : ("0", "1"),
-            "allow_mount_zfs"      : ("0", "1"),
-            "allow_quotas"         : ("0", "1"),
-            "allow_socket_af"      : ("0", "1"),
-            # RCTL limits
-            "cpuset"               : ("off", "on"),
-            "rlimits"              : ("off", "on"),
-            "memoryuse"            : ":",
-            "memorylocked"         : ("off", "on"),
-            "vmemoryuse"           : ("off", "on"),
-            "maxproc"              : ("off", "on"),
-            "cputime"              : ("off", "on"),
-            "pcpu"                 : ":",
-            "datasize"             : ("off", "on"),
-            "stacksize"            : ("off", "on"),
-            "coredumpsize"         : ("off", "on"),
-            "openfiles"            : ("off", "on"),
-            "pseudoterminals"      : ("off", "on"),
-            "swapuse"              : ("off", "on"),
-            "nthr"                 : ("off", "on"),
-            "msgqqueued"           : ("off", "on"),
-            "msgqsize"             : ("off", "on"),
-            "nmsgq"                : ("off", "on"),
-            "nsemop"               : ("off", "on"),
-            "nshm"                 : ("off", "on"),
-            "shmsize"              : ("off", "on"),
-            "wallclock"            : ("off", "on"),
-            # Custom properties
-            "tag"                  : ("string",),
-            "bpf"                  : ("off", "on"),
-            "dhcp"                 : ("off", "on"),
-            "boot"                 : ("off", "on"),
-            "notes"                : ("string",),
-            "owner"                : ("string",),
-            "priority"             : str(tuple(range(1, 100))),
-            "hostid"               : ("string",),
-            "jail_zfs"             : ("off", "on"),
-            "jail_zfs_dataset"     : ("string",),
-            "jail_zfs_mountpoint"  : ("string",),
-            "mount_procfs"         : ("0", "1"),
-            "mount_linprocfs"      : ("0", "1"),
-            "vnet"                 : ("off", "on"),
-            "template"             : ("no", "yes"),
-            "comment"              : ("string",),
-            "host_time"            : ("no", "yes"),
-            "depends"              : ("string",)
-        }
-
-        zfs_props = {
-            # ZFS Props
-            "compression"  : "lz4",
-            "origin"       : "readonly",
-            "quota"        : "none",
-            "mountpoint"   : "readonly",
-            "compressratio": "readonly",
-            "available"    : "readonly",
-            "used"         : "readonly",
-            "dedup"        : "off",
-            "reservation"  : "none",
-        }
-
-        if key in zfs_props.keys():
-            pool, _ = _get_pool_and_iocroot()
+        errors = []
 
-            if conf["template"] == "yes":
-                _type = "templates"
-                uuid = conf["tag"]  # I know, but it's easier this way.
-            else:
-                _type = "jails"
-                uuid = conf["host_hostuuid"]
-
-            if key == "quota":
-                if value != "none" and not value.upper().endswith(("M", "G",
-                                                                   "T")):
-                    err = f"{value} should have a suffix ending in" \
-                          " M, G, or T."
-                    iocage.lib.ioc_common.logit({
-                        "level"  : "EXCEPTION",
-                        "message": err
-                    },
-                        _callback=self.callback,
-                        silent=self.silent)
+        for key, value in props.items():
+            try:
+                check = _PROPS[key]
+            except KeyError:
+                if self.cli:
+                    errors.append(f"{key} cannot be changed by the user.")
+                elif key not in conf.keys():
+                    errors.append(f"{key} is not a valid property!")
 
-            self.zfs_set_property(f"{pool}/iocage/{_type}/{uuid}", key, value)
+                continue
 
-        elif key in props.keys():
-            # Either it contains what we expect, or it's a string.
-            for k in props[key]:
-                if k in value:
-                    return
+            error = check(key, value)
 
-            if props[key][0] == "string":
-                return
-            else:
-                if key == "ip4_addr" or key == "ip6_addr" and value == "none":
-                    err = ""
-                else:
-                    err = f"{value} is not a valid value for {key}.\n"
-
-                if key not in ("interfaces", "ip4_addr", "ip6_addr",
-                               "memoryuse"):
-                    msg = f"Value must be {' or '.join(props[key])}"
-
-                elif key == "ip4_addr":
-                    msg = "IP address must contain both an interface and IP " \
-                          "address.\nEXAMPLE: em0|192.168.1.10"
-
-                    if value == "none":
-                        return
-                elif key == "ip6_addr":
-                    msg = "IP address must contain both an interface and IP " \
-                          "address.\nEXAMPLE: em0|fe80::5400:ff:fe54:1"
-
-                    if value == "none":
-                        return
-                elif key == "interfaces":
-                    msg = "Interfaces must be specified as a pair.\n" \
-                          "EXAMPLE: vnet0:bridge0, vnet1:bridge1"
-                elif key == "memoryuse":
-                    msg = "memoryuse requires at minimum a pair.\nEXAMPLE: " \
-                          "8g:log"
-
-                msg = err + msg
-                iocage.lib.ioc_common.logit({
-                    "level"  : "EXCEPTION",
-                    "message": msg
-                },
-                    _callback=self.callback,
-                    silent=self.silent)
-        else:
-            if self.cli:
-                msg = f"{key} cannot be changed by the user."
-            else:
-                if key not in conf.keys():
-                    msg = f"{key} is not a valid property!"
-                else:
-                    return
+            if error:
+                errors.append(error)
+
+        return errors
+
+    def json_check_prop(self, key, value, conf):
+        """
+        Checks if the property matches known good values, ZFS properties
+        are then set on the jail's dataset.
+        """
+        errors = self.json_check_props({key: value}, conf)
 
+        if errors:
             iocage.lib.ioc_common.logit({
                 "level"  : "EXCEPTION",
-                "message": msg
+                "message": errors[0]
             },
                 _callback=self.callback,
                 silent=self.silent)
 
+        if key in _ZFS_PROPS:
+            self.json_set_zfs_prop(key, value, conf)
+
+    def json_set_zfs_prop(self, key, value, conf):
+        """Sets an already checked ZFS property on the jail's dataset."""
+        pool, _ = _get_pool_and_iocroot()
+
+        if conf["template"] == "yes":
+            _type = "templates"
+            uuid = conf["tag"]  # I know, but it's easier this way.
+        else:
+            _type = "jails"
+            uuid = conf["host_hostuuid"]
+
+        self.zfs_set_property(f"{pool}/iocage/{_type}/{uuid}", key, value)
+
     def json_plugin_load(self):
         try:
             with open(f"{self.location}/plugin/settings.json", "r") as \
@@ -22,14 +22,346 @@
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """List all datasets by type"""
+import bisect
+import collections
+import concurrent.futures
+import fnmatch
+import ipaddress
+import itertools
+import json
+import os
 import re
+import shlex
 import subprocess as su
+import threading
+import time
 
-import libzfs
 import texttable
 
 import iocage.lib.ioc_common
+import iocage.lib.ioc_inventory
 import iocage.lib.ioc_json
+import iocage.lib.ioc_zfs
+
+
+# Every configuration lives on its own dataset, reading them is I/O bound so
+# a cold cache is best hidden by several readers. IOCAGE_WORKERS overrides.
+try:
+    LOAD_WORKERS = int(os.environ.get("IOCAGE_WORKERS", 0))
+except ValueError:
+    LOAD_WORKERS = 0
+
+LOAD_WORKERS = LOAD_WORKERS or min(32, (os.cpu_count() or 1) + 4)
+
+LIST_FULL_HEADER = ["JID", "UUID", "BOOT", "STATE", "TAG", "TYPE", "RELEASE",
+                    "IP4", "IP6", "TEMPLATE"]
+LIST_SHORT_HEADER = ["JID", "UUID", "STATE", "TAG", "RELEASE", "IP4"]
+
+JLS_PARAMS = ["jid", "name", "path", "ip4.addr", "ip6.addr"]
+# A jail without addresses may leave those out, never these.
+JLS_REQUIRED = ("jid", "name", "path")
+
+# Seconds a jls snapshot is trusted. Long running library users, e.g.
+# AsyncIOCage or iocaged, see jails another process started or stopped after
+# at most this long.
+JAIL_STATE_TTL = 2
+
+# {name: {"jid", "name", "path", "ip4.addr", "ip6.addr"}} of every running
+# jail, taken with a single jls and shared by the calls of one command until
+# a jail starts or stops, or JAIL_STATE_TTL passes.
+_jail_state = None
+_jail_state_taken = 0.0
+_jail_state_lock = threading.Lock()
+
+
+def _jls_libxo():
+    out = iocage.lib.ioc_common.checkoutput(
+        ["jls", "--libxo", "json"] + JLS_PARAMS, stderr=su.PIPE)
+    jails = json.loads(out)["jail-information"]["jail"]
+    state = []
+
+    for jail in jails:
+        missing = [p for p in JLS_REQUIRED if p not in jail]
+
+        if missing:
+            # Not the keys we know, rather than calling every jail down let
+            # get_jail_state() fall back to the plain output.
+            raise KeyError(", ".join(missing))
+
+        entry = {}
+
+        for param in JLS_PARAMS:
+            value = jail.get(param, "")
+
+            if isinstance(value, list):
+                value = ",".join(str(v) for v in value)
+
+            entry[param] = str(value)
+
+        state.append(entry)
+
+    return state
+
+
+def _jls_plain():
+    """For a jls without libxo, one name=value line per jail."""
+    out = iocage.lib.ioc_common.checkoutput(
+        ["jls", "-n", "-q"] + JLS_PARAMS, stderr=su.PIPE)
+    state = []
+
+    for line in out.splitlines():
+        entry = dict.fromkeys(JLS_PARAMS, "")
+
+        for pair in shlex.split(line):
+            key, _, value = pair.partition("=")
+
+            if key in entry:
+                entry[key] = value
+
+        state.append(entry)
+
+    return state
+
+
+def get_jail_state():
+    """
+    Returns the runtime state of every running jail keyed by jail name, as
+    of one jls per command, see JAIL_STATE_TTL.
+    """
+    global _jail_state, _jail_state_taken
+
+    with _jail_state_lock:
+        if _jail_state is None or \
+                time.monotonic() - _jail_state_taken > JAIL_STATE_TTL:
+            try:
+                try:
+                    jails = _jls_libxo()
+                except (su.CalledProcessError, ValueError, KeyError,
+                        TypeError):
+                    jails = _jls_plain()
+            except (su.CalledProcessError, OSError):
+                jails = []
+
+            _jail_state = {j["name"]: j for j in jails}
+            _jail_state_taken = time.monotonic()
+
+        return _jail_state
+
+
+def invalidate_jail_state():
+    """
+    Forgets the jail state, for after a jail was created or removed and at
+    the start of every library call.
+    """
+    global _jail_state
+
+    with _jail_state_lock:
+        _jail_state = None
+
+
+def parse_filters(filters, callback=None, silent=False):
+    """Returns {key: pattern} for each "key=pattern" in filters."""
+    parsed = collections.OrderedDict()
+
+    for _filter in filters or ():
+        key, sep, pattern = _filter.partition("=")
+
+        if not sep or not key:
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": f"Invalid filter: {_filter}, use KEY=VALUE, e.g."
+                           " state=up or tag='web*'"
+            },
+                _callback=callback,
+                silent=silent)
+
+        parsed[key] = pattern
+
+    return parsed
+
+
+def _filter_match(value, pattern):
+    """A list, e.g. an entry's depends or macs, matches if a member does."""
+    if isinstance(value, (list, tuple)):
+        return any(fnmatch.fnmatchcase(str(v), pattern) for v in value)
+
+    return fnmatch.fnmatchcase(str(value), pattern)
+
+
+def filter_entries(entries, filters, callback=None, silent=False):
+    """
+    Returns the inventory entries matching every filter, keeping their order.
+    Each key is answered by the cheapest source that has it: the entry
+    itself, then the jail's configuration and finally the running state, so
+    an entry ruled out early never has its configuration read nor its state
+    queried. Values are matched as fnmatch(3) patterns, those of a list
+    member by member.
+    """
+    entries = list(entries)
+
+    if not filters:
+        return entries
+
+    selected = []
+
+    for entry in entries:
+        conf_keys = [k for k in filters if k != "state" and k not in entry]
+
+        if not all(_filter_match(entry[k], filters[k])
+                   for k in filters if k != "state" and k in entry):
+            continue
+
+        if conf_keys:
+            conf = iocage.lib.ioc_json.IOCJson(
+                entry["path"], silent=silent,
+                callback=callback).json_load()
+
+            if any(k not in conf
+                   or not _filter_match(conf[k], filters[k])
+                   for k in conf_keys):
+                continue
+
+        selected.append(entry)
+
+    if "state" in filters and selected:
+        running = get_jail_state()
+        selected = [
+            e for e in selected if fnmatch.fnmatchcase(
+                "up" if f"ioc-{e['uuid']}" in running else "down",
+                filters["state"])
+        ]
+
+    return selected
+
+
+class JailRecord(object):
+    """
+    One jail as listed by IOCList. Fields are typed, jid is an int or None
+    when the jail is down, and the addresses are parsed once for sorting.
+
+    A record still reads like the rows it replaces: indexing, iterating and
+    len() see the columns of `iocage list`, or of `iocage list -l` when full.
+    """
+
+    __slots__ = ("jid", "uuid", "boot", "state", "tag", "type", "release",
+                 "short_release", "ip4", "short_ip4", "ip6", "template",
+                 "full", "_ip4_key", "_ip6_key")
+
+    def __init__(self, jid, uuid, boot, state, tag, jail_type, release,
+                 short_release, ip4, short_ip4, ip6, template, full=False):
+        self.jid = jid
+        self.uuid = uuid
+        self.boot = boot
+        self.state = state
+        self.tag = tag
+        self.type = jail_type
+        self.release = release
+        self.short_release = short_release
+        self.ip4 = ip4
+        self.short_ip4 = short_ip4
+        self.ip6 = ip6
+        self.template = template
+        self.full = full
+        self._ip4_key = self.__ip_key__(ip4)
+        self._ip6_key = self.__ip_key__(ip6)
+
+    @staticmethod
+    def __ip_key__(addrs):
+        """Orders by the first address, anything unparsable goes last."""
+        addr = addrs.split(",", 1)[0].rpartition("|")[2].split("/", 1)[0]
+
+        try:
+            return 0, int(ipaddress.ip_address(addr))
+        except ValueError:
+            return 1, 0
+
+    def __columns__(self):
+        jid = "-" if self.jid is None else str(self.jid)
+
+        if self.full:
+            return (jid, self.uuid, self.boot, self.state, self.tag,
+                    self.type, self.release, self.ip4, self.ip6,
+                    self.template)
+
+        return (jid, self.uuid[:8], self.state, self.tag, self.short_release,
+                self.short_ip4)
+
+    def __getitem__(self, index):
+        return self.__columns__()[index]
+
+    def __iter__(self):
+        return iter(self.__columns__())
+
+    def __len__(self):
+        return 10 if self.full else 6
+
+    def __repr__(self):
+        return f"JailRecord({', '.join(map(repr, self))})"
+
+    @staticmethod
+    def sort_key(s_type):
+        """
+        Returns the key function ordering records by s_type, which
+        ioc_common.ioc_sort() has already validated.
+        """
+        return _RECORD_SORT_KEYS[(s_type or "tag").lower()]
+
+
+def _release_key(record):
+    version = record.short_release.split("-", 1)[0]
+
+    return tuple(int(v) if v.isdigit() else 0
+                 for v in version.split(".")), record.short_release
+
+
+_RECORD_SORT_KEYS = {
+    # Running jails by JID on top, then the rest.
+    "jid"     : lambda r: (r.jid is None, r.jid or 0),
+    "uuid"    : lambda r: r.uuid,
+    "boot"    : lambda r: r.boot == "off",
+    "state"   : lambda r: r.state == "down",
+    "tag"     : lambda r: iocage.lib.ioc_common.sort_name(r.tag),
+    "type"    : lambda r: r.type,
+    "release" : _release_key,
+    "ip4"     : lambda r: r._ip4_key,
+    "ip6"     : lambda r: r._ip6_key,
+    "template": lambda r: (r.template == "-",
+                           iocage.lib.ioc_common.sort_name(r.template))
+}
+
+
+class IOCJailIndex(object):
+    """
+    Answers which jails a user supplied name refers to, a tag or the
+    start of a UUID, without going through every jail.
+
+    Built once from the {tag: uuid} mapping of list_datasets("uuid"), the
+    UUIDs are kept sorted so their prefix matches are found by bisection.
+    """
+
+    def __init__(self, jails):
+        self.tags = dict(jails)
+        self.uuids = sorted((uuid, tag) for (tag, uuid) in jails.items())
+        self._keys = [uuid for (uuid, _) in self.uuids]
+
+    def match(self, name):
+        """
+        Returns {tag: uuid} of every jail whose UUID starts with name or
+        whose tag is name.
+        """
+        matches = {}
+        start = bisect.bisect_left(self._keys, name)
+
+        for uuid, tag in self.uuids[start:]:
+            if not uuid.startswith(name):
+                break
+
+            matches[tag] = uuid
+
+        if name in self.tags:
+            matches[name] = self.tags[name]
+
+        return matches
 
 
 class IOCList(object):
@@ -41,60 +373,72 @@ class IOCList(object):
     """
 
     def __init__(self, lst_type="all", hdr=True, full=False, _sort=None,
-                 silent=False, callback=None, plugin=False):
+                 silent=False, callback=None, plugin=False, workers=None,
+                 filters=None):
         self.list_type = lst_type
         self.header = hdr
         self.full = full
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
+        self.zfs = iocage.lib.ioc_zfs.get_zfs(history=False)
         self.sort = _sort
         self.silent = silent
         self.callback = callback
         self.plugin = plugin
+        self.workers = workers or LOAD_WORKERS
+        self.filters = filters
 
     def list_datasets(self, set=False):
         """Lists the datasets of given type."""
 
-        if self.list_type == "all" or self.list_type == "uuid":
-            ds = self.zfs.get_dataset(f"{self.pool}/iocage/jails").children
+        if self.list_type in ("all", "template"):
+            ds, datasets = self.__list_jail_datasets__()
         elif self.list_type == "base":
+            if self.filters:
+                iocage.lib.ioc_common.logit({
+                    "level"  : "EXCEPTION",
+                    "message": "Filters only apply to jails and templates,"
+                               " not to bases!"
+                },
+                    _callback=self.callback,
+                    silent=self.silent)
+
             ds = self.zfs.get_dataset(f"{self.pool}/iocage/releases").children
-        elif self.list_type == "template":
-            ds = self.zfs.get_dataset(
-                f"{self.pool}/iocage/templates").children
 
         if self.list_type == "all":
-            _all = self.list_all(ds)
+            _all = self.list_all(ds, datasets)
 
             return _all
         elif self.list_type == "uuid":
             jails = {}
             paths = {}
             dups = {}
+            entries = sorted(iocage.lib.ioc_inventory.IOCInventory(
+                self.iocroot, silent=self.silent,
+                callback=self.callback).inventory_load().values(),
+                key=lambda e: e["path"])
 
-            for jail in ds:
-                jail = jail.properties["mountpoint"].value
-                conf = iocage.lib.ioc_json.IOCJson(jail).json_load()
+            for entry in entries:
+                if entry["location"] != "jails":
+                    continue
 
-                if not set and conf["tag"] in jails:
-                    # Add the original in
-                    dups[paths[conf["tag"]]] = conf["tag"]
-                    dups[jail] = conf["tag"]
-                    tag = conf["tag"]
+                jail = entry["path"]
 
-                jails[conf["tag"]] = conf["host_hostuuid"]
-                paths[conf["tag"]] = jail
+                if not set and entry["tag"] in jails:
+                    # Add the original in
+                    dups[paths[entry["tag"]]] = entry["tag"]
+                    dups[jail] = entry["tag"]
+                    tag = entry["tag"]
 
-            template_datasets = self.zfs.get_dataset(
-                f"{self.pool}/iocage/templates")
-            template_datasets = template_datasets.children
+                jails[entry["tag"]] = entry["uuid"]
+                paths[entry["tag"]] = jail
 
-            for template in template_datasets:
-                template = template.properties["mountpoint"].value
-                conf = iocage.lib.ioc_json.IOCJson(template).json_load()
+            for entry in entries:
+                if entry["location"] != "templates":
+                    continue
 
-                jails[f"{conf['tag']} (template)"] = conf["host_hostuuid"]
-                paths[f"{conf['tag']} (template)"] = template
+                jails[f"{entry['tag']} (template)"] = entry["uuid"]
+                paths[f"{entry['tag']} (template)"] = entry["path"]
 
             if len(dups):
                 iocage.lib.ioc_common.logit({
@@ -127,20 +471,85 @@ class IOCList(object):
 
             return bases
         elif self.list_type == "template":
-            templates = self.list_all(ds)
+            templates = self.list_all(ds, datasets)
 
             return templates
 
-    def list_all(self, jails):
-        """List all jails."""
+    def __list_jail_datasets__(self):
+        """
+        Returns the sorted jail or template dataset names that pass
+        self.filters and the properties of every dataset in the pool.
+        """
+        datasets = iocage.lib.ioc_zfs.prefetch_datasets(self.pool)
+        parent = "jails" if self.list_type == "all" else "templates"
+        parent = f"{self.pool}/iocage/{parent}"
+        ds = sorted(d for d in datasets if d.rpartition("/")[0] == parent)
+
+        if self.filters:
+            entries = iocage.lib.ioc_inventory.IOCInventory(
+                self.iocroot, silent=self.silent,
+                callback=self.callback).inventory_load()
+            mountpoints = [datasets[d]["mountpoint"] for d in ds]
+            selected = {e["path"] for e in filter_entries(
+                (entries[m] for m in mountpoints if m in entries),
+                self.filters, callback=self.callback, silent=self.silent)}
+            ds = [d for d in ds if datasets[d]["mountpoint"] in selected]
+
+        return ds, datasets
+
+    def list_iter_configs(self, paths):
+        """
+        Yields (path, configuration) in the order of paths, read by up to
+        self.workers readers. At most a couple of reads per worker are
+        in flight, so the caller sees the first ones straight away.
+        """
+        paths = iter(paths)
+
+        def _load(path):
+            return path, iocage.lib.ioc_json.IOCJson(
+                path, silent=self.silent, callback=self.callback).json_load()
+
+        if self.workers <= 1:
+            yield from map(_load, paths)
+
+            return
+
+        # The pool, iocroot and config_version marker are looked up through
+        # libzfs, do it once here rather than in whichever worker is first.
+        iocage.lib.ioc_json._configs_current()
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers) as executor:
+            pending = collections.deque(
+                executor.submit(_load, p)
+                for p in itertools.islice(paths, self.workers * 2))
+
+            while pending:
+                path, conf = pending.popleft().result()
+
+                for p in itertools.islice(paths, 1):
+                    pending.append(executor.submit(_load, p))
+
+                yield path, conf
+
+    def list_load_configs(self, paths):
+        """
+        Loads the configuration at each path with up to self.workers
+        readers, returns them in the order of paths.
+        """
+        return collections.OrderedDict(self.list_iter_configs(paths))
+
+    def list_rows(self, jails, datasets):
+        """
+        Yields a row for each of the jails as soon as it is inspected, given
+        their dataset names and the properties prefetched by
+        ioc_zfs.prefetch_datasets().
+        """
         self.full = True if self.plugin else self.full
-        table = texttable.Texttable(max_width=0)
-        jail_list = []
-
-        for jail in jails:
-            mountpoint = jail.properties["mountpoint"].value
-            conf = iocage.lib.ioc_json.IOCJson(mountpoint).json_load()
+        mountpoints = {datasets[j]["mountpoint"]: j for j in jails}
 
+        for mountpoint, conf in self.list_iter_configs(mountpoints):
+            jail = mountpoints[mountpoint]
             uuid = conf["host_hostuuid"]
             full_ip4 = conf["ip4_addr"]
             ip6 = conf["ip6_addr"]
@@ -178,11 +587,10 @@ class IOCList(object):
             if conf["type"] == "template":
                 template = "-"
             else:
-                jail_root = self.zfs.get_dataset(f"{jail.name}/root")
-                _origin_property = jail_root.properties["origin"]
+                template = datasets.get(f"{jail}/root", {}).get(
+                    "origin", "-")
 
-                if _origin_property and _origin_property.value != "":
-                    template = jail_root.properties["origin"].value
+                if template not in ("", "-"):
                     template = template.rsplit("/root@", 1)[0].rsplit(
                         "/", 1)[-1]
                 else:
@@ -191,24 +599,54 @@ class IOCList(object):
             if "release" in template.lower() or "stable" in template.lower():
                 template = "-"
 
-            # Append the JID and the UUID to the table
-            if self.full:
-                if self.plugin:
-                    if jail_type != "plugin":
-                        # We only want plugin type jails to be apart of the
-                        # list
-                        continue
-
-                jail_list.append([jid, uuid, boot, state, tag, jail_type,
-                                  full_release, full_ip4, ip6, template])
-            else:
-                jail_list.append([jid, uuid[:8], state, tag, short_release,
-                                  short_ip4])
+            if self.plugin and jail_type != "plugin":
+                # We only want plugin type jails to be apart of the list
+                continue
+
+            yield JailRecord(int(jid) if status else None, uuid, boot, state,
+                             tag, jail_type, full_release, short_release,
+                             full_ip4, short_ip4, ip6, template,
+                             full=self.full)
+
+    def list_stream(self):
+        """
+        Yields the rows of the jails or templates one at a time. They come
+        in dataset order as soon as each jail is inspected, unless a sort
+        was asked for, which needs every row first.
+        """
+        if self.list_type not in ("all", "template"):
+            iocage.lib.ioc_common.logit({
+                "level"  : "EXCEPTION",
+                "message": "Only jails and templates can be streamed."
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+        rows = self.list_rows(*self.__list_jail_datasets__())
+
+        if self.sort is None:
+            yield from rows
+
+            return
 
+        yield from self.__list_sort__(list(rows))
+
+    def __list_sort__(self, records):
+        """Sorts the JailRecords in place by self.sort and returns them."""
         list_type = "list_full" if self.full else "list_short"
-        sort = iocage.lib.ioc_common.ioc_sort(list_type, self.sort,
-                                              data=jail_list)
-        jail_list.sort(key=sort)
+        # Only validates the sort type, records carry their own keys.
+        iocage.lib.ioc_common.ioc_sort(list_type, self.sort)
+        records.sort(key=JailRecord.sort_key(self.sort))
+
+        return records
+
+    def list_all(self, jails, datasets):
+        """
+        List all jails, given their dataset names and the properties
+        prefetched by ioc_zfs.prefetch_datasets().
+        """
+        table = texttable.Texttable(max_width=0)
+        jail_list = self.__list_sort__(list(self.list_rows(jails, datasets)))
 
         # Prints the table
         if self.header:
@@ -216,14 +654,11 @@ class IOCList(object):
                 # We get an infinite float otherwise.
                 table.set_cols_dtype(["t", "t", "t", "t", "t", "t", "t", "t",
                                       "t", "t"])
-                jail_list.insert(0, ["JID", "UUID", "BOOT", "STATE", "TAG",
-                                     "TYPE", "RELEASE", "IP4", "IP6",
-                                     "TEMPLATE"])
+                jail_list.insert(0, LIST_FULL_HEADER)
             else:
                 # We get an infinite float otherwise.
                 table.set_cols_dtype(["t", "t", "t", "t", "t", "t"])
-                jail_list.insert(0, ["JID", "UUID", "STATE", "TAG",
-                                     "RELEASE", "IP4"])
+                jail_list.insert(0, LIST_SHORT_HEADER)
 
             table.add_rows(jail_list)
 
@@ -254,9 +689,9 @@ class IOCList(object):
     @classmethod
     def list_get_jid(cls, uuid):
         """Return a tuple containing True or False and the jail's id or '-'."""
-        try:
-            jid = iocage.lib.ioc_common.checkoutput(
-                ["jls", "-j", f"ioc-{uuid}"], stderr=su.PIPE).split()[5]
-            return True, jid
-        except su.CalledProcessError:
+        jail = get_jail_state().get(f"ioc-{uuid}")
+
+        if jail is None:
             return False, "-"
+
+        return True, jail["jid"]
@@ -0,0 +1,367 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""VNET interface plumbing for iocage"""
+import collections
+import contextlib
+import shlex
+import subprocess as su
+import threading
+
+import iocage.lib.ioc_common
+
+# MACs are the 6 hex digit mac_prefix followed by a 24 bit suffix.
+MAC_SUFFIXES = 16 ** 6
+
+# Bridge MTUs looked up inside bridge_mtu_cache() blocks, innermost last.
+_mtu_runs = []
+
+
+@contextlib.contextmanager
+def bridge_mtu_cache():
+    """
+    Shares bridge MTU lookups between every IOCNetwork created inside the
+    block, so starting many jails on one bridge asks ifconfig only once.
+    """
+    _mtu_runs.append({})
+
+    try:
+        yield _mtu_runs[-1]
+    finally:
+        _mtu_runs.pop()
+
+
+def find_bridge_mtu(bridge):
+    memberif = [x for x in
+                iocage.lib.ioc_common.checkoutput(
+                    ["ifconfig", bridge]).splitlines()
+                if x.strip().startswith("member")]
+
+    if not memberif:
+        return '1500'
+
+    membermtu = iocage.lib.ioc_common.checkoutput(
+        ["ifconfig", memberif[0].split()[1]]).split()
+    return membermtu[5]
+
+
+class IOCMacRegistry(object):
+    """
+    The MACs in use, as a count per 24 bit suffix for every prefix, so
+    checking, allocating and releasing one doesn't mean reading every
+    jail's configuration. Clones share their source's MACs, hence counts.
+
+    IOCInventory builds it from the MACs it keeps with each jail and updates
+    it whenever a configuration is written or a jail destroyed.
+    """
+
+    def __init__(self, macs=()):
+        self.used = collections.defaultdict(collections.Counter)
+        # The lowest suffix that may still be free, per prefix.
+        self.free = collections.defaultdict(int)
+        # Handed out by mac_allocate() but not written to a config yet.
+        self.reserved = set()
+        self.lock = threading.Lock()
+
+        for mac in macs:
+            self.mac_add(mac)
+
+    @staticmethod
+    def __split__(mac):
+        mac = mac.replace(":", "").lower()
+
+        try:
+            return mac[:6], int(mac[6:], 16) if len(mac) == 12 else None
+        except ValueError:
+            return mac[:6], None
+
+    def mac_add(self, mac):
+        """Records a MAC written to a configuration."""
+        prefix, suffix = self.__split__(mac)
+
+        if suffix is None:
+            return
+
+        with self.lock:
+            if (prefix, suffix) in self.reserved:
+                self.reserved.discard((prefix, suffix))
+            else:
+                self.used[prefix][suffix] += 1
+
+    def mac_release(self, mac):
+        """Forgets a MAC no longer in a configuration."""
+        prefix, suffix = self.__split__(mac)
+
+        with self.lock:
+            used = self.used[prefix]
+
+            if suffix not in used:
+                return
+
+            used[suffix] -= 1
+
+            if not used[suffix]:
+                del used[suffix]
+                self.free[prefix] = min(self.free[prefix], suffix)
+
+    def mac_keep_reserved(self, registry):
+        """
+        Holds the MACs registry handed out and that aren't in a
+        configuration yet, for a registry rebuilt in its place.
+        """
+        with registry.lock:
+            reserved = set(registry.reserved)
+
+        with self.lock:
+            for prefix, suffix in reserved:
+                # Written meanwhile, this registry has it from the index.
+                if suffix in self.used[prefix]:
+                    continue
+
+                self.used[prefix][suffix] += 1
+                self.reserved.add((prefix, suffix))
+
+    def mac_allocate(self, prefix):
+        """
+        Returns the first pair of consecutive free MACs with prefix, host
+        side first, and holds them until they are written with mac_add().
+        """
+        prefix = prefix.lower()
+
+        with self.lock:
+            used = self.used[prefix]
+            suffix = self.free[prefix]
+
+            while suffix + 1 < MAC_SUFFIXES:
+                if suffix in used:
+                    suffix += 1
+                elif suffix + 1 in used:
+                    suffix += 2
+                else:
+                    break
+            else:
+                raise RuntimeError(
+                    f"No free MAC addresses left for prefix {prefix}!")
+
+            for _suffix in (suffix, suffix + 1):
+                used[_suffix] += 1
+                self.reserved.add((prefix, _suffix))
+
+            self.free[prefix] = suffix + 2
+
+        return f"{prefix}{suffix:06x}", f"{prefix}{suffix + 1:06x}"
+
+
+class IOCNetwork(object):
+    """
+    Plans the VNET interfaces of a jail (epairs, MACs, MTUs, bridges,
+    addresses and default routes) up front, then plumbs them with one
+    ifconfig per epair created, one host side script and one script run
+    inside the jail instead of a fork per step.
+    """
+
+    def __init__(self, uuid, tag, jid, exec_fib="0", callback=None,
+                 silent=False):
+        self.uuid = uuid
+        self.tag = tag
+        self.jid = jid
+        self.exec_fib = exec_fib
+        self.callback = callback
+        self.silent = silent
+        self.bridge_mtus = _mtu_runs[-1] if _mtu_runs else {}
+
+    def network_plan(self, interfaces, net_configs, macs):
+        """
+        Returns the plan network_start() carries out.
+
+        :param interfaces: The interfaces property, nic:bridge,...
+        :param net_configs: Tuple of IP address and router pairs
+        :param macs: Called with a nic, returns its (host, jail) MACs
+        :return: {"nics": [{nic, bridge, mtu, macs, addrs}],
+                  "routes": [(family, gateway)]}
+        """
+        bridges = collections.OrderedDict(
+            nic_def.split(":") for nic_def in interfaces.split(","))
+        addrs = collections.OrderedDict((nic, []) for nic in bridges)
+        routes = collections.OrderedDict()
+
+        for ips, gw in net_configs:
+            if ips == "none":
+                continue
+
+            for addr in ips.split(","):
+                iface, ip = addr.split("|")
+
+                if iface not in bridges:
+                    iocage.lib.ioc_common.logit({
+                        "level"  : "ERROR",
+                        "message": f"\n  Invalid interface supplied: {iface}"
+                    },
+                        _callback=self.callback,
+                        silent=self.silent)
+                    iocage.lib.ioc_common.logit({
+                        "level"  : "ERROR",
+                        "message": f"  Did you mean {', '.join(bridges)}?\n"
+                    },
+                        _callback=self.callback,
+                        silent=self.silent)
+
+                    continue
+
+                # Crude check to see if it's a IPv6 address
+                family = "inet6" if ":" in ip else "inet"
+                addrs[iface].append((family, ip))
+
+                # One default route per family, more would only collide.
+                if gw != "none":
+                    routes.setdefault(family, gw)
+
+        # Interfaces without an address are left alone, as they always were.
+        nics = [{
+            "nic"   : nic,
+            "bridge": bridge,
+            "mtu"   : self.__bridge_mtu__(bridge),
+            "macs"  : macs(nic),
+            "addrs" : addrs[nic]
+        } for nic, bridge in bridges.items() if addrs[nic]]
+
+        return {"nics": nics, "routes": list(routes.items())}
+
+    def network_start(self, interfaces, net_configs, macs):
+        """
+        Plans the interfaces with network_plan() and plumbs them, a failure
+        is logged as a WARNING.
+        """
+        try:
+            plan = self.network_plan(interfaces, net_configs, macs)
+
+            if plan["nics"]:
+                self.__plumb__(plan)
+        except su.CalledProcessError as err:
+            iocage.lib.ioc_common.logit({
+                "level"  : "WARNING",
+                "message": "Network failed to start:"
+                           f" {err.output.decode('utf-8')}".rstrip()
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+    def __plumb__(self, plan):
+        description = f"associated with jail: {self.uuid} ({self.tag})"
+        epairs = []
+
+        try:
+            for nic in plan["nics"]:
+                # Creating the epair already sets up its host side.
+                epair_a = iocage.lib.ioc_common.checkoutput(
+                    ["ifconfig", "epair", "create", "mtu", nic["mtu"],
+                     "link", nic["macs"][0], "description", description,
+                     "up"], stderr=su.STDOUT).strip()
+                epairs.append((epair_a, f"{epair_a[:-1]}b"))
+
+            iocage.lib.ioc_common.checkoutput(
+                ["sh", "-c", self.__host_script__(plan, epairs)],
+                stderr=su.STDOUT)
+        except su.CalledProcessError:
+            self.__destroy__(plan, epairs)
+
+            raise
+
+        failures = iocage.lib.ioc_common.checkoutput(
+            ["setfib", self.exec_fib, "jexec", f"ioc-{self.uuid}", "sh", "-c",
+             self.__jail_script__(plan, epairs)], stderr=su.STDOUT)
+
+        for failure in failures.splitlines():
+            iocage.lib.ioc_common.logit({
+                "level"  : "WARNING",
+                "message": f"Network failed to start: {failure}"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+    def __destroy__(self, plan, epairs):
+        """Destroys the epairs created, whichever name they have by now."""
+        for nic, (epair_a, _) in zip(plan["nics"], epairs):
+            for name in (epair_a, f"{nic['nic']}:{self.jid}"):
+                try:
+                    iocage.lib.ioc_common.checkoutput(
+                        ["ifconfig", name, "destroy"], stderr=su.STDOUT)
+
+                    break
+                except su.CalledProcessError:
+                    continue
+
+    def __host_script__(self, plan, epairs):
+        """Hands the jail sides over and bridges the host sides."""
+        lines = ["set -e"]
+
+        for nic, (epair_a, epair_b) in zip(plan["nics"], epairs):
+            host_nic = f"{nic['nic']}:{self.jid}"
+            lines += [
+                _command("ifconfig", epair_b, "mtu", nic["mtu"], "link",
+                         nic["macs"][1], "vnet", f"ioc-{self.uuid}"),
+                _command("ifconfig", epair_a, "name", host_nic),
+                _command("ifconfig", nic["bridge"], "addm", host_nic, "up")
+            ]
+
+        return "\n".join(lines)
+
+    def __jail_script__(self, plan, epairs):
+        """
+        Names the jail sides, adds the addresses and default routes. Only
+        naming an interface stops the script, a failed address or route is
+        printed, the rest still carried out.
+        """
+        lines = ["set -e"]
+
+        for nic, (_, epair_b) in zip(plan["nics"], epairs):
+            lines.append(_command("ifconfig", epair_b, "name", nic["nic"]))
+            lines += [_attempt(_command("ifconfig", nic["nic"], family, ip,
+                                        "up"))
+                      for family, ip in nic["addrs"]]
+
+        for family, gw in plan["routes"]:
+            route = ["-6"] if family == "inet6" else []
+            lines.append(_attempt(_command("route", "add", *route, "default",
+                                           gw)))
+
+        return "\n".join(lines)
+
+    def __bridge_mtu__(self, bridge):
+        try:
+            return self.bridge_mtus[bridge]
+        except KeyError:
+            mtu = self.bridge_mtus[bridge] = find_bridge_mtu(bridge)
+
+            return mtu
+
+
+def _command(*args):
+    """Quotes args into one shell command line."""
+    return " ".join(shlex.quote(str(a)) for a in args)
+
+
+def _attempt(command):
+    """A script line running command that prints its failure and goes on."""
+    return f'out=$({command} 2>&1) || echo {shlex.quote(command + ": ")}' \
+        '"$out"'
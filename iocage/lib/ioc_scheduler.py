@@ -0,0 +1,240 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Orders jails by priority and depends and runs them in parallel"""
+import collections
+import concurrent.futures
+import os
+import time
+
+import iocage.lib.ioc_common
+
+
+class IOCScheduler(object):
+    """
+    Runs an action, e.g. starting, over jails as a graph. A jail waits for
+    the jails it depends on, and every jail of a priority waits for all jails
+    of the smaller priorities, as the sequential boot always did. Within
+    those bounds up to jobs jails run at the same time.
+
+    A jail depended upon by one of a smaller priority is moved up to that
+    priority, otherwise the two rules could never both hold.
+
+    Run in reverse, e.g. stopping, the largest priority goes first and a
+    jail waits for the jails depending on it instead.
+    """
+
+    def __init__(self, jails, jobs=None, callback=None, silent=False):
+        """
+        jails is an ordered iterable of dicts with the tag, uuid, priority
+        and depends (a list of tags or uuids) of every jail to run.
+        """
+        self.jails = collections.OrderedDict((j["tag"], j) for j in jails)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.callback = callback
+        self.silent = silent
+        # Seconds each jail took in the last scheduler_run().
+        self.durations = collections.OrderedDict()
+        # Jails whose depends form a cycle, a strict plan doesn't run them.
+        self.cyclic = set()
+
+        names = {}
+
+        for tag, jail in self.jails.items():
+            names[tag] = tag
+            names[jail["uuid"]] = tag
+
+        # Only the jails being run, IOCage.start() still brings up any other
+        # dependency itself.
+        self.depends = collections.OrderedDict(
+            (tag, [names[d] for d in jail["depends"] if d in names])
+            for tag, jail in self.jails.items())
+
+    def __topological__(self, strict=True):
+        """
+        Kahn's algorithm over the depends edges. The depends among the jails
+        of a cycle are dropped so the rest can be ordered, strict also marks
+        those jails as not to be run, which fails their dependents in turn.
+        """
+        waiting = {tag: len(set(deps)) for tag, deps in self.depends.items()}
+        dependents = collections.defaultdict(list)
+
+        for tag, deps in self.depends.items():
+            for dep in set(deps):
+                dependents[dep].append(tag)
+
+        ready = collections.deque(t for t, n in waiting.items() if n == 0)
+        order = []
+
+        while ready:
+            tag = ready.popleft()
+            order.append(tag)
+
+            for dependent in dependents[tag]:
+                waiting[dependent] -= 1
+
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) != len(self.depends):
+            # Left over are the cycles and whatever depends on them.
+            left = [t for t in self.depends if t not in order]
+            cycle = [t for t in left if self.__reaches__(t, t, left)]
+            iocage.lib.ioc_common.logit({
+                "level"  : "ERROR" if strict else "WARNING",
+                "message": f"The depends property of {', '.join(cycle)} forms"
+                           " a cycle, none of them can be started first!"
+            },
+                _callback=self.callback,
+                silent=self.silent)
+
+            if strict:
+                self.cyclic.update(cycle)
+
+            for tag in cycle:
+                self.depends[tag] = [d for d in self.depends[tag]
+                                     if d not in cycle]
+
+            return self.__topological__(strict)
+
+        return order
+
+    def __reaches__(self, start, target, among):
+        """True if a depends path from start among those jails hits target."""
+        seen = set()
+        stack = [d for d in self.depends[start] if d in among]
+
+        while stack:
+            tag = stack.pop()
+
+            if tag == target:
+                return True
+
+            if tag not in seen:
+                seen.add(tag)
+                stack.extend(d for d in self.depends[tag] if d in among)
+
+        return False
+
+    def scheduler_plan(self, strict=True):
+        """
+        Returns the jails grouped by effective priority, smallest first. In
+        every group a jail comes after the jails it depends on.
+        """
+        order = self.__topological__(strict)
+        priority = {t: int(j["priority"]) for t, j in self.jails.items()}
+
+        # Dependents first, so a priority moves up the whole chain.
+        for tag in reversed(order):
+            for dep in self.depends[tag]:
+                priority[dep] = min(priority[dep], priority[tag])
+
+        rank = {tag: i for i, tag in enumerate(order)}
+        levels = collections.OrderedDict()
+
+        for tag in sorted(order, key=lambda t: (priority[t], rank[t])):
+            levels.setdefault(priority[tag], []).append(tag)
+
+        return list(levels.values())
+
+    def scheduler_run(self, func, reverse=False):
+        """
+        Calls func(tag) for every jail, which returns (err, msg) like
+        IOCage.start(). Going forward a jail whose dependency failed is
+        skipped, in reverse every jail is still run. Returns {tag: (err,
+        msg)} in the order the jails finished.
+        """
+        results = collections.OrderedDict()
+        failed = set()
+        self.durations.clear()
+        # Stopping has to go ahead, whatever the depends say.
+        plan = self.scheduler_plan(strict=not reverse)
+
+        if reverse:
+            waits_for = collections.defaultdict(list)
+
+            for tag, deps in self.depends.items():
+                for dep in deps:
+                    waits_for[dep].append(tag)
+        else:
+            waits_for = self.depends
+
+        def _run(tag):
+            start = time.monotonic()
+
+            try:
+                return func(tag)
+            except (RuntimeError, SystemExit) as err:
+                return True, str(err)
+            finally:
+                self.durations[tag] = time.monotonic() - start
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.jobs) as executor:
+            for level in reversed(plan) if reverse else plan:
+                # The earlier levels are done, only wait for this one.
+                members = set(level)
+                waiting = {t: set(waits_for[t]) & members for t in level}
+                ready = collections.deque(t for t in level if not waiting[t])
+                running = {}
+
+                while ready or running:
+                    finished = []
+
+                    while ready:
+                        tag = ready.popleft()
+                        bad = [] if reverse else \
+                            [d for d in self.depends[tag] if d in failed]
+
+                        if tag in self.cyclic:
+                            finished.append(
+                                (tag, (True, f"{tag} was not run, its depends"
+                                             " form a cycle")))
+                        elif bad:
+                            finished.append(
+                                (tag, (True, f"{tag} was not run, it depends"
+                                             f" on {', '.join(bad)}")))
+                        else:
+                            running[executor.submit(_run, tag)] = tag
+
+                    if not finished:
+                        done, _ = concurrent.futures.wait(
+                            running,
+                            return_when=concurrent.futures.FIRST_COMPLETED)
+                        finished = [(running.pop(f), f.result())
+                                    for f in done]
+
+                    for tag, result in finished:
+                        results[tag] = result
+
+                        if result[0]:
+                            failed.add(tag)
+
+                        for t in level:
+                            if tag in waiting[t]:
+                                waiting[t].discard(tag)
+
+                                if not waiting[t]:
+                                    ready.append(t)
+
+        return results
@@ -24,13 +24,16 @@
 """This is responsible for starting jails."""
 import datetime
 import os
-import re
 import shutil
 import subprocess as su
 
 import iocage.lib.ioc_common
+import iocage.lib.ioc_inventory
+import iocage.lib.ioc_ipam
 import iocage.lib.ioc_json
 import iocage.lib.ioc_list
+import iocage.lib.ioc_network
+import iocage.lib.ioc_zfs
 
 
 class IOCStart(object):
@@ -40,9 +43,8 @@ class IOCStart(object):
     """
 
     def __init__(self, uuid, jail, path, conf, silent=False, callback=None):
-        self.pool = iocage.lib.ioc_json.IOCJson(" ").json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.uuid = uuid
         self.jail = jail
         self.path = path
@@ -115,10 +117,8 @@ class IOCStart(object):
                 if mount_linprocfs == "1":
                     if not os.path.isdir("{}/root/compat/linux/proc".format(
                             self.path)):
-                        original_path = os.getcwd()
-                        os.chdir("{}/root".format(self.path))
-                        os.makedirs("compat/linux/proc", 0o755)
-                        os.chdir(original_path)
+                        os.makedirs("{}/root/compat/linux/proc".format(
+                            self.path), 0o755)
                     su.Popen(
                         ["mount", "-t", "linprocfs", "linproc", self.path +
                          "/root/compat/linux/proc"]).communicate()
@@ -132,32 +132,14 @@ class IOCStart(object):
                 allow_mount_zfs = "1"
 
                 for jdataset in self.conf["jail_zfs_dataset"].split():
-                    jdataset = jdataset.strip()
+                    jdataset = f"{self.pool}/{jdataset.strip()}"
 
-                    try:
-                        su.check_call(["zfs", "get", "-H", "creation",
-                                       "{}/{}".format(self.pool,
-                                                      jdataset)],
-                                      stdout=su.PIPE, stderr=su.PIPE)
-                    except su.CalledProcessError:
-                        iocage.lib.ioc_common.checkoutput(
-                            ["zfs", "create", "-o",
-                             "compression=lz4", "-o",
-                             "mountpoint=none",
-                             "{}/{}".format(self.pool,
-                                            jdataset)],
-                            stderr=su.STDOUT)
+                    if not iocage.lib.ioc_zfs.zfs_exists(jdataset):
+                        iocage.lib.ioc_zfs.zfs_create(
+                            jdataset, {"compression": "lz4",
+                                       "mountpoint" : "none"})
 
-                    try:
-                        iocage.lib.ioc_common.checkoutput(
-                            ["zfs", "set", "jailed=on",
-                             "{}/{}".format(self.pool,
-                                            jdataset)],
-                            stderr=su.STDOUT)
-                    except su.CalledProcessError as err:
-                        raise RuntimeError(
-                            "{}".format(
-                                err.output.decode("utf-8").rstrip()))
+                    iocage.lib.ioc_zfs.zfs_set(jdataset, jailed="on")
 
             # FreeBSD 9.3 and under do not support this.
             if userland_version <= 9.3:
@@ -205,15 +187,16 @@ class IOCStart(object):
                 ip6_addr = self.conf["ip6_addr"]
                 vnet = True
 
-            ips_in_use = iocage.lib.ioc_common.checkoutput(
-                ["jls", "ip4.addr", "ip6.addr"]).split()
-            ips_in_use = [x for x in ips_in_use if x != "-"]
+            conflicts = iocage.lib.ioc_ipam.IOCIpam(
+                configured=False).ipam_conflicts(self.uuid, ip4_addr,
+                                                 ip6_addr)
 
-            if any(ip in ip4_addr or ip in ip6_addr for ip in ips_in_use):
+            if conflicts:
+                ip, owner = conflicts[0]
                 iocage.lib.ioc_common.logit({
                     "level"  : "EXCEPTION",
-                    "message": f"IP is in use. Please change {self.uuid} ("
-                               f"{self.conf['tag']})'s IP."
+                    "message": f"IP {ip} is in use by {owner}. Please change"
+                               f" {self.uuid} ({self.conf['tag']})'s IP."
                 },
                     _callback=self.callback,
                     silent=self.silent)
@@ -268,6 +251,7 @@ class IOCStart(object):
                              stderr=su.PIPE)
 
             stdout_data, stderr_data = start.communicate()
+            iocage.lib.ioc_list.invalidate_jail_state()
 
             if start.returncode:
                 # This is actually fatal.
@@ -295,48 +279,40 @@ class IOCStart(object):
 
             os_path = "{}/root/dev/log".format(self.path)
             if not os.path.isfile(os_path) and not os.path.islink(os_path):
-                original_path = os.getcwd()
-                os.chdir("{}/root/dev".format(self.path))
-                os.symlink("../var/run/log", "log")
-                os.chdir(original_path)
+                # Relative to root/dev, without changing the directory of
+                # the whole process.
+                os.symlink("../var/run/log", os_path)
 
             self.start_network(vnet)
 
             if self.conf["jail_zfs"] == "on":
                 for jdataset in self.conf["jail_zfs_dataset"].split():
-                    jdataset = jdataset.strip()
-                    children = iocage.lib.ioc_common.checkoutput(
-                        ["zfs", "list", "-H", "-r", "-o",
-                         "name", "-S", "name",
-                         "{}/{}".format(self.pool,
-                                        jdataset)])
+                    jdataset = f"{self.pool}/{jdataset.strip()}"
+                    children = iocage.lib.ioc_zfs.zfs_children(jdataset)
+                    mountpoint = iocage.lib.ioc_zfs.zfs_get(jdataset,
+                                                            "mountpoint")
 
+                    # libzfs has no binding for attaching a dataset to a
+                    # jail, and the mounts have to happen inside of it.
                     try:
                         iocage.lib.ioc_common.checkoutput(
                             ["zfs", "jail", "ioc-{}".format(self.uuid),
-                             "{}/{}".format(self.pool, jdataset)],
+                             jdataset],
                             stderr=su.STDOUT)
                     except su.CalledProcessError as err:
                         raise RuntimeError(
                             "{}".format(
                                 err.output.decode("utf-8").rstrip()))
 
-                    for child in children.split():
-                        child = child.strip()
+                    if mountpoint == "none":
+                        continue
 
+                    for child in children:
                         try:
-                            mountpoint = iocage.lib.ioc_common.checkoutput(
-                                ["zfs", "get", "-H",
-                                 "-o",
-                                 "value", "mountpoint",
-                                 "{}/{}".format(
-                                     self.pool,
-                                     jdataset)]).strip()
-                            if mountpoint != "none":
-                                iocage.lib.ioc_common.checkoutput(
-                                    ["setfib", self.exec_fib, "jexec",
-                                     f"ioc-{self.uuid}", "zfs",
-                                     "mount", child], stderr=su.STDOUT)
+                            iocage.lib.ioc_common.checkoutput(
+                                ["setfib", self.exec_fib, "jexec",
+                                 f"ioc-{self.uuid}", "zfs",
+                                 "mount", child], stderr=su.STDOUT)
                         except su.CalledProcessError as err:
                             msg = err.output.decode('utf-8').rstrip()
                             iocage.lib.ioc_common.logit({
@@ -397,154 +373,12 @@ class IOCStart(object):
             _, jid = iocage.lib.ioc_list.IOCList().list_get_jid(self.uuid)
             net_configs = ((self.get("ip4_addr"), self.get("defaultrouter")),
                            (self.get("ip6_addr"), self.get("defaultrouter6")))
-            nics = self.get("interfaces").split(",")
-
-            for nic in nics:
-                self.start_network_interface_vnet(nic, net_configs, jid)
 
-    def start_network_interface_vnet(self, nic_defs, net_configs, jid):
-        """
-        Start VNET on interface
-
-        :param nic_defs: comma separated interface definitions (nic, bridge)
-        :param net_configs: Tuple of IP address and router pairs
-        :param jid: The jails ID
-        """
-
-        nic_defs = nic_defs.split(",")
-        nics = list(map(lambda x: x.split(":")[0], nic_defs))
-
-        for nic_def in nic_defs:
-
-            nic, bridge = nic_def.split(":")
-
-            try:
-                membermtu = find_bridge_mtu(bridge)
-
-                ifaces = []
-                for addrs, gw in net_configs:
-                    if addrs == 'none':
-                        continue
-
-                    for addr in addrs.split(','):
-                        iface, ip = addr.split("|")
-                        if iface not in nics:
-                            err = f"\n  Invalid interface supplied: {iface}"
-                            iocage.lib.ioc_common.logit({
-                                "level"  : "ERROR",
-                                "message": f"{err}"
-                            },
-                                _callback=self.callback,
-                                silent=self.silent)
-
-                            err = f"  Did you mean {nic}?\n"
-                            iocage.lib.ioc_common.logit({
-                                "level"  : "ERROR",
-                                "message": f"{err}"
-                            },
-                                _callback=self.callback,
-                                silent=self.silent)
-                            continue
-                        if iface not in ifaces:
-                            self.start_network_vnet_iface(nic, bridge,
-                                                          membermtu, jid)
-                            ifaces.append(iface)
-
-                        self.start_network_vnet_addr(iface, ip, gw)
-
-            except su.CalledProcessError as err:
-                iocage.lib.ioc_common.logit({
-                    "level"  : "WARNING",
-                    "message": "Network failed to start:"
-                               f" {err.output.decode('utf-8')}".rstrip()
-                },
-                    _callback=self.callback,
-                    silent=self.silent)
-
-    def start_network_vnet_iface(self, nic, bridge, mtu, jid):
-        """
-        The real meat and potatoes for starting a VNET interface.
-
-        :param nic: The network interface to assign the IP in the jail
-        :param bridge: The bridge to attach the VNET interface
-        :param mtu: The mtu of the VNET interface
-        :param jid: The jails ID
-        :return: If an error occurs it returns the error. Otherwise, it's None
-        """
-
-        mac_a, mac_b = self.__start_generate_vnet_mac__(nic)
-        epair_a_cmd = ["ifconfig", "epair", "create"]
-        epair_a = su.Popen(epair_a_cmd, stdout=su.PIPE).communicate()[0]
-        epair_a = epair_a.strip()
-        epair_b = re.sub(b"a$", b"b", epair_a)
-
-        try:
-            # Host side
-            iocage.lib.ioc_common.checkoutput(["ifconfig", epair_a, "name",
-                                               f"{nic}:{jid}", "mtu", mtu],
-                                              stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["ifconfig", f"{nic}:{jid}", "link", mac_a],
-                stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["ifconfig", f"{nic}:{jid}", "description",
-                 "associated with jail:"
-                 f" {self.uuid} ({self.conf['tag']})"],
-                stderr=su.STDOUT)
-
-            # Jail side
-            iocage.lib.ioc_common.checkoutput(["ifconfig", epair_b, "vnet",
-                                               f"ioc-{self.uuid}"],
-                                              stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["setfib", self.exec_fib, "jexec", f"ioc-{self.uuid}",
-                 "ifconfig", epair_b, "name", nic, "mtu", mtu],
-                stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["setfib", self.exec_fib, "jexec", f"ioc-{self.uuid}",
-
-                 "ifconfig", nic, "link", mac_b], stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["ifconfig", bridge, "addm", f"{nic}:{jid}", "up"],
-                stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["ifconfig", f"{nic}:{jid}", "up"],
-                stderr=su.STDOUT)
-        except su.CalledProcessError as err:
-            return f"{err.output.decode('utf-8')}".rstrip()
-        else:
-            return
-
-    def start_network_vnet_addr(self, iface, ip, defaultgw):
-        """
-        Add an IP address to a vnet interface inside the jail.
-
-        :param iface: The interface to use
-        :param ip:  The IP address to assign
-        :param defaultgw: The gateway IP to assign to the nic
-        :return: If an error occurs it returns the error. Otherwise, it's None
-        """
-
-        # Crude check to see if it's a IPv6 address
-        if ":" in ip:
-            ifconfig = [iface, "inet6", ip, "up"]
-            route = ["add", "-6", "default", defaultgw]
-        else:
-            ifconfig = [iface, ip, "up"]
-            route = ["add", "default", defaultgw]
-
-        try:
-            # Jail side
-            iocage.lib.ioc_common.checkoutput(
-                ["setfib", self.exec_fib, "jexec", f"ioc-{self.uuid}",
-                 "ifconfig"] + ifconfig, stderr=su.STDOUT)
-            iocage.lib.ioc_common.checkoutput(
-                ["setfib", self.exec_fib, "jexec", f"ioc-{self.uuid}",
-                 "route"] + route, stderr=su.STDOUT)
-        except su.CalledProcessError as err:
-            return f"{err.output.decode('utf-8')}".rstrip()
-        else:
-            return
+            iocage.lib.ioc_network.IOCNetwork(
+                self.uuid, self.conf["tag"], jid, self.exec_fib,
+                callback=self.callback, silent=self.silent).network_start(
+                self.get("interfaces"), net_configs,
+                self.__start_generate_vnet_mac__)
 
     def start_copy_localtime(self):
         host_time = self.get("host_time")
@@ -572,51 +406,23 @@ class IOCStart(object):
 
     def __start_generate_vnet_mac__(self, nic):
         """
-        Generates a random MAC address and checks for uniquness.
-        If the jail already has a mac address generated, it will return that
-        instead.
+        Allocates a free pair of MAC addresses from the inventory's MAC
+        registry. If the jail already has a mac address generated, it will
+        return that instead.
         """
         mac = self.get("{}_mac".format(nic))
 
         if mac == "none":
-            jails, paths = iocage.lib.ioc_list.IOCList("uuid").list_datasets()
-            mac_list = []
-
-            for jail in jails:
-                path = paths[jail]
-                _conf = iocage.lib.ioc_json.IOCJson(path).json_load()
-                mac = _conf.get("mac_prefix", "02ff60")
-                mac_list.append(_conf["{}_mac".format(nic)].split(","))
-
-            # We have to flatten our list of lists.
-            mac_list = [m for maclist in mac_list for m in maclist]
-            for number in range(16 ** 6):
-                # SO
-                hex_num_a = hex(number)[2:].zfill(6)
-                hex_num_b = hex(number + 1)[2:].zfill(6)
-                gen_mac_a = "{}{}{}{}{}{}{}".format(mac, *hex_num_a)
-                gen_mac_b = "{}{}{}{}{}{}{}".format(mac, *hex_num_b)
-                gen_mac_combined = "{},{}".format(gen_mac_a, gen_mac_b)
-
-                if gen_mac_a in mac_list or gen_mac_b in mac_list:
-                    continue
-                else:
-                    self.set("{}_mac={}".format(nic, gen_mac_combined))
-                    return gen_mac_a, gen_mac_b
+            mac_a, mac_b = iocage.lib.ioc_inventory.IOCInventory(
+                self.iocroot).inventory_macs().mac_allocate(
+                self.conf.get("mac_prefix", "02ff60"))
+            self.set("{}_mac={},{}".format(nic, mac_a, mac_b))
+
+            return mac_a, mac_b
         else:
             mac_a, mac_b = mac.split(",")
             return mac_a, mac_b
 
 
-def find_bridge_mtu(bridge):
-    memberif = [x for x in
-                iocage.lib.ioc_common.checkoutput(
-                    ["ifconfig", bridge]).splitlines()
-                if x.strip().startswith("member")]
-
-    if not memberif:
-        return '1500'
-
-    membermtu = iocage.lib.ioc_common.checkoutput(
-        ["ifconfig", memberif[0].split()[1]]).split()
-    return membermtu[5]
+# Moved to ioc_network, kept here for existing callers.
+find_bridge_mtu = iocage.lib.ioc_network.find_bridge_mtu
@@ -29,15 +29,15 @@ import subprocess as su
 import iocage.lib.ioc_common
 import iocage.lib.ioc_json
 import iocage.lib.ioc_list
+import iocage.lib.ioc_zfs
 
 
 class IOCStop(object):
     """Stops a jail and unmounts the jails mountpoints."""
 
     def __init__(self, uuid, jail, path, conf, silent=False, callback=None):
-        self.pool = iocage.lib.ioc_json.IOCJson(" ").json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
         self.uuid = uuid
         self.jail = jail
         self.path = path
@@ -158,32 +158,21 @@ class IOCStop(object):
 
             if self.conf["jail_zfs"] == "on":
                 for jdataset in self.conf["jail_zfs_dataset"].split():
-                    jdataset = jdataset.strip()
-                    children = iocage.lib.ioc_common.checkoutput(
-                        ["zfs", "list", "-H", "-r", "-o",
-                         "name", "-S", "name",
-                         "{}/{}".format(self.pool,
-                                        jdataset)])
-
-                    for child in children.split():
-                        child = child.strip()
+                    jdataset = f"{self.pool}/{jdataset.strip()}"
+                    mountpoint = None
 
+                    for child in iocage.lib.ioc_zfs.zfs_children(jdataset):
                         try:
                             iocage.lib.ioc_common.checkoutput(
                                 ["setfib", exec_fib, "jexec",
                                  f"ioc-{self.uuid}", "zfs", "umount",
                                  child], stderr=su.STDOUT)
                         except su.CalledProcessError as err:
-                            mountpoint = iocage.lib.ioc_common.checkoutput(
-                                ["zfs", "get", "-H",
-                                 "-o",
-                                 "value", "mountpoint",
-                                 "{}/{}".format(
-                                     self.pool,
-                                     jdataset)]).strip()
-                            if mountpoint == "none":
-                                pass
-                            else:
+                            if mountpoint is None:
+                                mountpoint = iocage.lib.ioc_zfs.zfs_get(
+                                    jdataset, "mountpoint")
+
+                            if mountpoint != "none":
                                 raise RuntimeError(
                                     "{}".format(
                                         err.output.decode("utf-8").rstrip()))
@@ -191,8 +180,7 @@ class IOCStop(object):
                     try:
                         iocage.lib.ioc_common.checkoutput(
                             ["zfs", "unjail", "ioc-{}".format(
-                                self.uuid),
-                             "{}/{}".format(self.pool, jdataset)],
+                                self.uuid), jdataset],
                             stderr=su.STDOUT)
                     except su.CalledProcessError as err:
                         raise RuntimeError(
@@ -272,8 +260,12 @@ class IOCStop(object):
                                     "{}".format(
                                         err.output.decode("utf-8").strip()))
 
-            stop = su.check_call(["jail", "-r", "ioc-{}".format(self.uuid)],
-                                 stderr=su.PIPE)
+            try:
+                stop = su.check_call(
+                    ["jail", "-r", "ioc-{}".format(self.uuid)],
+                    stderr=su.PIPE)
+            finally:
+                iocage.lib.ioc_list.invalidate_jail_state()
 
             if stop:
                 msg = "  + Removing jail process FAILED"
@@ -28,6 +28,7 @@ import tempfile
 import urllib.request
 
 import iocage.lib.ioc_common
+import iocage.lib.ioc_host
 import iocage.lib.ioc_json
 import iocage.lib.ioc_list
 
@@ -36,11 +37,10 @@ class IOCUpgrade(object):
     """Will upgrade a jail to the specified RELEASE."""
 
     def __init__(self, conf, new_release, path):
-        self.pool = iocage.lib.ioc_json.IOCJson().json_get_value("pool")
-        self.iocroot = iocage.lib.ioc_json.IOCJson(self.pool).json_get_value(
-            "iocroot")
-        self.freebsd_version = iocage.lib.ioc_common.checkoutput(
-            ["freebsd-version"])
+        self.pool, self.iocroot = \
+            iocage.lib.ioc_json._get_pool_and_iocroot()
+        self.freebsd_version = iocage.lib.ioc_host.get_host_fact(
+            "freebsd_version")
         self.conf = conf
         self.uuid = conf["host_hostuuid"]
         self.host_release = os.uname()[2]
@@ -0,0 +1,298 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""libzfs handles and ZFS operations for iocage"""
+import contextlib
+import subprocess as su
+import threading
+
+import libzfs
+
+import iocage.lib.ioc_common
+
+# Opening a libzfs handle walks every imported pool, so one is kept per
+# history setting. libzfs handles must not be shared between threads, every
+# thread gets its own, as does its zfs_history() stack.
+_local = threading.local()
+# Bumped by reset(), handles opened before it are dropped on next use.
+_generation = [0]
+
+
+def get_zfs(history=None):
+    """
+    Returns this thread's libzfs.ZFS handle, creating it on first use.
+
+    Modifications made through a handle with history enabled are recorded
+    in the pool history with an <iocage> prefix, read-only callers can pass
+    history=False to skip that bookkeeping. Without an explicit value the
+    innermost zfs_history() context decides.
+    """
+    if history is None:
+        history = getattr(_local, "history", [True])[-1]
+
+    if getattr(_local, "generation", None) != _generation[0]:
+        _local.handles = {}
+        _local.generation = _generation[0]
+
+    try:
+        return _local.handles[history]
+    except KeyError:
+        pass
+
+    if history:
+        handle = libzfs.ZFS(history=True, history_prefix="<iocage>")
+    else:
+        handle = libzfs.ZFS(history=False)
+
+    _local.handles[history] = handle
+
+    return handle
+
+
+@contextlib.contextmanager
+def zfs_history(enabled):
+    """
+    Sets whether get_zfs() records history by default inside the block, for
+    the calling thread only.
+    """
+    if not hasattr(_local, "history"):
+        _local.history = [True]
+
+    _local.history.append(enabled)
+
+    try:
+        yield get_zfs(enabled)
+    finally:
+        _local.history.pop()
+
+
+def reset():
+    """Drops the handles of every thread, get_zfs() opens fresh ones."""
+    _generation[0] += 1
+
+
+DATASET_PROPS = ("mountpoint", "origin", "used", "available", "quota",
+                 "reservation", "compressratio")
+
+
+def prefetch_datasets(pool, props=DATASET_PROPS):
+    """
+    Returns {dataset: {prop: value}} for pool/iocage and every dataset
+    below it, read with a single zfs list instead of a lookup per dataset.
+    Values are formatted like libzfs' property values, "-" when unset.
+    """
+    try:
+        out = iocage.lib.ioc_common.checkoutput(
+            ["zfs", "list", "-H", "-r", "-t", "filesystem", "-o",
+             ",".join(("name",) + tuple(props)), f"{pool}/iocage"],
+            stderr=su.PIPE)
+    except su.CalledProcessError as err:
+        raise RuntimeError(err.stderr.decode("utf-8").rstrip())
+
+    datasets = {}
+
+    for line in out.splitlines():
+        name, *values = line.split("\t")
+        datasets[name] = dict(zip(props, values))
+
+    return datasets
+
+
+# The operations below try the libzfs handle first and only fork the
+# zfs CLI when the binding can't do it (older py-libzfs lacks some methods)
+# or refuses, the CLI then has the final word and the better error message.
+_FALLBACK = (libzfs.ZFSException, AttributeError, TypeError,
+             NotImplementedError)
+
+
+def _zfs_cli(command):
+    """Runs a zfs command, surfacing failures as a RuntimeError."""
+    try:
+        return iocage.lib.ioc_common.checkoutput(command, stderr=su.STDOUT)
+    except su.CalledProcessError as err:
+        raise RuntimeError(err.output.decode("utf-8").rstrip())
+
+
+def _zfs_opts(props):
+    """Turns {prop: value} into zfs -o arguments."""
+    opts = []
+
+    for prop, value in (props or {}).items():
+        opts += ["-o", f"{prop}={value}"]
+
+    return opts
+
+
+def _zfs_mount(dataset):
+    """
+    Mounts a dataset libzfs just created, a failure there is retried with
+    zfs mount so the error reported is about the mount, not the dataset.
+    """
+    try:
+        get_zfs().get_dataset(dataset).mount()
+    except _FALLBACK:
+        _zfs_cli(["zfs", "mount", dataset])
+
+
+def zfs_exists(dataset):
+    """Returns True if the dataset, volume or snapshot exists."""
+    zfs = get_zfs(history=False)
+
+    try:
+        if "@" in dataset:
+            zfs.get_snapshot(dataset)
+        else:
+            zfs.get_dataset(dataset)
+
+        return True
+    except libzfs.ZFSException:
+        return False
+    except (AttributeError, TypeError, NotImplementedError):
+        pass
+
+    try:
+        _zfs_cli(["zfs", "list", "-H", "-t", "all", "-o", "name", dataset])
+    except RuntimeError:
+        return False
+
+    return True
+
+
+def zfs_get(dataset, prop):
+    """Returns the value of a single property of dataset as a string."""
+    try:
+        return str(get_zfs(history=False).get_dataset(
+            dataset).properties[prop].value)
+    except _FALLBACK + (KeyError,):
+        pass
+
+    return _zfs_cli(["zfs", "get", "-H", "-o", "value", prop,
+                     dataset]).strip()
+
+
+def zfs_set(dataset, **props):
+    """Sets each keyword as a property of dataset."""
+    for prop, value in props.items():
+        try:
+            get_zfs().get_dataset(dataset).properties[prop].value = value
+            continue
+        except _FALLBACK + (KeyError,):
+            pass
+
+        _zfs_cli(["zfs", "set", f"{prop}={value}", dataset])
+
+
+def zfs_create(dataset, props=None, parents=False):
+    """
+    Creates a filesystem with the given properties, mounting it unless its
+    mountpoint is none like zfs create does. parents creates any missing
+    ancestors as well.
+    """
+    props = props or {}
+
+    try:
+        get_zfs().get(dataset.split("/", 1)[0]).create(
+            dataset, props, create_ancestors=parents)
+    except _FALLBACK:
+        command = ["zfs", "create"] + (["-p"] if parents else [])
+        _zfs_cli(command + _zfs_opts(props) + [dataset])
+
+        return
+
+    if props.get("mountpoint") != "none":
+        _zfs_mount(dataset)
+
+
+def zfs_snapshot(snapshot, recursive=False):
+    """Takes dataset@name, with recursive every child is snapshotted too."""
+    dataset = snapshot.partition("@")[0]
+
+    try:
+        get_zfs().get_dataset(dataset).snapshot(snapshot,
+                                                recursive=recursive)
+
+        return
+    except _FALLBACK:
+        pass
+
+    command = ["zfs", "snapshot"] + (["-r"] if recursive else [])
+    _zfs_cli(command + [snapshot])
+
+
+def zfs_clone(snapshot, target, props=None, parents=False):
+    """Clones snapshot to target, parents creates missing ancestors."""
+    if parents:
+        parent = target.rpartition("/")[0]
+
+        if parent and not zfs_exists(parent):
+            zfs_create(parent, parents=True)
+
+    try:
+        get_zfs().get_snapshot(snapshot).clone(target, props or {})
+    except _FALLBACK:
+        _zfs_cli(["zfs", "clone"] + _zfs_opts(props) + [snapshot, target])
+
+        return
+
+    _zfs_mount(target)
+
+
+def zfs_children(dataset):
+    """
+    Returns dataset and every filesystem below it, sorted by name in
+    reverse like zfs list -S name, so children come before their parents.
+    """
+    try:
+        ds = get_zfs(history=False).get_dataset(dataset)
+        names = [ds.name] + [c.name for c in ds.children_recursive]
+    except _FALLBACK:
+        names = _zfs_cli(["zfs", "list", "-H", "-r", "-t", "filesystem",
+                          "-o", "name", dataset]).split()
+
+    return sorted(names, reverse=True)
+
+
+def zfs_list_snapshots(dataset, props=("creation", "used", "referenced")):
+    """
+    Returns [(snapshot, {prop: value})] for every snapshot of dataset and
+    its children, read in one pass instead of a lookup per snapshot.
+    """
+    try:
+        ds = get_zfs(history=False).get_dataset(dataset)
+        snapshots = [s for d in [ds] + list(ds.children_recursive)
+                     for s in d.snapshots]
+
+        return [(s.name, {p: str(s.properties[p].value) for p in props})
+                for s in snapshots]
+    except _FALLBACK + (KeyError,):
+        pass
+
+    out = _zfs_cli(["zfs", "list", "-H", "-r", "-t", "snapshot", "-o",
+                    ",".join(("name",) + tuple(props)), dataset])
+    snapshots = []
+
+    for line in out.splitlines():
+        name, *values = line.split("\t")
+        snapshots.append((name, dict(zip(props, values))))
+
+    return snapshots
@@ -27,6 +27,7 @@ import json
 import operator
 import os
 import subprocess as su
+import threading
 
 import libzfs
 
@@ -37,17 +38,34 @@ import iocage.lib.ioc_destroy as ioc_destroy
 import iocage.lib.ioc_exec as ioc_exec
 import iocage.lib.ioc_fetch as ioc_fetch
 import iocage.lib.ioc_fstab as ioc_fstab
+import iocage.lib.ioc_host as ioc_host
 import iocage.lib.ioc_image as ioc_image
+import iocage.lib.ioc_inventory as ioc_inventory
+import iocage.lib.ioc_ipam as ioc_ipam
 import iocage.lib.ioc_json as ioc_json
 import iocage.lib.ioc_list as ioc_list
+import iocage.lib.ioc_network as ioc_network
+import iocage.lib.ioc_scheduler as ioc_scheduler
 import iocage.lib.ioc_start as ioc_start
 import iocage.lib.ioc_stop as ioc_stop
+import iocage.lib.ioc_zfs as ioc_zfs
+
+# Checking that a jail is down and starting it must not interleave with
+# another thread doing the same, e.g. two jails of a parallel boot sharing a
+# dependency outside the boot plan. One lock per jail.
+_start_locks = collections.defaultdict(threading.Lock)
+_start_locks_lock = threading.Lock()
+
+
+def _start_lock(uuid):
+    with _start_locks_lock:
+        return _start_locks[uuid]
 
 
 class PoolAndDataset(object):
     def __init__(self):
-        self.pool = ioc_json.IOCJson().json_get_value("pool")
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+        self.pool, self.iocroot = ioc_json._get_pool_and_iocroot()
+        self.zfs = ioc_zfs.get_zfs(history=False)
 
     def get_pool(self):
         """
@@ -82,112 +100,218 @@ class PoolAndDataset(object):
         Return:
                 string: with the iocroot name.
         """
-        return ioc_json.IOCJson(self.pool).json_get_value("iocroot")
+        return self.iocroot
 
 
 class IOCage(object):
     def __init__(self, jail=None, rc=False, callback=None, silent=False,
-                 activate=False, skip_jails=False):
-        self.zfs = libzfs.ZFS(history=True, history_prefix="<iocage>")
+                 activate=False, skip_jails=False, jobs=None):
+        self.zfs = ioc_zfs.get_zfs()
+        # A new call, jails may have started or stopped since the last one.
+        ioc_list.invalidate_jail_state()
 
         if not activate:
-            self.pool = PoolAndDataset().get_pool()
-            self.iocroot = PoolAndDataset().get_iocroot()
-
-            if not skip_jails:
-                # When they need to destroy a jail with a missing or bad
-                # configuration, this gets in our way otherwise.
-                self.jails, self._paths = self.list("uuid")
+            self.pool, self.iocroot = ioc_json._get_pool_and_iocroot()
 
+        # Only listed on first use, most commands resolve a single jail
+        # without it. skip_jails is kept for existing callers.
+        self._jail_list = None
+        self._jail_index = None
         self.jail = jail
         self.rc = rc
+        # How many jails --rc starts at once, ioc_scheduler defaults it.
+        self.jobs = jobs
         self._all = True if self.jail and 'ALL' in self.jail else False
         self.callback = ioc_common.callback if not callback else callback
         self.silent = silent
 
+    @property
+    def jails(self):
+        """Every jail and template keyed by tag, listed on first use."""
+        if self._jail_list is None:
+            self._jail_list = self.list("uuid")
+
+        return self._jail_list[0]
+
+    @property
+    def _paths(self):
+        if self._jail_list is None:
+            self._jail_list = self.list("uuid")
+
+        return self._jail_list[1]
+
+    @property
+    def _index(self):
+        if self._jail_index is None:
+            self._jail_index = ioc_list.IOCJailIndex(self.jails)
+
+        return self._jail_index
+
+    def __filter_jails__(self, filters):
+        """
+        Returns the tags of self.jails whose inventory entry passes filters,
+        see ioc_list.filter_entries().
+        """
+        if not filters:
+            return list(self.jails)
+
+        entries = ioc_inventory.IOCInventory(
+            self.iocroot, silent=self.silent,
+            callback=self.callback).inventory_load()
+        selected = {e["path"] for e in ioc_list.filter_entries(
+            (entries[p] for p in self._paths.values() if p in entries),
+            filters, callback=self.callback, silent=self.silent)}
+
+        return [j for j in self.jails if self._paths[j] in selected]
+
     def __all__(self, jail_order, action):
         # So we can properly start these.
         self._all = False
 
-        for j in jail_order:
-            # We want this to be the real jail now.
-            self.jail = j
-            tag, uuid, path = self.__check_jail_existence__()
-            status, jid = self.list("jid", uuid=uuid)
+        if action == "stop":
+            self.__stop_graph__(jail_order, self.__stop_one__)
 
-            if action == 'stop':
-                self.stop(j)
-            elif action == 'start':
-                if not status:
-                    err, msg = self.start(j)
+            return
 
-                    if err:
-                        self.callback({'level': 'ERROR', 'message': msg})
-                else:
-                    message = f"{uuid} ({j}) is already running!"
-                    self.callback({'level': 'WARNING', 'message': message})
+        with ioc_network.bridge_mtu_cache():
+            for j in (j["tag"] for j in jail_order):
+                # We want this to be the real jail now.
+                self.jail = j
+                tag, uuid, path = self.__check_jail_existence__()
+                status, jid = self.list("jid", uuid=uuid)
+
+                if action == 'start':
+                    if not status:
+                        err, msg = self.start(j)
+
+                        if err:
+                            self.callback({'level': 'ERROR', 'message': msg})
+                    else:
+                        message = f"{uuid} ({j}) is already running!"
+                        self.callback({'level': 'WARNING',
+                                       'message': message})
 
     def __jail_order__(self, action):
         """Helper to gather lists of all the jails by order and boot order."""
-        jail_order = {}
-        boot_order = {}
+        if self.rc:
+            # Kept up to date by the inventory, no jail is listed or loaded.
+            self.__rc__(ioc_inventory.IOCInventory(
+                self.iocroot, silent=self.silent,
+                callback=self.callback).inventory_bootplan(), action)
+
+            return
 
-        _reverse = True if action == 'stop' else False
+        jail_order = []
+
+        # Read them all up front, json_load() below is served from the cache.
+        ioc_list.IOCList(silent=True).list_load_configs(self._paths.values())
 
         for jail in self.jails:
-            self.jail = jail
-            tag, uuid, path = self.__check_jail_existence__()
-            conf = ioc_json.IOCJson(path).json_load()
-            boot = conf['boot']
-            priority = conf['priority']
-            jail_order[jail] = int(priority)
-
-            # This removes having to grab all the JSON again later.
-            if boot == 'on':
-                boot_order[jail] = int(priority)
-
-            jail_order = collections.OrderedDict(
-                sorted(jail_order.items(), key=operator.itemgetter(1),
-                       reverse=_reverse))
-            boot_order = collections.OrderedDict(
-                sorted(boot_order.items(), key=operator.itemgetter(1),
-                       reverse=_reverse))
+            conf = ioc_json.IOCJson(self._paths[jail]).json_load()
+            jail_order.append({
+                "tag"     : jail,
+                "uuid"    : self.jails[jail],
+                "priority": conf["priority"],
+                "depends" : [d for d in conf["depends"].split()
+                             if d != "none"]
+            })
+
+        jail_order.sort(key=lambda j: int(j["priority"]),
+                        reverse=action == "stop")
 
-        if self.rc:
-            self.__rc__(boot_order, action)
-        elif self._all:
+        if self._all:
             self.__all__(jail_order, action)
 
-    def __rc__(self, boot_order, action):
-        """Helper to start all jails with boot=on"""
+    def __rc__(self, boot_plan, action):
+        """
+        Helper to start or stop all jails with boot=on, boot_plan is
+        IOCInventory.inventory_bootplan().
+        """
         # So we can properly start these.
         self.rc = False
 
-        for j in boot_order.keys():
-            # We want this to be the real jail now.
-            self.jail = j
+        if action == "stop":
+            self.__stop_graph__(
+                boot_plan, lambda j: self.__stop_one__(j, rc=True))
 
-            tag, uuid, path = self.__check_jail_existence__()
+            return
+
+        with ioc_network.bridge_mtu_cache():
+            results = ioc_scheduler.IOCScheduler(
+                boot_plan, self.jobs, callback=self.callback,
+                silent=self.silent).scheduler_run(self.__rc_start__)
+
+        for err, msg in results.values():
+            if err:
+                self.callback({'level': 'ERROR', 'message': msg})
+
+    def __stop_graph__(self, jails, stop):
+        """
+        Stops the jails, dicts as IOCScheduler takes them, in reverse
+        through the scheduler so the stop timeouts of independent jails
+        overlap. Ends with how long each took.
+        """
+        scheduler = ioc_scheduler.IOCScheduler(jails, self.jobs,
+                                               callback=self.callback,
+                                               silent=self.silent)
+        start = datetime.datetime.now()
+        results = scheduler.scheduler_run(stop, reverse=True)
+        elapsed = (datetime.datetime.now() - start).total_seconds()
+
+        for err, msg in results.values():
+            if err:
+                self.callback({'level': 'ERROR', 'message': msg})
+
+        summary = [f"Stopped {len(results)} jails in {elapsed:.1f}s:"]
+
+        for tag, seconds in sorted(scheduler.durations.items(),
+                                   key=operator.itemgetter(1), reverse=True):
+            failed = " (failed)" if results[tag][0] else ""
+            summary.append(f"  {tag}: {seconds:.1f}s{failed}")
+
+        self.callback({'level': 'INFO', 'message': "\n".join(summary)})
+
+    def __stop_one__(self, jail, rc=False):
+        """
+        Stops one jail for stop ALL or, announcing it, for stop --rc.
+        Returns (err, msg).
+        """
+        iocage = IOCage(jail, callback=self.callback, silent=self.silent)
+        tag, uuid, path = iocage.__check_jail_existence__()
+
+        if rc:
             status, _ = self.list("jid", uuid=uuid)
 
-            if action == 'stop':
-                if status:
-                    message = f"  Stopping {uuid} ({j})"
-                    self.callback({'level': 'INFO', 'message': message})
+            if not status:
+                message = f"{uuid} ({jail}) is not running!"
+                self.callback({'level': 'INFO', 'message': message})
 
-                    self.stop(j)
-                else:
-                    message = f"{uuid} ({j}) is not running!"
-                    self.callback({'level': 'INFO', 'message': message})
-            elif action == 'start':
-                if not status:
-                    err, msg = self.start(j)
-
-                    if err:
-                        self.callback({'level': 'ERROR', 'message': msg})
-                else:
-                    message = f"{uuid} ({j}) is already running!"
-                    self.callback({'level': 'WARNING', 'message': message})
+                return False, None
+
+            message = f"  Stopping {uuid} ({jail})"
+            self.callback({'level': 'INFO', 'message': message})
+
+        iocage.stop(jail)
+        status, _ = self.list("jid", uuid=uuid)
+
+        if status:
+            return True, f"{uuid} ({jail}) is still running!"
+
+        return False, None
+
+    def __rc_start__(self, jail):
+        """Starts one jail for the boot scheduler, returns (err, msg)."""
+        iocage = IOCage(jail, callback=self.callback, silent=self.silent)
+        tag, uuid, path = iocage.__check_jail_existence__()
+        status, _ = self.list("jid", uuid=uuid)
+
+        if status:
+            message = f"{uuid} ({jail}) is already running!"
+            self.callback({'level': 'WARNING', 'message': message})
+
+            return False, None
+
+        return iocage.start(jail)
 
     def __check_jail_existence__(self):
         """
@@ -195,8 +319,13 @@ class IOCage(object):
         Return:
                 tuple: The jails tag, uuid, path
         """
-        _jail = {tag: uuid for (tag, uuid) in self.jails.items() if
-                 uuid.startswith(self.jail) or tag == self.jail}
+        if self._jail_list is None:
+            exact = self.__resolve_exact_jail__()
+
+            if exact:
+                return exact
+
+        _jail = self._index.match(self.jail)
 
         if len(_jail) == 1:
             tag, uuid = next(iter(_jail.items()))
@@ -240,6 +369,70 @@ class IOCage(object):
                 _callback=self.callback,
                 silent=self.silent)
 
+    def __resolve_exact_jail__(self):
+        """
+        Resolves an exact tag through its iocroot/tags symlink, or an exact
+        UUID or template through its directory, without listing every jail.
+
+        Return:
+                tuple: The jails tag, uuid, path or None if that isn't
+                conclusive and the prefix search has to decide.
+        """
+        if not self.jail or "/" in self.jail or self.jail in (".", ".."):
+            return None
+
+        name = self.jail
+        template = name.endswith(" (template)")
+
+        if template:
+            name = name[:-len(" (template)")]
+
+        jail_dir = f"{self.iocroot}/jails/{name}"
+        template_dir = f"{self.iocroot}/templates/{name}"
+
+        try:
+            tag_link = os.path.normpath(os.path.join(
+                f"{self.iocroot}/tags", os.readlink(
+                    f"{self.iocroot}/tags/{name}")))
+        except OSError:
+            tag_link = None
+
+        if template:
+            candidates = [template_dir] if os.path.isdir(template_dir) \
+                else []
+        else:
+            # A tag, a UUID and a template may share this name, the prefix
+            # search reports those as ambiguous so we only answer when a
+            # single one exists.
+            candidates = [p for p in (tag_link, jail_dir, template_dir)
+                          if p and os.path.isdir(p)]
+            candidates = list(collections.OrderedDict.fromkeys(candidates))
+
+        if len(candidates) != 1:
+            return None
+
+        path = candidates[0]
+
+        try:
+            conf = ioc_json.IOCJson(path, silent=True).json_load()
+            tag, uuid = conf["tag"], conf["host_hostuuid"]
+        except (OSError, RuntimeError, ValueError, KeyError):
+            return None
+
+        if path == template_dir:
+            # Templates live in a directory named after their tag.
+            if tag != name:
+                return None
+
+            return f"{tag} (template)", uuid, path
+        elif path == tag_link and tag != name:
+            # A stale symlink left behind by a renamed jail.
+            return None
+        elif path == jail_dir and uuid != name:
+            return None
+
+        return tag, uuid, path
+
     @staticmethod
     def __check_jail_type__(_type, uuid, tag):
         """
@@ -315,6 +508,8 @@ class IOCage(object):
 
             self.__remove_activate_comment(pool)
 
+        ioc_json._pool_and_iocroot_invalidate()
+
     def chroot(self, command):
         """Chroots into a jail and runs a command, or the shell."""
         # We may be getting ';', '&&' and so forth. Adding the shell for
@@ -425,8 +620,11 @@ class IOCage(object):
 
     def create(self, release, props, count=0, pkglist=None, template=False,
                short=False, uuid=None, basejail=False, empty=False,
-               clone=None, skip_batch=False):
-        """Creates the jail dataset"""
+               clone=None, skip_batch=False, ip4_pool=None, ip6_pool=None):
+        """
+        Creates the jail dataset. ip4_pool and ip6_pool, "interface|network",
+        give each jail created the next free address of that network.
+        """
         if short and uuid:
             uuid = uuid[:8]
 
@@ -451,7 +649,7 @@ class IOCage(object):
         if not os.path.isdir(
                 f"{self.iocroot}/releases/{release}") and not template and \
                 not empty and not clone:
-            freebsd_version = ioc_common.checkoutput(["freebsd-version"])
+            freebsd_version = ioc_host.get_host_fact("freebsd_version")
 
             if "HBSD" in freebsd_version:
                 hardened = True
@@ -476,14 +674,43 @@ class IOCage(object):
             release = clone_uuid
             clone = self.jail
 
+        pools = [(key, pool) for key, pool in (("ip4_addr", ip4_pool),
+                                               ("ip6_addr", ip6_pool))
+                 if pool]
+
+        for key, pool in pools:
+            if any(p.startswith(f"{key}=") for p in props):
+                ioc_common.logit({
+                    "level"  : "EXCEPTION",
+                    "message": f"{key} can't be set together with an address"
+                               " pool!"
+                },
+                    _callback=self.callback,
+                    silent=self.silent)
+
+            try:
+                ioc_ipam.parse_pool(pool)
+            except RuntimeError as err:
+                ioc_common.logit({
+                    "level"  : "EXCEPTION",
+                    "message": str(err)
+                },
+                    _callback=self.callback,
+                    silent=self.silent)
+
         try:
+            ipam = ioc_ipam.IOCIpam(self.iocroot) if pools else None
+
             if count > 1 and not skip_batch:
                 for j in range(1, count + 1):
-                    self.create(release, props, j, pkglist=pkglist,
+                    self.create(release,
+                                self.__ipam_props__(props, ipam, pools), j,
+                                pkglist=pkglist,
                                 template=template, short=short, uuid=uuid,
                                 basejail=basejail, empty=empty, clone=clone,
                                 skip_batch=True)
             else:
+                props = self.__ipam_props__(props, ipam, pools)
                 ioc_create.IOCCreate(release, props, count, pkglist,
                                      template=template, short=short, uuid=uuid,
                                      basejail=basejail, empty=empty,
@@ -494,6 +721,19 @@ class IOCage(object):
 
         return False, None
 
+    @staticmethod
+    def __ipam_props__(props, ipam, pools):
+        """Adds an address from each pool to props, skipping the routers."""
+        if ipam is None:
+            return props
+
+        routers = [p.partition("=")[2] for p in props
+                   if p.startswith(("defaultrouter=", "defaultrouter6="))]
+
+        return tuple(props) + tuple(
+            f"{key}={ipam.ipam_allocate(pool, routers)}"
+            for key, pool in pools)
+
     @staticmethod
     def destroy(path, parse=False):
         """Destroys the supplied path"""
@@ -504,12 +744,17 @@ class IOCage(object):
         else:
             ioc_destroy.IOCDestroy().destroy_jail(path)
 
-    def df(self, long=False):
-        """Returns a list containing the resource usage of all jails"""
-        jails, paths = self.list("uuid")
+    def df(self, long=False, filters=None):
+        """
+        Returns a list containing the resource usage of all jails, or of
+        those matching filters.
+        """
+        jails, paths = self.jails, self._paths
+        entries = ioc_inventory.IOCInventory(self.iocroot).inventory_load()
+        datasets = ioc_zfs.prefetch_datasets(self.pool)
         jail_list = []
 
-        for jail in jails:
+        for jail in self.__filter_jails__(filters):
             full_uuid = jails[jail]
 
             if not long:
@@ -518,23 +763,22 @@ class IOCage(object):
                 uuid = full_uuid
 
             path = paths[jail]
-            conf = ioc_json.IOCJson(path).json_load()
+            entry = entries[path]
             mountpoint = f"{self.pool}/iocage/jails/{full_uuid}"
 
-            tag = conf["tag"]
-            template = conf["type"]
+            tag = entry["tag"]
+            template = entry["type"]
 
             if template == "template":
                 mountpoint = f"{self.pool}/iocage/templates/{tag}"
 
-            ds = self.zfs.get_dataset(mountpoint)
-            zconf = ds.properties
+            zconf = datasets[mountpoint]
 
-            compressratio = zconf["compressratio"].value
-            reservation = zconf["reservation"].value
-            quota = zconf["quota"].value
-            used = zconf["used"].value
-            available = zconf["available"].value
+            compressratio = zconf["compressratio"]
+            reservation = zconf["reservation"]
+            quota = zconf["quota"]
+            used = zconf["used"]
+            available = zconf["available"]
 
             jail_list.append([uuid, compressratio, reservation, quota, used,
                               available, tag])
@@ -599,7 +843,7 @@ class IOCage(object):
         count = kwargs.pop("count", 1)
         accept = kwargs.pop("accept", False)
 
-        freebsd_version = ioc_common.checkoutput(["freebsd-version"])
+        freebsd_version = ioc_host.get_host_fact("freebsd_version")
         arch = os.uname()[4]
 
         if not kwargs["files"]:
@@ -669,8 +913,9 @@ class IOCage(object):
         ioc_fstab.IOCFstab(uuid, tag, action, source, destination, fstype,
                            options, dump, _pass, index=index)
 
-    def get(self, prop, recursive=False, plugin=False, pool=False):
-        """Get a jail property"""
+    def get(self, prop, recursive=False, plugin=False, pool=False,
+            filters=None):
+        """Get a jail property, recursively for the jails matching filters"""
         if not recursive:
             tag, uuid, path = self.__check_jail_existence__()
             status, jid = self.list("jid", uuid=uuid)
@@ -720,8 +965,15 @@ class IOCage(object):
                         silent=self.silent)
         else:
             jail_list = []
+            selected = self.__filter_jails__(filters)
+
+            if prop != "state":
+                # Read them all up front, json_get_value() below is served
+                # from the cache.
+                ioc_list.IOCList(silent=True).list_load_configs(
+                    self._paths[j] for j in selected)
 
-            for j in self.jails:
+            for j in selected:
                 uuid = self.jails[j]
                 path = self._paths[j]
                 try:
@@ -759,13 +1011,23 @@ class IOCage(object):
 
     @staticmethod
     def list(lst_type, header=False, long=False, sort="tag", uuid=None,
-             plugin=False):
-        """Returns a list of lst_type"""
+             plugin=False, stream=False, filters=None):
+        """
+        Returns a list of lst_type, or with stream a generator yielding the
+        rows of the jails or templates as they are inspected. Jails and
+        templates can be narrowed down with filters, see
+        ioc_list.filter_entries().
+        """
         if lst_type == "jid":
             return ioc_list.IOCList().list_get_jid(uuid)
 
-        return ioc_list.IOCList(lst_type, header, long, sort,
-                                plugin=plugin).list_datasets()
+        if stream:
+            return ioc_list.IOCList(lst_type, header, long, sort,
+                                    plugin=plugin,
+                                    filters=filters).list_stream()
+
+        return ioc_list.IOCList(lst_type, header, long, sort, plugin=plugin,
+                                filters=filters).list_datasets()
 
     def restart(self, soft=False):
         if self._all:
@@ -881,8 +1143,10 @@ class IOCage(object):
                         self.jail = depend
                         self.start()
 
-                ioc_start.IOCStart(uuid, tag, path, conf,
-                                   callback=self.callback, silent=self.silent)
+                with _start_lock(uuid):
+                    ioc_start.IOCStart(uuid, tag, path, conf,
+                                       callback=self.callback,
+                                       silent=self.silent)
 
                 return False, None
             else:
@@ -34,6 +34,7 @@ import click
 from click import core
 
 import iocage.lib.ioc_check as ioc_check
+import iocage.lib.ioc_daemon as ioc_daemon
 
 core._verify_python3_env = lambda: None
 user_locale = os.environ.get("LANG", "en_US.UTF-8")
@@ -107,6 +108,11 @@ def cli():
     try:
         if "iocage" in sys.argv[0] and len(sys.argv) == 1:
             skip_check = True
+        elif sys.argv[1] in ioc_daemon.CLI_COMMANDS and \
+                os.path.exists(ioc_daemon.SOCKET):
+            # iocaged checked at startup, ioc_daemon.daemon_call() checks
+            # if it turns out to be unreachable.
+            skip_check = True
 
         for arg in sys.argv[1:]:
             if arg in skip_check_cmds:
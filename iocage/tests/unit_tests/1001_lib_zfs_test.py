@@ -0,0 +1,130 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import threading
+
+import mock
+import iocage.lib.ioc_zfs as ioc_zfs
+
+JAILS = 200
+
+
+class FakeZFS(object):
+    created = 0
+
+    def __init__(self, history=True, history_prefix=None):
+        FakeZFS.created += 1
+        self.history = history
+
+
+def setup_function(function):
+    FakeZFS.created = 0
+    ioc_zfs.reset()
+
+
+@mock.patch.object(ioc_zfs.libzfs, 'ZFS', FakeZFS)
+def test_should_create_one_handle_per_history_setting():
+    handles = [ioc_zfs.get_zfs() for _ in range(JAILS)]
+    handles += [ioc_zfs.get_zfs(history=False) for _ in range(JAILS)]
+
+    assert FakeZFS.created == 2
+    assert handles[0].history is True
+    assert handles[-1].history is False
+
+
+@mock.patch.object(ioc_zfs.libzfs, 'ZFS', FakeZFS)
+def test_should_use_history_setting_of_context():
+    with ioc_zfs.zfs_history(False):
+        assert ioc_zfs.get_zfs().history is False
+
+    assert ioc_zfs.get_zfs().history is True
+
+
+@mock.patch.object(ioc_zfs.libzfs, 'ZFS', FakeZFS)
+def test_should_keep_handles_and_history_per_thread():
+    seen = {}
+
+    def worker():
+        seen["handle"] = ioc_zfs.get_zfs()
+        seen["history"] = ioc_zfs.get_zfs().history
+
+    with ioc_zfs.zfs_history(False) as handle:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    assert seen["handle"] is not handle
+    assert seen["history"] is True
+    assert FakeZFS.created == 2
+
+
+@mock.patch.object(ioc_zfs.libzfs, 'ZFS', FakeZFS)
+def test_lookups_should_reuse_the_handle_instead_of_opening_one():
+    handles = {id(ioc_zfs.get_zfs()) for _ in range(JAILS)}
+
+    assert len(handles) == 1
+    assert FakeZFS.created == 1
+
+
+def test_should_snapshot_through_libzfs_without_forking():
+    zfs = mock.Mock()
+
+    with mock.patch.object(ioc_zfs, 'get_zfs', return_value=zfs), \
+            mock.patch.object(ioc_zfs.iocage.lib.ioc_common,
+                              'checkoutput') as checkoutput:
+        ioc_zfs.zfs_snapshot("tank/iocage/jails/foo@bar", recursive=True)
+
+    zfs.get_dataset.assert_called_once_with("tank/iocage/jails/foo")
+    zfs.get_dataset().snapshot.assert_called_once_with(
+        "tank/iocage/jails/foo@bar", recursive=True)
+    checkoutput.assert_not_called()
+
+
+def test_should_fall_back_to_cli_when_libzfs_cannot():
+    zfs = mock.Mock()
+    zfs.get_dataset.side_effect = AttributeError
+
+    with mock.patch.object(ioc_zfs, 'get_zfs', return_value=zfs), \
+            mock.patch.object(ioc_zfs.iocage.lib.ioc_common, 'checkoutput',
+                              return_value="a\na/c\na/b\n") as checkoutput:
+        children = ioc_zfs.zfs_children("a")
+
+    assert children == ["a/c", "a/b", "a"]
+    assert checkoutput.call_count == 1
+
+
+def test_should_retry_only_the_mount_when_libzfs_cannot_mount():
+    zfs = mock.Mock()
+    zfs.get_dataset.return_value.mount.side_effect = \
+        ioc_zfs.libzfs.ZFSException
+
+    with mock.patch.object(ioc_zfs, 'get_zfs', return_value=zfs), \
+            mock.patch.object(ioc_zfs.iocage.lib.ioc_common,
+                              'checkoutput') as checkoutput:
+        ioc_zfs.zfs_clone("tank/iocage/releases/11.1-RELEASE/root@foo",
+                          "tank/iocage/jails/foo/root")
+
+    zfs.get_snapshot().clone.assert_called_once_with(
+        "tank/iocage/jails/foo/root", {})
+    checkoutput.assert_called_once_with(
+        ["zfs", "mount", "tank/iocage/jails/foo/root"], stderr=mock.ANY)
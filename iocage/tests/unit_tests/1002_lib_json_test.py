@@ -0,0 +1,101 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import mock
+import pytest
+
+import iocage.lib.ioc_json as ioc_json
+
+
+def test_should_accept_valid_props():
+    errors = ioc_json.IOCJson(cli=True).json_check_props({
+        "boot"      : "on",
+        "priority"  : "10",
+        "ip4_addr"  : "em0|192.168.1.10/24,192.168.1.11",
+        "ip6_addr"  : "none",
+        "memoryuse" : "8g:log",
+        "pcpu"      : "off",
+        "interfaces": "vnet0:bridge0, vnet1:bridge1",
+        "quota"     : "10G"
+    }, {})
+
+    assert errors == []
+
+
+def test_should_return_every_error_at_once():
+    errors = ioc_json.IOCJson(cli=True).json_check_props({
+        "boot"     : "yes",
+        "priority" : "100",
+        "ip4_addr" : "192.168.1.10",
+        "memoryuse": "8g",
+        "foo"      : "bar"
+    }, {})
+
+    assert len(errors) == 5
+    assert errors[-1] == "foo cannot be changed by the user."
+
+
+def test_should_allow_unknown_props_already_in_config():
+    errors = ioc_json.IOCJson().json_check_props({"foo": "bar"},
+                                                 {"foo": "baz"})
+
+    assert errors == []
+
+
+@pytest.mark.parametrize("active, loaded", [
+    ("yes", {"pool": "tank", "iocroot": "/"}),
+    ("no", {}),
+    (RuntimeError("cannot open 'tank': dataset does not exist"), {})
+])
+def test_should_trust_the_cached_pool_only_while_active(active, loaded):
+    cached = {"pool": "tank", "iocroot": "/"}
+    side_effect = active if isinstance(active, Exception) else None
+
+    with mock.patch.object(ioc_json.iocage.lib.ioc_common, 'runtime_load',
+                           return_value=cached):
+        with mock.patch.object(ioc_json.iocage.lib.ioc_zfs, 'zfs_get',
+                               return_value=active,
+                               side_effect=side_effect) as zfs_get:
+            assert ioc_json._pool_and_iocroot_load() == loaded
+
+    zfs_get.assert_called_once_with("tank", "org.freebsd.ioc:active")
+
+
+@pytest.mark.parametrize("vnet, applied", [
+    ("off", ["ip4.addr=10.0.0.2", "ip6.addr=fd00::2"]),
+    ("on", [])
+])
+def test_should_apply_addresses_live_only_without_vnet(vnet, applied):
+    values = {"ip4_addr": "10.0.0.2", "ip6_addr": "fd00::2"}
+
+    with mock.patch.object(ioc_json.iocage.lib.ioc_host, 'get_host_fact',
+                           return_value=["ip4.addr", "ip6.addr"]):
+        with mock.patch.object(ioc_json.iocage.lib.ioc_common,
+                               'checkoutput') as checkoutput:
+            ioc_json.IOCJson().__json_apply_live__(values, {"vnet": vnet}, 3)
+
+    if applied:
+        checkoutput.assert_called_once_with(
+            ["jail", "-m", "jid=3"] + applied, stderr=ioc_json.su.STDOUT)
+    else:
+        assert not checkoutput.called
@@ -0,0 +1,226 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import json
+import threading
+
+import mock
+import pytest
+import iocage.lib.ioc_json as ioc_json
+import iocage.lib.ioc_list as ioc_list
+import iocage.lib.iocage as ioc
+
+JAILS = 2000
+WORKERS = 16
+
+
+def raise_exception(log):
+    if log["level"] == "EXCEPTION":
+        raise RuntimeError(log["message"])
+
+
+def fake_load(self):
+    return {"host_hostuuid": self.location.rsplit("/", 1)[-1]}
+
+
+@mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                   lambda: ("tank", "/iocage"))
+@mock.patch.object(ioc_list.iocage.lib.ioc_zfs, 'get_zfs', mock.Mock())
+def test_parallel_load_should_overlap_reads_and_keep_order():
+    paths = [f"/iocage/jails/jail{i:04d}" for i in range(JAILS)]
+    # Only passes once four reads are in flight together, a serial load
+    # would break it.
+    barrier = threading.Barrier(4, timeout=10)
+
+    def load(self):
+        if self.location in paths[:4]:
+            barrier.wait()
+
+        return fake_load(self)
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', load):
+        parallel = ioc_list.IOCList(workers=WORKERS).list_load_configs(paths)
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', fake_load):
+        serial = ioc_list.IOCList(workers=1).list_load_configs(paths)
+
+    assert not barrier.broken
+    assert list(parallel) == paths
+    assert list(parallel.items()) == list(serial.items())
+
+
+@mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                   lambda: ("tank", "/iocage"))
+@mock.patch.object(ioc_list.iocage.lib.ioc_zfs, 'get_zfs', mock.Mock())
+def test_stream_should_yield_before_every_config_is_read():
+    paths = [f"/iocage/jails/jail{i:04d}" for i in range(JAILS)]
+    loaded = []
+
+    def load(self):
+        loaded.append(self.location)
+
+        return fake_load(self)
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', load):
+        configs = ioc_list.IOCList(workers=WORKERS).list_iter_configs(paths)
+        first = next(configs)
+        # Only the window of reads in flight was submitted so far.
+        read_first = len(loaded)
+        rest = [p for p, _ in configs]
+
+    assert first[0] == paths[0]
+    assert read_first <= WORKERS * 2 + 1
+    assert rest == paths[1:]
+
+
+@mock.patch.object(ioc_json.IOCJson, 'json_load', fake_load)
+@mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                   lambda: ("tank", "/iocage"))
+@mock.patch.object(ioc_list.iocage.lib.ioc_zfs, 'get_zfs', mock.Mock())
+def test_parallel_load_should_resolve_the_pool_before_the_workers():
+    threads = []
+    paths = [f"/iocage/jails/jail{i:04d}" for i in range(10)]
+
+    with mock.patch.object(ioc_json, '_configs_current',
+                           lambda: threads.append(
+                               threading.current_thread())):
+        ioc_list.IOCList(workers=4).list_load_configs(paths)
+
+    assert threads == [threading.main_thread()]
+
+
+def test_filters_should_only_read_what_the_inventory_cannot_answer():
+    entries = [{"uuid": f"{i:036d}", "tag": f"web{i}" if i % 2 else f"db{i}",
+                "path": f"/iocage/jails/{i:036d}", "release": "11.1-RELEASE",
+                "type": "jail", "boot": "off", "template": "-"}
+               for i in range(JAILS)]
+    filters = ioc_list.parse_filters(["tag=web1*", "vnet=on", "state=up"])
+    loaded = []
+
+    def load(self):
+        loaded.append(self.location)
+
+        return {"vnet": "on" if self.location.endswith("1") else "off"}
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', load), \
+            mock.patch.object(ioc_list, 'get_jail_state') as state:
+        state.return_value = {f"ioc-{e['uuid']}": {} for e in entries[:100]}
+        selected = ioc_list.filter_entries(entries, filters)
+
+    assert len(loaded) == len([e for e in entries
+                               if e["tag"].startswith("web1")])
+    assert state.call_count == 1
+    assert [e["tag"] for e in selected] == ["web1", "web11"]
+
+
+def test_filters_should_match_list_members():
+    entries = [{"tag": "a", "depends": []},
+               {"tag": "b", "depends": ["a"]},
+               {"tag": "c", "depends": ["a", "b"]},
+               {"tag": "d", "depends": ["ab"]}]
+    filters = ioc_list.parse_filters(["depends=a"])
+
+    assert [e["tag"] for e in ioc_list.filter_entries(entries, filters)] == [
+        "b", "c"]
+
+
+@mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                   lambda: ("tank", "/iocage"))
+@mock.patch.object(ioc_list.iocage.lib.ioc_zfs, 'get_zfs', mock.Mock())
+def test_base_should_reject_filters():
+    lst = ioc_list.IOCList("base", filters={"tag": "web*"},
+                           callback=raise_exception)
+
+    with pytest.raises(RuntimeError):
+        lst.list_datasets()
+
+    assert not lst.zfs.get_dataset.called
+
+
+def test_records_should_sort_by_number_and_address():
+    def record(jid, tag, ip4):
+        return ioc_list.JailRecord(jid, "0" * 36, "off", "up", tag, "jail",
+                                   "11.1-RELEASE", "11.1-RELEASE", ip4,
+                                   ip4.rpartition("|")[2], "-", "-")
+
+    records = [record(10, "b", "em0|10.0.0.10/24"),
+               record(None, "c", "-"),
+               record(9, "a_10", "em0|10.0.0.9/24"),
+               record(100, "a_9", "em0|10.0.0.100/24,em1|10.1.0.1")]
+
+    by_jid = sorted(records, key=ioc_list.JailRecord.sort_key("jid"))
+    by_ip = sorted(records, key=ioc_list.JailRecord.sort_key("ip4"))
+    by_tag = sorted(records, key=ioc_list.JailRecord.sort_key(None))
+
+    assert [r.jid for r in by_jid] == [9, 10, 100, None]
+    assert [r.jid for r in by_ip] == [9, 10, 100, None]
+    assert [r.tag for r in by_tag] == ["a_9", "a_10", "b", "c"]
+    assert list(records[0]) == ["10", "00000000", "up", "b", "11.1-RELEASE",
+                                "10.0.0.10/24"]
+    assert len(records[0]) == 6 and records[0][3] == "b"
+    assert not hasattr(records[0], "__dict__")
+
+
+def test_jail_state_should_fall_back_when_libxo_keys_differ():
+    libxo = json.dumps({"jail-information": {"jail": [
+        {"jail-id": 3, "jail-name": "ioc-foo", "path": "/iocage/jails/foo"}
+    ]}})
+    plain = "jid=3 name=ioc-foo path=/iocage/jails/foo ip4.addr=10.0.0.3" \
+        " ip6.addr=-\n"
+    ioc_list.invalidate_jail_state()
+
+    with mock.patch.object(ioc_list.iocage.lib.ioc_common, 'checkoutput',
+                           side_effect=[libxo, plain]):
+        state = ioc_list.get_jail_state()
+
+    ioc_list.invalidate_jail_state()
+
+    assert state["ioc-foo"]["jid"] == "3"
+    assert state["ioc-foo"]["ip4.addr"] == "10.0.0.3"
+
+
+def test_jail_state_should_be_taken_again_once_stale():
+    up = "jid=3 name=ioc-foo path=/iocage/jails/foo ip4.addr=- ip6.addr=-\n"
+    ioc_list.invalidate_jail_state()
+
+    with mock.patch.object(ioc_list, '_jls_libxo', side_effect=ValueError):
+        with mock.patch.object(ioc_list.iocage.lib.ioc_common, 'checkoutput',
+                               side_effect=["", up, ""]) as jls:
+            with mock.patch.object(ioc_list.time, 'monotonic',
+                                   return_value=100.0) as clock:
+                assert ioc_list.get_jail_state() == {}
+                # Within JAIL_STATE_TTL the snapshot is shared.
+                clock.return_value = 101.0
+                assert ioc_list.get_jail_state() == {}
+                clock.return_value = 103.0
+                assert "ioc-foo" in ioc_list.get_jail_state()
+
+                # Every library call starts from a new one.
+                with mock.patch.object(ioc.ioc_zfs, 'get_zfs'):
+                    ioc.IOCage(activate=True)
+
+                assert ioc_list.get_jail_state() == {}
+
+    ioc_list.invalidate_jail_state()
+
+    assert jls.call_count == 3
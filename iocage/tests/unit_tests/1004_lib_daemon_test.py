@@ -0,0 +1,162 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import threading
+
+import mock
+import pytest
+import iocage.lib.ioc_daemon as ioc_daemon
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    path = str(tmpdir.join("iocaged.sock"))
+    server = ioc_daemon.IOCDaemon(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    with mock.patch.object(ioc_daemon, 'SOCKET', path):
+        yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_should_answer_list_from_the_daemon(daemon):
+    rows = [["-", "aaaaaaaa", "down", "foo", "11.1-RELEASE", "-"]]
+
+    with mock.patch.object(ioc_daemon.iocage.lib.iocage.IOCage, 'list',
+                           return_value=rows) as _list:
+        served, result = ioc_daemon.daemon_call("list", lst_type="all",
+                                                filters={"state": "down"})
+
+    assert served is True
+    assert result == rows
+    _list.assert_called_once_with("all", False, False, "tag", plugin=False,
+                                  filters={"state": "down"})
+
+
+def test_should_raise_the_daemons_error(daemon):
+    with mock.patch.object(ioc_daemon.iocage.lib.iocage.IOCage, 'list',
+                           side_effect=RuntimeError("Invalid sort type")):
+        with mock.patch.object(ioc_daemon.iocage.lib.ioc_common,
+                               'callback') as callback:
+            ioc_daemon.daemon_call("list")
+
+    callback.assert_called_once_with({"level"  : "EXCEPTION",
+                                      "message": "Invalid sort type"})
+
+
+def test_should_fall_back_without_a_daemon(tmpdir):
+    with mock.patch.object(ioc_daemon, 'SOCKET',
+                           str(tmpdir.join("missing.sock"))):
+        assert ioc_daemon.daemon_call("ping") == (False, None)
+
+
+def _warn_then(error=None):
+    def _list(*args, **kwargs):
+        ioc_daemon.iocage.lib.ioc_common.logit({
+            "level"  : "WARNING",
+            "message": "foo has no release"
+        })
+
+        if error is not None:
+            raise error
+
+        return []
+
+    return _list
+
+
+@pytest.fixture
+def logger():
+    # Only the CLI side logs, the daemon hands everything to the reply.
+    with mock.patch.object(ioc_daemon.iocage.lib.ioc_logger,
+                           'IOCLogger') as ioc_logger:
+        yield ioc_logger.return_value.cli_log.return_value
+
+
+def test_should_show_what_the_daemon_logged(daemon, logger):
+    with mock.patch.object(ioc_daemon.iocage.lib.iocage.IOCage, 'list',
+                           side_effect=_warn_then()):
+        assert ioc_daemon.daemon_call("list") == (True, [])
+
+    logger.warning.assert_called_once_with("foo has no release")
+
+
+def test_should_exit_after_the_logs_of_a_silent_failure(daemon, logger):
+    with mock.patch.object(ioc_daemon.iocage.lib.iocage.IOCage, 'list',
+                           side_effect=_warn_then(SystemExit(1))):
+        with pytest.raises(SystemExit):
+            ioc_daemon.daemon_call("list")
+
+    logger.warning.assert_called_once_with("foo has no release")
+
+
+@pytest.fixture
+def jail():
+    IOCage = ioc_daemon.iocage.lib.iocage.IOCage
+
+    with mock.patch.object(ioc_daemon.iocage.lib.ioc_json,
+                           '_get_pool_and_iocroot',
+                           return_value=("tank", "/iocage")), \
+        mock.patch.object(ioc_daemon.iocage.lib.ioc_zfs, 'get_zfs'), \
+        mock.patch.object(IOCage, '__check_jail_existence__',
+                          return_value=("foo", "foo", "/iocage/jails/foo")), \
+        mock.patch.object(IOCage, 'list', return_value=(False, None)), \
+        mock.patch.object(ioc_daemon.iocage.lib.ioc_json.IOCJson,
+                          'json_get_value') as json_get_value:
+        yield json_get_value
+
+
+def test_should_return_what_get_logged(daemon, logger, jail):
+    def _get_value(prop):
+        ioc_daemon.iocage.lib.ioc_common.callback({
+            "level"  : "WARNING",
+            "message": "foo has no release"
+        })
+
+        return "on"
+
+    jail.side_effect = _get_value
+    reply = daemon.daemon_dispatch(1, ioc_daemon._get,
+                                   {"prop": "boot", "jail": "foo"})
+
+    assert reply["result"] == "on"
+    assert reply["logs"] == [{"level"  : "WARNING",
+                              "message": "foo has no release"}]
+    logger.warning.assert_not_called()
+
+
+def test_should_return_what_get_raised(daemon, logger, jail):
+    jail.side_effect = KeyError("foo")
+
+    # iocaged started from a terminal, the callback would exit(1) there.
+    with mock.patch.object(ioc_daemon.iocage.lib.ioc_common.os, 'isatty',
+                           return_value=True):
+        reply = daemon.daemon_dispatch(1, ioc_daemon._get,
+                                       {"prop": "foo", "jail": "foo"})
+
+    assert reply["error"]["message"] == "foo is not a valid property!"
+    logger.error.assert_not_called()
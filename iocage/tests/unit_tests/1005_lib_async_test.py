@@ -0,0 +1,86 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import asyncio
+
+import mock
+import iocage.lib.ioc_async as ioc_async
+
+JAILS = 20
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_commands_should_run_concurrently(tmpdir):
+    # Each command waits, for at most 10s, until all of them have started,
+    # run one after the other the first would give up and fail.
+    script = f"""touch {tmpdir}/$0
+for i in $(seq 200); do
+    [ $(ls {tmpdir} | wc -l) -ge {JAILS} ] && echo $0 && exit 0
+    sleep 0.05
+done
+exit 1"""
+
+    async def _exec():
+        return await asyncio.gather(*(
+            ioc_async.AsyncIOCage.__run__("sh", "-c", script, str(i))
+            for i in range(JAILS)))
+
+    results = run(_exec())
+
+    assert results == [(0, f"{i}\n") for i in range(JAILS)]
+
+
+def test_exec_should_start_a_stopped_jail_first():
+    jail = ioc_async.AsyncIOCage("foo", silent=True)
+    resolved = ("foo", "f" * 36, "/iocage/jails/foo", {"exec_fib": "0"})
+    calls = []
+
+    async def resolve():
+        return resolved
+
+    async def running(uuid):
+        return False
+
+    async def start():
+        calls.append("start")
+
+    async def _run(*command, stdin=None):
+        calls.append(command)
+
+        return 1, "not found\n"
+
+    with mock.patch.multiple(jail, __resolve__=resolve, __running__=running,
+                             start=start, __run__=_run):
+        out, err = run(jail.exec(["ls"]))
+
+    assert calls == ["start", ("setfib", "0", "jexec", "-u", "root",
+                               f"ioc-{'f' * 36}", "ls")]
+    assert (out, err) == ("not found\n", True)
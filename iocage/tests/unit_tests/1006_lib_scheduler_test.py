@@ -0,0 +1,220 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import collections
+import itertools
+import threading
+
+import mock
+
+import iocage.lib.ioc_scheduler as ioc_scheduler
+import iocage.lib.iocage as ioc
+
+
+def jail(tag, priority=99, depends=()):
+    return {"tag": tag, "uuid": f"{tag}-uuid", "priority": priority,
+            "depends": list(depends)}
+
+
+def raise_exception(log):
+    if log["level"] == "EXCEPTION":
+        raise RuntimeError(log["message"])
+
+
+def test_plan_should_keep_priorities_and_move_dependencies_up():
+    scheduler = ioc_scheduler.IOCScheduler([
+        jail("web", 10, ["db-uuid"]),
+        jail("db", 20),
+        jail("dns", 1),
+        jail("mail", 10),
+        jail("log", 30)
+    ])
+
+    assert scheduler.scheduler_plan() == [["dns"], ["db", "mail", "web"],
+                                          ["log"]]
+
+
+def test_run_should_start_everything_outside_a_cycle():
+    logs = []
+    scheduler = ioc_scheduler.IOCScheduler([
+        jail("a", depends=["b"]),
+        jail("b", depends=["c"]),
+        jail("c", depends=["a"]),
+        jail("after-a", depends=["a"]),
+        jail("d"),
+        jail("e", 10)
+    ], callback=logs.append)
+    started = []
+
+    def start(tag):
+        started.append(tag)
+
+        return False, None
+
+    results = scheduler.scheduler_run(start)
+
+    assert sorted(started) == ["d", "e"]
+    assert [log["level"] for log in logs] == ["ERROR"]
+    assert "a, b, c forms" in logs[0]["message"]
+    assert all(results[t][0] for t in ("a", "b", "c", "after-a"))
+    assert "depends on a" in results["after-a"][1]
+
+
+class Recorder(object):
+    """
+    Records when each jail starts and finishes as event numbers, and how
+    many ran at once. A gated jail holds on until jobs are running together,
+    once that happened nobody waits anymore.
+    """
+
+    def __init__(self, jobs, gated):
+        self.jobs = jobs
+        self.gated = gated
+        self.events = itertools.count()
+        self.started = {}
+        self.finished = {}
+        self.running = 0
+        self.most = 0
+        self.overlapped = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, tag, err=False, msg=None):
+        with self.lock:
+            self.started[tag] = next(self.events)
+            self.running += 1
+            self.most = max(self.most, self.running)
+
+            if self.running == self.jobs:
+                self.overlapped.set()
+
+        if tag in self.gated:
+            self.overlapped.wait(timeout=10)
+
+        with self.lock:
+            self.running -= 1
+            self.finished[tag] = next(self.events)
+
+        return err, msg
+
+
+def test_run_should_start_in_parallel_after_dependencies():
+    jails = [jail("db", 10)]
+    jails += [jail(f"web{i}", 10, ["db"]) for i in range(20)]
+    jails += [jail("proxy", 20), jail("broken", 20),
+              jail("needs-broken", 30, ["broken"])]
+    recorder = Recorder(8, {f"web{i}" for i in range(20)})
+
+    def start(tag):
+        if tag == "broken":
+            return recorder(tag, True, "broken failed to start")
+
+        return recorder(tag)
+
+    results = ioc_scheduler.IOCScheduler(jails, jobs=8).scheduler_run(start)
+    started, finished = recorder.started, recorder.finished
+
+    assert all(started[f"web{i}"] > finished["db"] for i in range(20))
+    assert min(started["proxy"], started["broken"]) > max(
+        finished[f"web{i}"] for i in range(20))
+    assert "needs-broken" not in started
+    assert results["broken"] == (True, "broken failed to start")
+    assert results["needs-broken"][0] is True
+    assert list(results)[0] == "db"
+    # The web jails ran eight at a time, never more.
+    assert recorder.most == 8
+
+
+def test_reverse_run_should_stop_dependents_first_and_overlap():
+    jails = [jail("db", 10), jail("cache", 10, ["db"])]
+    jails += [jail(f"web{i}", 20, ["cache"]) for i in range(8)]
+    jails += [jail("a", 30, ["b"]), jail("b", 30, ["a"])]
+    recorder = Recorder(8, {f"web{i}" for i in range(8)})
+
+    def stop(tag):
+        return recorder(tag, tag == "web0", "web0 is still running!")
+
+    scheduler = ioc_scheduler.IOCScheduler(jails, jobs=8,
+                                           callback=raise_exception)
+    results = scheduler.scheduler_run(stop, reverse=True)
+    started, finished = recorder.started, recorder.finished
+
+    assert started["web0"] > max(finished["a"], finished["b"])
+    assert started["cache"] > max(finished[f"web{i}"] for i in range(8))
+    assert started["db"] > finished["cache"]
+    # A failure doesn't keep the rest from stopping.
+    assert results["web0"][0] is True and results["db"][0] is False
+    assert set(scheduler.durations) == set(results)
+    assert recorder.most == 8
+
+
+def test_start_should_start_a_shared_dependency_once():
+    # a and b boot in parallel, both depend on d which isn't in the plan.
+    depends = {"a": "d", "b": "d", "d": "none"}
+    running, started = set(), []
+    asked = collections.Counter()
+    second_asks_for_d = threading.Event()
+
+    def _existence(self):
+        asked[self.jail] += 1
+
+        if self.jail == "d" and asked["d"] == 2:
+            second_asks_for_d.set()
+
+        return self.jail, self.jail, f"/iocage/jails/{self.jail}"
+
+    def _load(self):
+        tag = self.location.rsplit("/", 1)[1]
+
+        return {"type": "jail", "depends": depends[tag]}
+
+    def _start(uuid, tag, path, conf, callback=None, silent=False):
+        if uuid in running:
+            return
+
+        if uuid == "d":
+            # Let the other thread look at d while it is still down.
+            second_asks_for_d.wait(10)
+
+        running.add(uuid)
+        started.append(uuid)
+
+    with mock.patch.object(ioc.ioc_zfs, 'get_zfs'), \
+        mock.patch.object(ioc.ioc_json, '_get_pool_and_iocroot',
+                          return_value=("tank", "/iocage")), \
+        mock.patch.object(ioc.IOCage, '__check_jail_existence__',
+                          autospec=True, side_effect=_existence), \
+        mock.patch.object(ioc.ioc_json.IOCJson, 'json_load', autospec=True,
+                          side_effect=_load), \
+        mock.patch.object(ioc.ioc_start, 'IOCStart',
+                          side_effect=_start):
+        threads = [threading.Thread(target=ioc.IOCage(j).start)
+                   for j in ("a", "b")]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    assert sorted(started) == ["a", "b", "d"]
+    assert started[0] == "d"
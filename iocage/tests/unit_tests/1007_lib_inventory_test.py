@@ -0,0 +1,130 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import json
+
+import mock
+import pytest
+import iocage.lib.ioc_inventory as ioc_inventory
+import iocage.lib.ioc_json as ioc_json
+
+
+def conf(uuid, boot="off", priority="99", depends="none"):
+    return {"host_hostuuid": uuid, "tag": f"{uuid}-tag", "boot": boot,
+            "priority": priority, "depends": depends, "type": "jail",
+            "release": "11.1-RELEASE"}
+
+
+@pytest.fixture
+def iocroot(tmpdir):
+    confs = {"a": conf("a", "on", "20"), "b": conf("b"),
+             "c": conf("c", "on", "10", "a-tag")}
+
+    jails = tmpdir.mkdir("jails")
+    tmpdir.mkdir("templates")
+
+    for uuid in confs:
+        jails.mkdir(uuid)
+
+    ioc_inventory._memo.clear()
+    ioc_inventory._macs.clear()
+
+    def load(self):
+        return confs[self.location.rsplit("/", 1)[-1]]
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load', load), \
+            mock.patch.object(ioc_inventory.IOCInventory, '__template__',
+                              staticmethod(lambda *a: "-")), \
+            mock.patch.object(ioc_json, '_get_pool_and_iocroot',
+                              return_value=("tank", str(tmpdir))), \
+            mock.patch.object(ioc_inventory.iocage.lib.ioc_zfs,
+                              'prefetch_datasets', return_value={}), \
+            mock.patch.object(ioc_inventory.os, 'geteuid', return_value=0):
+        yield str(tmpdir)
+
+
+def test_bootplan_should_follow_configuration_changes(iocroot):
+    inventory = ioc_inventory.IOCInventory(iocroot)
+
+    assert [j["tag"] for j in inventory.inventory_bootplan()] == ["c-tag",
+                                                                  "a-tag"]
+    assert inventory.inventory_bootplan()[0]["depends"] == ["a-tag"]
+
+    inventory.inventory_update(f"{iocroot}/jails/b", conf("b", "on", "1"))
+
+    with open(f"{iocroot}/bootplan.json") as plan:
+        plan = json.load(plan)
+
+    assert [j["tag"] for j in plan["jails"]] == ["b-tag", "c-tag", "a-tag"]
+
+    with mock.patch.object(ioc_json.IOCJson, 'json_load') as load:
+        # Read from the file, nothing is loaded.
+        assert inventory.inventory_bootplan() == plan["jails"]
+        assert not load.called
+
+
+def test_mac_registry_should_follow_set_and_destroy(iocroot):
+    inventory = ioc_inventory.IOCInventory(iocroot)
+    macs = inventory.inventory_macs()
+    mac_a, mac_b = macs.mac_allocate("02ff60")
+
+    assert (mac_a, mac_b) == ("02ff60000000", "02ff60000001")
+
+    inventory.inventory_update(f"{iocroot}/jails/a",
+                               dict(conf("a"), vnet0_mac=f"{mac_a},{mac_b}"))
+    inventory.inventory_update(f"{iocroot}/jails/b",
+                               dict(conf("b"), vnet0_mac="02ff60000003,x"))
+
+    assert inventory.inventory_macs() is macs
+    assert macs.mac_allocate("02ff60") == ("02ff60000004", "02ff60000005")
+
+    inventory.inventory_remove(f"{iocroot}/jails/a")
+
+    assert macs.mac_allocate("02ff60") == ("02ff60000000", "02ff60000001")
+
+    # Another process starts from what the index kept.
+    ioc_inventory._macs.clear()
+
+    assert dict(inventory.inventory_macs().used["02ff60"]) == {3: 1}
+
+
+def test_mac_registry_should_keep_reservations_when_rebuilt(iocroot):
+    inventory = ioc_inventory.IOCInventory(iocroot)
+    macs = inventory.inventory_macs()
+    written = macs.mac_allocate("02ff60")
+    pending = macs.mac_allocate("02ff60")
+
+    inventory.inventory_update(f"{iocroot}/jails/a",
+                               dict(conf("a"), vnet0_mac=",".join(written)))
+    # Another process changed the index, it's reconciled and rebuilt.
+    ioc_inventory._memo.clear()
+    rebuilt = inventory.inventory_macs()
+
+    assert rebuilt is not macs
+    assert rebuilt.reserved == {("02ff60", 2), ("02ff60", 3)}
+    assert rebuilt.mac_allocate("02ff60") == ("02ff60000004", "02ff60000005")
+
+    rebuilt.mac_add(pending[0])
+    rebuilt.mac_add(pending[1])
+
+    assert dict(rebuilt.used["02ff60"]) == dict.fromkeys(range(6), 1)
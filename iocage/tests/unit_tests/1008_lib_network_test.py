@@ -0,0 +1,121 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import subprocess as su
+
+import mock
+import iocage.lib.ioc_network as ioc_network
+
+UUID = "e2b3e3b1-1a3b-4c0c-a5b4-d1a5c2b1e0f1"
+NET_CONFIGS = (("vnet0|10.0.0.5/24,vnet1|10.0.1.5/24", "10.0.0.1"),
+               ("vnet0|fd00::5/64", "fd00::1"))
+
+
+def macs(nic):
+    return f"{nic}a", f"{nic}b"
+
+
+def network():
+    return ioc_network.IOCNetwork(UUID, "web", "7", silent=True)
+
+
+@mock.patch.object(ioc_network, 'find_bridge_mtu', return_value="9000")
+def test_should_plan_every_interface_with_one_route_per_family(mock_mtu):
+    plan = network().network_plan("vnet0:bridge0,vnet1:bridge0",
+                                  NET_CONFIGS, macs)
+
+    assert [n["nic"] for n in plan["nics"]] == ["vnet0", "vnet1"]
+    assert plan["nics"][0]["addrs"] == [("inet", "10.0.0.5/24"),
+                                        ("inet6", "fd00::5/64")]
+    assert plan["nics"][1]["macs"] == ("vnet1a", "vnet1b")
+    assert plan["routes"] == [("inet", "10.0.0.1"), ("inet6", "fd00::1")]
+    mock_mtu.assert_called_once_with("bridge0")
+
+
+@mock.patch.object(ioc_network, 'find_bridge_mtu', return_value="1500")
+@mock.patch('iocage.lib.ioc_common.checkoutput')
+def test_should_plumb_with_a_fork_per_epair_and_one_per_side(
+        mock_checkoutput, mock_mtu):
+    mock_checkoutput.side_effect = ["epair3a\n", "epair4a\n", "", ""]
+
+    with ioc_network.bridge_mtu_cache():
+        network().network_start("vnet0:bridge0,vnet1:bridge0", NET_CONFIGS,
+                                macs)
+        network().network_plan("vnet0:bridge0", NET_CONFIGS, macs)
+
+    assert mock_mtu.call_count == 1
+    assert mock_checkoutput.call_count == 4
+
+    host = mock_checkoutput.call_args_list[2][0][0]
+    jail = mock_checkoutput.call_args_list[3][0][0]
+
+    assert host[:2] == ["sh", "-c"]
+    assert f"ifconfig epair3b mtu 1500 link vnet0b vnet ioc-{UUID}" \
+        in host[2]
+    assert "ifconfig epair4a name vnet1:7" in host[2]
+    assert jail[:5] == ["setfib", "0", "jexec", f"ioc-{UUID}", "sh"]
+    assert jail[6].splitlines() == [
+        "set -e",
+        "ifconfig epair3b name vnet0",
+        ioc_network._attempt("ifconfig vnet0 inet 10.0.0.5/24 up"),
+        ioc_network._attempt("ifconfig vnet0 inet6 fd00::5/64 up"),
+        "ifconfig epair4b name vnet1",
+        ioc_network._attempt("ifconfig vnet1 inet 10.0.1.5/24 up"),
+        ioc_network._attempt("route add default 10.0.0.1"),
+        ioc_network._attempt("route add -6 default fd00::1")
+    ]
+
+
+@mock.patch.object(ioc_network, 'find_bridge_mtu', return_value="1500")
+@mock.patch('iocage.lib.ioc_common.checkoutput')
+def test_should_report_each_failed_address_and_go_on(mock_checkoutput,
+                                                     mock_mtu):
+    logs = []
+    mock_checkoutput.side_effect = [
+        "epair3a\n", "epair4a\n", "",
+        "route add default 10.0.0.1: route: File exists\n"]
+
+    ioc_network.IOCNetwork(UUID, "web", "7",
+                           callback=logs.append).network_start(
+        "vnet0:bridge0,vnet1:bridge0", NET_CONFIGS, macs)
+
+    assert [log["level"] for log in logs] == ["WARNING"]
+    assert "route: File exists" in logs[0]["message"]
+
+
+@mock.patch.object(ioc_network, 'find_bridge_mtu', return_value="1500")
+@mock.patch('iocage.lib.ioc_common.checkoutput')
+def test_should_destroy_the_epairs_when_the_host_side_fails(
+        mock_checkoutput, mock_mtu):
+    failed = su.CalledProcessError(1, "sh", output=b"no such bridge")
+    mock_checkoutput.side_effect = ["epair3a\n", "epair4a\n", failed, "",
+                                    failed, ""]
+
+    network().network_start("vnet0:bridge0,vnet1:bridge0", NET_CONFIGS,
+                            macs)
+
+    destroyed = [c[0][0] for c in mock_checkoutput.call_args_list[3:]]
+
+    assert destroyed == [["ifconfig", "epair3a", "destroy"],
+                         ["ifconfig", "epair4a", "destroy"],
+                         ["ifconfig", "vnet1:7", "destroy"]]
@@ -0,0 +1,81 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import ipaddress
+
+import mock
+import pytest
+import iocage.lib.ioc_ipam as ioc_ipam
+
+ENTRIES = {
+    "/iocage/jails/a": {"uuid": "a", "ip4_addr": "vnet0|10.0.0.2/24",
+                        "ip6_addr": "vnet0|fd00::2/64"},
+    "/iocage/jails/b": {"uuid": "b", "ip4_addr": "none",
+                        "ip6_addr": "none"}
+}
+JAILS = {
+    "ioc-c": {"name": "ioc-c", "ip4.addr": "10.0.0.10,10.0.0.3",
+              "ip6.addr": "-"}
+}
+
+
+@pytest.fixture
+def ipam():
+    with mock.patch.object(ioc_ipam.iocage.lib.ioc_inventory.IOCInventory,
+                           'inventory_load', return_value=ENTRIES), \
+            mock.patch.object(ioc_ipam.iocage.lib.ioc_list,
+                              'get_jail_state', return_value=JAILS):
+        yield ioc_ipam.IOCIpam("/iocage")
+
+
+def test_should_only_conflict_on_the_same_address(ipam):
+    assert ipam.ipam_conflicts("b", "10.0.0.1", "none") == []
+    assert ipam.ipam_conflicts("b", "em0|10.0.0.10/24") == [
+        ("10.0.0.10", "c")]
+    assert ipam.ipam_conflicts("a", "vnet0|10.0.0.2/24",
+                               "vnet0|fd00::2/64") == []
+    assert ipam.ipam_conflicts("b", "vnet0|fd00:0::2") == [("fd00::2", "a")]
+
+
+def test_should_allocate_free_addresses_in_order(ipam):
+    allocated = [ipam.ipam_allocate("vnet0|10.0.0.0/29", ["10.0.0.1"])
+                 for _ in range(3)]
+
+    assert allocated == ["vnet0|10.0.0.4/29", "vnet0|10.0.0.5/29",
+                         "vnet0|10.0.0.6/29"]
+    assert ipam.ipam_conflicts("b", "10.0.0.5") == [("10.0.0.5", "-")]
+
+    with pytest.raises(RuntimeError):
+        ipam.ipam_allocate("vnet0|10.0.0.0/29")
+
+    assert ipam.ipam_allocate("vnet0|fd00::/64") == "vnet0|fd00::1/64"
+
+
+def test_should_require_an_interface_for_a_pool(ipam):
+    # ip4_addr and ip6_addr would reject the bare address.
+    with pytest.raises(RuntimeError) as err:
+        ipam.ipam_allocate("10.0.0.0/24")
+
+    assert "vnet0|10.0.0.0/24" in str(err.value)
+    assert ioc_ipam.parse_pool("em0|10.0.0.0/24") == (
+        "em0", ipaddress.ip_network("10.0.0.0/24"))
@@ -0,0 +1,57 @@
+# Copyright (c) 2014-2017, iocage
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import mock
+import pytest
+
+import iocage.lib.iocage as ioc
+
+
+@pytest.fixture
+def iocroot(tmpdir):
+    tmpdir.mkdir("jails").mkdir("0123-uuid")
+    tmpdir.mkdir("templates").mkdir("tmpl")
+    confs = {"0123-uuid": {"tag": "web", "host_hostuuid": "0123-uuid"},
+             "tmpl": {"tag": "tmpl", "host_hostuuid": "4567-uuid"}}
+
+    def load(self):
+        return confs[self.location.rsplit("/", 1)[-1]]
+
+    with mock.patch.object(ioc.ioc_zfs, 'get_zfs'), \
+        mock.patch.object(ioc.ioc_json, '_get_pool_and_iocroot',
+                          return_value=("tank", str(tmpdir))), \
+        mock.patch.object(ioc.ioc_json.IOCJson, 'json_load', load), \
+        mock.patch.object(ioc.IOCage, 'list',
+                          side_effect=AssertionError("listed every jail")):
+        yield str(tmpdir)
+
+
+@pytest.mark.parametrize("jail", ["tmpl", "tmpl (template)"])
+def test_should_resolve_a_template_by_name_without_listing(iocroot, jail):
+    assert ioc.IOCage(jail).__check_jail_existence__() == (
+        "tmpl (template)", "4567-uuid", f"{iocroot}/templates/tmpl")
+
+
+def test_should_resolve_a_jail_by_uuid_without_listing(iocroot):
+    assert ioc.IOCage("0123-uuid").__check_jail_existence__() == (
+        "web", "0123-uuid", f"{iocroot}/jails/0123-uuid")
@@ -58,7 +58,8 @@ setup(name='iocage',
       setup_requires=['pytest-runner'],
       entry_points={
           'console_scripts': [
-              'iocage = iocage.main:cli'
+              'iocage = iocage.main:cli',
+              'iocaged = iocage.lib.ioc_daemon:main'
           ]
       },
       data_files=_data,